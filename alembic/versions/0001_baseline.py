@@ -0,0 +1,85 @@
+"""Baseline schema
+
+Databases created by Base.metadata.create_all before migrations existed already have these
+tables; they are skipped, so `alembic upgrade head` works on both fresh and existing databases.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table("servers"):
+        op.create_table(
+            "servers",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("discord_guild_id", sa.BigInteger, nullable=False, unique=True),
+            sa.Column("name", sa.String(100)),
+            sa.Column("created_at", sa.DateTime),
+        )
+    if not _has_table("server_configurations"):
+        op.create_table(
+            "server_configurations",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False, unique=True),
+            sa.Column("mod_review_channel_id", sa.BigInteger, nullable=True),
+            sa.Column("moderator_role_id", sa.BigInteger, nullable=True),
+            sa.Column("similarity_threshold", sa.Float),
+            sa.Column("vote_duration_minutes", sa.Integer),
+            sa.Column("majority_required", sa.Float),
+            sa.Column("created_at", sa.DateTime),
+            sa.Column("updated_at", sa.DateTime),
+        )
+    if not _has_table("moderation_rules"):
+        op.create_table(
+            "moderation_rules",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False),
+            sa.Column("rule_text", sa.Text, nullable=False),
+            sa.Column("embedding_vector", sa.JSON, nullable=True),
+            sa.Column("active", sa.Boolean),
+            sa.Column("created_at", sa.DateTime),
+            sa.Column("updated_at", sa.DateTime),
+        )
+    if not _has_table("flagged_messages"):
+        op.create_table(
+            "flagged_messages",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("message_id", sa.BigInteger, nullable=False, index=True),
+            sa.Column("rule_id", sa.Integer, sa.ForeignKey("moderation_rules.id"), nullable=False, index=True),
+            sa.Column("approved", sa.Boolean, nullable=True),
+            sa.Column("moderator_id", sa.BigInteger, nullable=True),
+            sa.Column("similarity", sa.Float, nullable=True),
+            sa.Column("created_at", sa.DateTime),
+            sa.Column("message_excerpt", sa.Text, nullable=True),
+        )
+    if not _has_table("flagged_message_votes"):
+        op.create_table(
+            "flagged_message_votes",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("flagged_message_id", sa.Integer, sa.ForeignKey("flagged_messages.id"), nullable=False),
+            sa.Column("moderator_id", sa.BigInteger, nullable=False),
+            sa.Column("vote", sa.Boolean, nullable=False),
+            sa.Column("created_at", sa.DateTime),
+            sa.UniqueConstraint("flagged_message_id", "moderator_id", name="unique_vote_per_mod"),
+        )
+
+
+def downgrade():
+    op.drop_table("flagged_message_votes")
+    op.drop_table("flagged_messages")
+    op.drop_table("moderation_rules")
+    op.drop_table("server_configurations")
+    op.drop_table("servers")
@@ -0,0 +1,132 @@
+"""Columns and tables added for clustering, trust, re-embedding, scoping, backfill and classifier heads
+
+create_all created the new tables on existing databases but never added columns to existing
+tables, so every object is only created when it is missing.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+NEW_COLUMNS = {
+    "server_configurations": [
+        sa.Column("burst_window_ms", sa.Integer, server_default="0"),
+        sa.Column("trusted_sample_rate", sa.Float, server_default="1.0"),
+        sa.Column("embedding_model", sa.String(100), nullable=True),
+        sa.Column("classifier_enabled", sa.Boolean, server_default=sa.false()),
+        sa.Column("classifier_min_probability", sa.Float, server_default="0.2"),
+    ],
+    "moderation_rules": [
+        sa.Column("embedding_model", sa.String(100), nullable=True),
+        sa.Column("next_embedding_vector", sa.JSON, nullable=True),
+        sa.Column("next_embedding_model", sa.String(100), nullable=True),
+        sa.Column("channel_allow", sa.JSON, nullable=True),
+        sa.Column("channel_deny", sa.JSON, nullable=True),
+        sa.Column("use_context", sa.Boolean, server_default=sa.false()),
+        sa.Column("similarity_threshold", sa.Float, nullable=True),
+    ],
+    "flagged_messages": [
+        sa.Column("author_id", sa.BigInteger, nullable=True),
+        sa.Column("embedding_vector", sa.JSON, nullable=True),
+        sa.Column("embedding_model", sa.String(100), nullable=True),
+        sa.Column("next_embedding_vector", sa.JSON, nullable=True),
+        sa.Column("next_embedding_model", sa.String(100), nullable=True),
+        sa.Column("member_count", sa.Integer, nullable=False, server_default="1"),
+    ],
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for table, columns in NEW_COLUMNS.items():
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        for column in columns:
+            if column.name not in existing:
+                op.add_column(table, column)
+
+    if not inspector.has_table("flagged_message_members"):
+        op.create_table(
+            "flagged_message_members",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("flagged_message_id", sa.Integer, sa.ForeignKey("flagged_messages.id"), nullable=False,
+                      index=True),
+            sa.Column("message_id", sa.BigInteger, nullable=False),
+            sa.Column("channel_id", sa.BigInteger, nullable=True),
+            sa.Column("author_id", sa.BigInteger, nullable=True),
+            sa.Column("match_kind", sa.String(16), nullable=False),
+            sa.Column("similarity", sa.Float, nullable=True),
+            sa.Column("created_at", sa.DateTime),
+        )
+    if not inspector.has_table("author_trust"):
+        op.create_table(
+            "author_trust",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False),
+            sa.Column("author_id", sa.BigInteger, nullable=False),
+            sa.Column("flags_opened", sa.Integer, nullable=False),
+            sa.Column("approved_flags", sa.Integer, nullable=False),
+            sa.Column("rejected_flags", sa.Integer, nullable=False),
+            sa.Column("updated_at", sa.DateTime),
+            sa.UniqueConstraint("server_id", "author_id", name="unique_trust_per_author"),
+        )
+    if not inspector.has_table("reembed_checkpoints"):
+        op.create_table(
+            "reembed_checkpoints",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("target_model", sa.String(100), nullable=False),
+            sa.Column("table_name", sa.String(64), nullable=False),
+            sa.Column("last_id", sa.Integer, nullable=False),
+            sa.Column("processed", sa.Integer, nullable=False),
+            sa.Column("updated_at", sa.DateTime),
+            sa.UniqueConstraint("target_model", "table_name", name="unique_checkpoint_per_table"),
+        )
+    if not inspector.has_table("backfill_checkpoints"):
+        op.create_table(
+            "backfill_checkpoints",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False),
+            sa.Column("channel_id", sa.BigInteger, nullable=False),
+            sa.Column("since", sa.DateTime, nullable=False),
+            sa.Column("oldest_message_id", sa.BigInteger, nullable=True),
+            sa.Column("scanned", sa.Integer, nullable=False),
+            sa.Column("flagged", sa.Integer, nullable=False),
+            sa.Column("finished", sa.Boolean, nullable=False),
+            sa.Column("updated_at", sa.DateTime),
+            sa.UniqueConstraint("server_id", "channel_id", name="unique_backfill_per_channel"),
+        )
+    if not inspector.has_table("classifier_heads"):
+        op.create_table(
+            "classifier_heads",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False, index=True),
+            sa.Column("version", sa.Integer, nullable=False),
+            sa.Column("embedding_model", sa.String(100), nullable=False),
+            sa.Column("coef", sa.JSON, nullable=False),
+            sa.Column("intercept", sa.Float, nullable=False),
+            sa.Column("state", sa.LargeBinary, nullable=False),
+            sa.Column("trained_until_id", sa.Integer, nullable=False),
+            sa.Column("samples", sa.Integer, nullable=False),
+            sa.Column("holdout_size", sa.Integer, nullable=False),
+            sa.Column("holdout_loss", sa.Float, nullable=True),
+            sa.Column("promoted", sa.Boolean, nullable=False),
+            sa.Column("created_at", sa.DateTime),
+            sa.UniqueConstraint("server_id", "version", name="unique_head_version"),
+        )
+
+
+def downgrade():
+    for table in ("classifier_heads", "backfill_checkpoints", "reembed_checkpoints", "author_trust",
+                  "flagged_message_members"):
+        op.drop_table(table)
+    for table, columns in NEW_COLUMNS.items():
+        with op.batch_alter_table(table) as batch:
+            for column in reversed(columns):
+                batch.drop_column(column.name)
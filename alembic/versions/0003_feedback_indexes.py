@@ -0,0 +1,41 @@
+"""Denormalise flagged_messages.server_id and index the feedback and rule-load queries
+
+The feedback learner, backtest and classifier read one server's resolved flags; with server_id
+on flagged_messages that is a range scan on (server_id, approved, created_at) instead of a join
+through moderation_rules. Active rules are loaded per server via (server_id, active).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("flagged_messages", sa.Column("server_id", sa.Integer, nullable=True))
+    # correlated subquery rather than UPDATE ... FROM, which older SQLite versions lack
+    op.execute(
+        "UPDATE flagged_messages SET server_id = (SELECT moderation_rules.server_id FROM moderation_rules "
+        "WHERE moderation_rules.id = flagged_messages.rule_id)"
+    )
+    with op.batch_alter_table("flagged_messages") as batch:
+        batch.alter_column("server_id", existing_type=sa.Integer, nullable=False)
+        batch.create_foreign_key("fk_flagged_messages_server_id", "servers", ["server_id"], ["id"])
+
+    op.create_index("ix_flagged_messages_server_approved_created", "flagged_messages",
+                    ["server_id", "approved", "created_at"])
+    op.create_index("ix_moderation_rules_server_active", "moderation_rules", ["server_id", "active"])
+
+
+def downgrade():
+    op.drop_index("ix_moderation_rules_server_active", table_name="moderation_rules")
+    op.drop_index("ix_flagged_messages_server_approved_created", table_name="flagged_messages")
+    with op.batch_alter_table("flagged_messages") as batch:
+        batch.drop_constraint("fk_flagged_messages_server_id", type_="foreignkey")
+        batch.drop_column("server_id")
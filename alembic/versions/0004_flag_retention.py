@@ -0,0 +1,62 @@
+"""Archive tables and daily aggregates for the flag retention job
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "flagged_messages_archive",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column("server_id", sa.Integer, nullable=False, index=True),
+        sa.Column("message_id", sa.BigInteger, nullable=False),
+        sa.Column("rule_id", sa.Integer, nullable=False),
+        sa.Column("author_id", sa.BigInteger, nullable=True),
+        sa.Column("approved", sa.Boolean, nullable=True),
+        sa.Column("moderator_id", sa.BigInteger, nullable=True),
+        sa.Column("similarity", sa.Float, nullable=True),
+        sa.Column("created_at", sa.DateTime, nullable=True),
+        sa.Column("message_excerpt", sa.Text, nullable=True),
+        sa.Column("embedding_vector", sa.JSON, nullable=True),
+        sa.Column("embedding_model", sa.String(100), nullable=True),
+        sa.Column("member_count", sa.Integer, nullable=False),
+        sa.Column("archived_at", sa.DateTime),
+    )
+    op.create_table(
+        "flagged_message_votes_archive",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column("flagged_message_id", sa.Integer, nullable=False, index=True),
+        sa.Column("moderator_id", sa.BigInteger, nullable=False),
+        sa.Column("vote", sa.Boolean, nullable=False),
+        sa.Column("created_at", sa.DateTime, nullable=True),
+    )
+    op.create_table(
+        "flag_daily_aggregates",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False),
+        sa.Column("day", sa.Date, nullable=False),
+        sa.Column("flagged", sa.Integer, nullable=False),
+        sa.Column("approved", sa.Integer, nullable=False),
+        sa.Column("rejected", sa.Integer, nullable=False),
+        sa.Column("expired", sa.Integer, nullable=False),
+        sa.Column("members", sa.Integer, nullable=False),
+        sa.Column("votes", sa.Integer, nullable=False),
+        sa.Column("histogram_approved", sa.JSON, nullable=True),
+        sa.Column("histogram_rejected", sa.JSON, nullable=True),
+        sa.UniqueConstraint("server_id", "day", name="unique_aggregate_per_day"),
+    )
+
+
+def downgrade():
+    op.drop_table("flag_daily_aggregates")
+    op.drop_table("flagged_message_votes_archive")
+    op.drop_table("flagged_messages_archive")
@@ -0,0 +1,54 @@
+"""Per-rule daily rollups and threshold history for /modstats
+
+Rollups are seeded once from the flags still in flagged_messages (keyed by the day each flag
+was created); from then on the bot maintains them incrementally.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "rule_daily_stats",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False),
+        sa.Column("rule_id", sa.Integer, sa.ForeignKey("moderation_rules.id"), nullable=False),
+        sa.Column("day", sa.Date, nullable=False),
+        sa.Column("flagged", sa.Integer, nullable=False),
+        sa.Column("approved", sa.Integer, nullable=False),
+        sa.Column("rejected", sa.Integer, nullable=False),
+        sa.Column("members", sa.Integer, nullable=False),
+        sa.UniqueConstraint("server_id", "rule_id", "day", name="unique_rule_stats_per_day"),
+    )
+    op.create_table(
+        "threshold_history",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("server_id", sa.Integer, sa.ForeignKey("servers.id"), nullable=False, index=True),
+        sa.Column("rule_id", sa.Integer, sa.ForeignKey("moderation_rules.id"), nullable=True),
+        sa.Column("old_threshold", sa.Float, nullable=True),
+        sa.Column("new_threshold", sa.Float, nullable=True),
+        sa.Column("source", sa.String(32), nullable=False),
+        sa.Column("changed_at", sa.DateTime),
+    )
+    op.execute(
+        "INSERT INTO rule_daily_stats (server_id, rule_id, day, flagged, approved, rejected, members) "
+        "SELECT server_id, rule_id, date(created_at), count(*), "
+        "sum(CASE WHEN approved = TRUE THEN 1 ELSE 0 END), sum(CASE WHEN approved = FALSE THEN 1 ELSE 0 END), "
+        "sum(member_count - 1) "
+        "FROM flagged_messages WHERE created_at IS NOT NULL "
+        "GROUP BY server_id, rule_id, date(created_at)"
+    )
+
+
+def downgrade():
+    op.drop_table("threshold_history")
+    op.drop_table("rule_daily_stats")
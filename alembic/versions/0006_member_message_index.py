@@ -0,0 +1,23 @@
+"""Index flagged_message_members.message_id
+
+Every edited message is looked up among the members of pending flags before it is rescored,
+so an attached near-duplicate, cluster or burst member is not attached or flagged twice.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_flagged_message_members_message_id", "flagged_message_members", ["message_id"])
+
+
+def downgrade():
+    op.drop_index("ix_flagged_message_members_message_id", table_name="flagged_message_members")
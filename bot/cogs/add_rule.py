@@ -1,10 +1,64 @@
+import csv
+import io
+import json
+import re
+import time
+from typing import Literal
 import discord
+import numpy as np
 from discord import app_commands
 from discord.ext import commands
+from sqlalchemy import insert
 from sqlalchemy.future import select
-from ..rules.rule_model import Server, ModerationRule
+from ..rules.rule_model import Server, ModerationRule, ServerConfiguration
 from ..learning.db import async_session_maker
-from ..learning.embedding import generate_embedding
+from ..learning.embedding import active_model, generate_embedding, generate_embeddings
+from ..moderation.recent_messages import recent_messages
+from ..moderation.rule_index import rule_index
+from .sync import admin
+
+MAX_IMPORT_BYTES = 256 * 1024
+MAX_IMPORT_RULES = 500
+DEDUPE_SIMILARITY = 0.95
+PREVIEW_EXAMPLES = 5
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def parse_rules_file(filename: str, data: bytes) -> list[str]:
+    """
+    Extract rule texts from an uploaded file:
+    .json - a list of strings or of objects with a "rule_text"/"rule"/"text" key
+    .csv  - a "rule_text"/"rule" column, otherwise the first column
+    other - one rule per line; bullets and numbering are stripped
+    """
+    text = data.decode("utf-8-sig")
+    name = filename.lower()
+
+    if name.endswith(".json"):
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError("JSON file must contain a list of rules.")
+        rules = []
+        for item in items:
+            if isinstance(item, dict):
+                item = item.get("rule_text") or item.get("rule") or item.get("text")
+            if isinstance(item, str):
+                rules.append(item)
+    elif name.endswith(".csv"):
+        rows = [row for row in csv.reader(io.StringIO(text)) if row]
+        column = 0
+        if rows:
+            header = [h.strip().lower() for h in rows[0]]
+            for key in ("rule_text", "rule"):
+                if key in header:
+                    column = header.index(key)
+                    rows = rows[1:]
+                    break
+        rules = [row[column] for row in rows if len(row) > column]
+    else:
+        rules = [_LIST_MARKER.sub("", line) for line in text.splitlines()]
+
+    return [r.strip() for r in rules if r and r.strip()]
 
 
 class RuleManager(commands.Cog):
@@ -12,6 +66,49 @@ class RuleManager(commands.Cog):
         self.bot = bot
         self.db_session_maker = db_session_maker
 
+    async def guild_embedding_model(self, guild_id: int) -> str:
+        """New rules are embedded with the model the guild currently scores with."""
+        async with self.db_session_maker() as session:
+            configured = (await session.execute(
+                select(ServerConfiguration.embedding_model)
+                .join(Server, ServerConfiguration.server_id == Server.id)
+                .where(Server.discord_guild_id == guild_id)
+            )).scalar_one_or_none()
+        return active_model(configured)
+
+    async def guild_threshold(self, guild_id: int) -> float | None:
+        async with self.db_session_maker() as session:
+            return (await session.execute(
+                select(ServerConfiguration.similarity_threshold)
+                .join(Server, ServerConfiguration.server_id == Server.id)
+                .where(Server.discord_guild_id == guild_id)
+            )).scalar_one_or_none()
+
+    async def impact_preview(self, guild_id: int, rule_vector: list[float], embedding_model: str) -> str:
+        """
+        Score a rule vector against the retained window of recent message embeddings.
+        One mat-vec over the window: nothing is re-embedded and no history is fetched.
+        """
+        threshold = await self.guild_threshold(guild_id)
+        if threshold is None:
+            return "No preview: this server is not yet initialized."
+
+        started = time.perf_counter()
+        window, message_ids = recent_messages.window(guild_id, embedding_model)
+        if not len(message_ids):
+            return "No recent messages retained yet to preview against."
+        scores = window.astype(np.float32) @ np.asarray(rule_vector, dtype=np.float32)
+        hits = np.flatnonzero(scores > threshold)
+        top = hits[np.argsort(scores[hits])[::-1][:PREVIEW_EXAMPLES]]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        lines = [f"Would have flagged **{len(hits)}** of the last {len(message_ids)} scored messages "
+                 f"({len(hits) / len(message_ids):.1%}) at threshold {threshold:.2f} · {elapsed_ms:.1f} ms"]
+        for i in top:
+            recent = recent_messages.get(guild_id, message_ids[i])
+            lines.append(f"`{scores[i]:.2f}` {recent.jump_url} {recent.excerpt!r}")
+        return "\n".join(lines)
+
     @app_commands.command(name="addrule", description="Add a new moderation rule to this server.")
     @app_commands.describe(rule_text="The text description of the rule, e.g., 'No sarcasm'")
     async def add_rule(self, interaction: discord.Interaction, rule_text: str):
@@ -24,8 +121,9 @@ class RuleManager(commands.Cog):
 
         # Generate embedding vector for the rule text (async)
         embedding_vector = None
+        embedding_model = await self.guild_embedding_model(guild_id)
         try:
-            embedding_vector = await generate_embedding(rule_text)
+            embedding_vector = await generate_embedding(rule_text, model_name=embedding_model)
         except Exception as e:
             await interaction.followup.send(f"Error generating embedding: {e}", ephemeral=True)
             return
@@ -43,13 +141,185 @@ class RuleManager(commands.Cog):
                     server_id=server.id,
                     rule_text=rule_text,
                     embedding_vector=embedding_vector,
+                    embedding_model=embedding_model,
                     active=True,
                 )
                 session.add(new_rule)
 
-        await interaction.followup.send(f"Rule added successfully: `{rule_text}`",
+        rule_index.invalidate(guild_id)
+        preview = await self.impact_preview(guild_id, embedding_vector, embedding_model)
+        await interaction.followup.send(f"Rule added successfully: `{rule_text}`\n{preview}",
+                                        ephemeral=True)
+
+    @app_commands.command(name="previewrule", description="See what a rule would flag in recent messages before adding it.")
+    @app_commands.describe(rule_text="The text description of the candidate rule")
+    async def preview_rule(self, interaction: discord.Interaction, rule_text: str):
+        await interaction.response.defer(ephemeral=True)
+        guild_id = int(interaction.guild_id)
+
+        embedding_model = await self.guild_embedding_model(guild_id)
+        try:
+            rule_vector = await generate_embedding(rule_text, model_name=embedding_model)
+        except Exception as e:
+            await interaction.followup.send(f"Error generating embedding: {e}", ephemeral=True)
+            return
+        preview = await self.impact_preview(guild_id, rule_vector, embedding_model)
+        await interaction.followup.send(f"Preview for `{rule_text}`:\n{preview}", ephemeral=True)
+
+    @app_commands.command(name="importrules", description="Import many rules at once from a .txt, .csv or .json file.")
+    @app_commands.describe(file="One rule per line (.txt), a rule_text column (.csv) or a JSON list of rules")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def import_rules(self, interaction: discord.Interaction, file: discord.Attachment):
+        await interaction.response.defer(ephemeral=True)
+        guild_id = int(interaction.guild_id)
+        timings: dict[str, float] = {}
+
+        if file.size > MAX_IMPORT_BYTES:
+            await interaction.followup.send(f"File is too large (max {MAX_IMPORT_BYTES // 1024} KB).", ephemeral=True)
+            return
+
+        started = time.perf_counter()
+        try:
+            rule_texts = parse_rules_file(file.filename, await file.read())
+        except (ValueError, UnicodeDecodeError) as e:
+            await interaction.followup.send(f"Could not read {file.filename}: {e}", ephemeral=True)
+            return
+        rule_texts = list(dict.fromkeys(rule_texts))  # exact duplicates within the file
+        if not rule_texts:
+            await interaction.followup.send("No rules found in the file.", ephemeral=True)
+            return
+        if len(rule_texts) > MAX_IMPORT_RULES:
+            await interaction.followup.send(f"Too many rules (max {MAX_IMPORT_RULES} per import).", ephemeral=True)
+            return
+        timings["parse"] = time.perf_counter() - started
+
+        # One batched encode for the whole file
+        started = time.perf_counter()
+        embedding_model = await self.guild_embedding_model(guild_id)
+        try:
+            embeddings = np.asarray(await generate_embeddings(rule_texts, model_name=embedding_model),
+                                    dtype=np.float32)
+        except Exception as e:
+            await interaction.followup.send(f"Error generating embeddings: {e}", ephemeral=True)
+            return
+        timings["embed"] = time.perf_counter() - started
+
+        async with self.db_session_maker() as session:
+            async with session.begin():
+                server = (await session.execute(select(Server).filter_by(discord_guild_id=guild_id))).scalars().first()
+                if server is None:
+                    server = Server(discord_guild_id=guild_id, name=interaction.guild.name)
+                    session.add(server)
+                    await session.flush()
+                existing = (await session.execute(
+                    select(ModerationRule.embedding_vector)
+                    .where(ModerationRule.server_id == server.id, ModerationRule.active.is_(True))
+                )).scalars().all()
+
+                # Drop rules that restate an existing rule or an earlier rule of the same file
+                started = time.perf_counter()
+                existing = [e for e in existing if e]
+                if existing:
+                    existing_matrix = np.asarray(existing, dtype=np.float32)
+                    existing_matrix /= np.linalg.norm(existing_matrix, axis=1, keepdims=True)
+                    novel = (embeddings @ existing_matrix.T).max(axis=1) < DEDUPE_SIMILARITY
+                else:
+                    novel = np.ones(len(rule_texts), dtype=bool)
+                within = embeddings @ embeddings.T
+                kept: list[int] = []
+                for i in np.flatnonzero(novel):
+                    if not kept or within[i, kept].max() < DEDUPE_SIMILARITY:
+                        kept.append(int(i))
+                timings["dedupe"] = time.perf_counter() - started
+
+                # Single multi-row INSERT
+                started = time.perf_counter()
+                if kept:
+                    await session.execute(insert(ModerationRule).values([
+                        {"server_id": server.id, "rule_text": rule_texts[i],
+                         "embedding_vector": embeddings[i].tolist(), "embedding_model": embedding_model,
+                         "active": True}
+                        for i in kept
+                    ]))
+                timings["insert"] = time.perf_counter() - started
+            server_id = server.id
+
+        started = time.perf_counter()
+        rule_index.invalidate(guild_id)
+        await rule_index.get(interaction.guild, server_id, self.db_session_maker)
+        timings["refresh"] = time.perf_counter() - started
+
+        skipped = len(rule_texts) - len(kept)
+        phases = " · ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items())
+        await interaction.followup.send(
+            f"Imported {len(kept)} rule(s), skipped {skipped} duplicate(s).\n{phases}", ephemeral=True
+        )
+
+    @app_commands.command(name="scoperule", description="Limit a rule to, or exclude it from, a channel or category.")
+    @app_commands.describe(rule_id="ID of the rule (shown in review footers)",
+                           target="Channel or category",
+                           mode="allow: only apply here (plus other allowed places), deny: never apply here, "
+                                "clear: remove this target from the rule's scope")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def scope_rule(self, interaction: discord.Interaction, rule_id: int,
+                         target: discord.TextChannel | discord.CategoryChannel,
+                         mode: Literal["allow", "deny", "clear"]):
+        await interaction.response.defer(ephemeral=True)
+
+        async with self.db_session_maker() as session:
+            async with session.begin():
+                rule = (await session.execute(
+                    select(ModerationRule)
+                    .join(Server, ModerationRule.server_id == Server.id)
+                    .where(ModerationRule.id == rule_id, Server.discord_guild_id == int(interaction.guild_id))
+                )).scalars().first()
+                if rule is None:
+                    await interaction.followup.send("Rule not found on this server.", ephemeral=True)
+                    return
+
+                # JSON columns are reassigned (not mutated) so the change is picked up
+                allow = [i for i in (rule.channel_allow or []) if i != target.id]
+                deny = [i for i in (rule.channel_deny or []) if i != target.id]
+                if mode == "allow":
+                    allow.append(target.id)
+                elif mode == "deny":
+                    deny.append(target.id)
+                rule.channel_allow = allow or None
+                rule.channel_deny = deny or None
+
+        rule_index.invalidate(interaction.guild_id)
+        allowed = ", ".join(f"<#{i}>" for i in allow) or "everywhere"
+        denied = ", ".join(f"<#{i}>" for i in deny) or "nowhere"
+        await interaction.followup.send(f"Rule `{rule.rule_text}` now applies in: {allowed}; excluded in: {denied}",
                                         ephemeral=True)
 
+    @app_commands.command(name="rulecontext",
+                          description="Judge a rule on the recent conversation in the channel, not just one message.")
+    @app_commands.describe(rule_id="ID of the rule (shown in review footers)",
+                           enabled="Whether channel context counts for this rule")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def rule_context(self, interaction: discord.Interaction, rule_id: int, enabled: bool):
+        await interaction.response.defer(ephemeral=True)
+
+        async with self.db_session_maker() as session:
+            async with session.begin():
+                rule = (await session.execute(
+                    select(ModerationRule)
+                    .join(Server, ModerationRule.server_id == Server.id)
+                    .where(ModerationRule.id == rule_id, Server.discord_guild_id == int(interaction.guild_id))
+                )).scalars().first()
+                if rule is None:
+                    await interaction.followup.send("Rule not found on this server.", ephemeral=True)
+                    return
+                rule.use_context = enabled
+
+        rule_index.invalidate(interaction.guild_id)
+        state = "now" if enabled else "no longer"
+        await interaction.followup.send(f"Channel context {state} counts for `{rule.rule_text}`", ephemeral=True)
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(RuleManager(bot, async_session_maker))
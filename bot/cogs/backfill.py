@@ -0,0 +1,267 @@
+import asyncio
+import heapq
+import io
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import discord
+import numpy as np
+from discord import app_commands
+from discord.ext import commands
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+
+from ..learning.classifier import classifier_heads
+from ..learning.db import async_session_maker, read_session_maker
+from ..learning.embedding import generate_embeddings
+from ..learning.review_flow import MOD_REVIEW_CHANNEL_NAME
+from ..moderation.channel_context import ChannelContexts
+from ..moderation.rule_index import rule_index
+from ..moderation.scoring import content_hash, score_rules
+from ..rules.rule_model import Server, BackfillCheckpoint
+from .sync import admin
+
+_log = logging.getLogger(__name__)
+
+BATCH_SIZE = 256
+BATCH_PAUSE_SECONDS = 0.5  # history pages are rate limited by discord.py; this keeps us well below
+TOP_HITS = 100
+MAX_DAYS = 365
+
+
+@dataclass
+class BackfillReport:
+    started: float = field(default_factory=time.perf_counter)
+    scanned: int = 0
+    skipped: int = 0
+    embedded: int = 0
+    flagged: int = 0
+    per_rule: Counter = field(default_factory=Counter)
+    hits: list = field(default_factory=list)  # min-heap of (score, message_id, line), capped at TOP_HITS
+
+    def add_hit(self, score: float, message: discord.Message, rule_text: str):
+        self.flagged += 1
+        self.per_rule[rule_text] += 1
+        line = (f"{score:.3f}  {rule_text[:40]!r}  {message.jump_url}  "
+                f"{message.author} : {message.content[:120]!r}")
+        entry = (score, int(message.id), line)
+        if len(self.hits) < TOP_HITS:
+            heapq.heappush(self.hits, entry)
+        else:
+            heapq.heappushpop(self.hits, entry)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.scanned / max(self.elapsed, 1e-9)
+
+    def render(self, channels: list[discord.abc.GuildChannel], since: datetime) -> str:
+        lines = [
+            f"Backfill scan of {', '.join('#' + c.name for c in channels)} since {since:%Y-%m-%d %H:%M} UTC",
+            f"Scanned {self.scanned} messages ({self.skipped} skipped, {self.embedded} embedded) "
+            f"in {self.elapsed:.1f}s - {self.rate:.1f} msg/s",
+            f"Would have flagged {self.flagged} message(s)",
+            "",
+            "Per rule:",
+        ]
+        lines += [f"  {count:6d}  {rule}" for rule, count in self.per_rule.most_common()]
+        lines += ["", f"Top {len(self.hits)} matches:"]
+        lines += [line for _, _, line in sorted(self.hits, reverse=True)]
+        return "\n".join(lines)
+
+
+class Backfill(commands.Cog):
+    """Scans existing channel history against the current rules without opening reviews."""
+
+    def __init__(self, bot: commands.Bot, db_session_maker, read_session_maker):
+        self.bot = bot
+        self.db_session_maker = db_session_maker
+        self.read_session_maker = read_session_maker
+        self.running: dict[int, BackfillReport] = {}
+
+    async def _checkpoint(self, session, server_id: int, channel_id: int, since: datetime) -> BackfillCheckpoint:
+        cp = (await session.execute(
+            select(BackfillCheckpoint).filter_by(server_id=server_id, channel_id=channel_id)
+        )).scalar_one_or_none()
+        if cp is None:
+            cp = BackfillCheckpoint(server_id=server_id, channel_id=channel_id)
+            session.add(cp)
+        if cp.finished or cp.since != since:
+            # a different or completed scan: start over from the newest message
+            cp.since, cp.oldest_message_id, cp.scanned, cp.flagged, cp.finished = since, None, 0, 0, False
+        await session.commit()
+        return cp
+
+    async def score_batch(self, guild: discord.Guild, channel, server: Server, batch: list[discord.Message],
+                          report: BackfillReport):
+        """Scored by score_rules, exactly like live messages; identical texts are embedded once."""
+        guild_rules = await rule_index.get(guild, server.id, self.db_session_maker)
+        rows = guild_rules.rows_for(channel)
+        if not rows.size:
+            return
+
+        unique: dict[int, int] = {}
+        texts: list[str] = []
+        slots = []
+        for message in batch:
+            key = content_hash(message.content)
+            if key not in unique:
+                unique[key] = len(texts)
+                texts.append(message.content)
+            slots.append(unique[key])
+
+        embeddings = np.asarray(
+            await generate_embeddings(texts, model_name=guild_rules.embedding_model), dtype=np.float32
+        )
+        report.embedded += len(texts)
+        embeddings = (embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True))[slots]
+
+        contexts = None
+        if guild_rules.uses_context:
+            # History arrives newest first: replay it oldest first on message timestamps. The oldest messages
+            # of a batch miss the context of even older ones, which only arrive with the next batch
+            replay = ChannelContexts()
+            contexts = [None] * len(batch)
+            for i in reversed(range(len(batch))):
+                contexts[i] = replay.observe(channel.id, embeddings[i], now=batch[i].created_at.timestamp())
+
+        config = server.configuration
+        head = await classifier_heads.serving(server.id, config, guild_rules.embedding_model, self.db_session_maker)
+        result = score_rules(guild_rules, rows, embeddings, config.similarity_threshold, contexts, head,
+                             config.classifier_min_probability or 0.0)
+        for i in np.flatnonzero(result.flagged):
+            rule = guild_rules.rules[rows[result.best[i]]]
+            report.add_hit(float(result.similarity[i]), batch[i], rule.rule_text)
+
+    async def scan_channel(self, guild: discord.Guild, channel: discord.TextChannel, server: Server,
+                           since: datetime, report: BackfillReport):
+        async with self.db_session_maker() as session:
+            cp = await self._checkpoint(session, server.id, channel.id, since)
+            before = discord.Object(id=cp.oldest_message_id) if cp.oldest_message_id else None
+        cp_id = cp.id
+
+        batch: list[discord.Message] = []
+        position = None
+        flagged_before = report.flagged
+        scanned = 0
+
+        async def flush():
+            nonlocal scanned, flagged_before
+            if batch:
+                await self.score_batch(guild, channel, server, batch, report)
+            async with self.db_session_maker() as session:
+                cp = await session.get(BackfillCheckpoint, cp_id)
+                cp.oldest_message_id = position
+                cp.scanned += scanned
+                cp.flagged += report.flagged - flagged_before
+                await session.commit()
+            batch.clear()
+            scanned, flagged_before = 0, report.flagged
+            await asyncio.sleep(BATCH_PAUSE_SECONDS)
+
+        # Streamed newest -> oldest; only one batch is ever held in memory
+        async for message in channel.history(limit=None, before=before,
+                                             after=since.replace(tzinfo=timezone.utc), oldest_first=False):
+            position = int(message.id)
+            scanned += 1
+            report.scanned += 1
+            if message.author.bot or not message.content:
+                report.skipped += 1
+                continue
+            batch.append(message)
+            if len(batch) >= BATCH_SIZE:
+                await flush()
+
+        await flush()
+        async with self.db_session_maker() as session:
+            cp = await session.get(BackfillCheckpoint, cp_id)
+            cp.finished = True
+            await session.commit()
+
+    async def run_scan(self, guild: discord.Guild, channels: list[discord.TextChannel], since: datetime,
+                       report_channel: discord.abc.Messageable):
+        report = self.running[guild.id] = BackfillReport()
+        try:
+            async with self.read_session_maker() as session:
+                server = (await session.execute(
+                    select(Server).options(joinedload(Server.configuration))
+                    .where(Server.discord_guild_id == int(guild.id))
+                )).scalars().first()
+            if server is None or server.configuration is None:
+                await report_channel.send("Backfill aborted: this server is not yet initialized.")
+                return
+
+            for channel in channels:
+                try:
+                    await self.scan_channel(guild, channel, server, since, report)
+                except discord.Forbidden:
+                    _log.warning(f"Backfill: no history access to #{channel.name} in {guild.name}")
+
+            text = report.render(channels, since)
+            _log.info(f"Backfill for {guild.name}: {report.scanned} messages at {report.rate:.1f} msg/s, "
+                      f"{report.flagged} matches")
+            await report_channel.send(
+                f"Backfill finished: {report.scanned} messages scanned at {report.rate:.1f} msg/s, "
+                f"{report.flagged} would have been flagged.",
+                file=discord.File(io.BytesIO(text.encode()), filename="backfill-report.txt"),
+            )
+        except Exception as e:
+            # run as a background task: nothing else would retrieve the error, and the report would never come
+            _log.exception(f"Backfill for {guild.name} failed after {report.scanned} messages")
+            try:
+                await report_channel.send(
+                    f"Backfill failed after {report.scanned} messages ({type(e).__name__}). "
+                    f"Run /backfill again with the same range to resume from the last checkpoint."
+                )
+            except discord.HTTPException:
+                _log.warning(f"Backfill: could not post the failure notice in {guild.name}")
+        finally:
+            self.running.pop(guild.id, None)
+
+    @app_commands.command(name="backfill", description="Scan channel history against the current rules.")
+    @app_commands.describe(channel="Channel to scan (default: every text channel)",
+                           days="How far back to scan (resumes an interrupted scan with the same range)")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def backfill(self, interaction: discord.Interaction, channel: discord.TextChannel | None = None,
+                       days: app_commands.Range[int, 1, MAX_DAYS] = 30):
+        guild = interaction.guild
+        if guild.id in self.running:
+            await interaction.response.send_message("A backfill scan is already running here.", ephemeral=True)
+            return
+
+        channels = [channel] if channel else list(guild.text_channels)
+        # Whole days keep `since` stable across invocations, so an interrupted scan resumes
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        since = today - timedelta(days=days)
+        report_channel = discord.utils.get(guild.text_channels, name=MOD_REVIEW_CHANNEL_NAME) or interaction.channel
+
+        self.bot.loop.create_task(self.run_scan(guild, channels, since, report_channel))
+        await interaction.response.send_message(
+            f"Backfill started for {len(channels)} channel(s). A single report will be posted in "
+            f"{report_channel.mention} when it finishes; progress via /backfillstatus.",
+            ephemeral=True,
+        )
+
+    @app_commands.command(name="backfillstatus", description="Progress of the running backfill scan.")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def backfill_status(self, interaction: discord.Interaction):
+        report = self.running.get(interaction.guild.id)
+        if report is None:
+            await interaction.response.send_message("No backfill scan is running.", ephemeral=True)
+            return
+        await interaction.response.send_message(
+            f"{report.scanned} messages scanned in {report.elapsed:.0f}s ({report.rate:.1f} msg/s), "
+            f"{report.flagged} matches so far.",
+            ephemeral=True,
+        )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Backfill(bot, async_session_maker, read_session_maker))
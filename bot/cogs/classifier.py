@@ -0,0 +1,92 @@
+import asyncio
+import discord
+from discord import app_commands
+from discord.ext import commands
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+
+from ..learning.classifier import classifier_heads, run_training_job, shutdown_training
+from ..learning.db import async_session_maker
+from ..rules.rule_model import ClassifierHead, Server
+from .sync import admin
+
+HISTORY_SHOWN = 5
+
+
+class Classifier(commands.Cog):
+    """Per-guild classifier head trained from moderator decisions, used to drop likely false flags."""
+
+    def __init__(self, bot: commands.Bot, db_session_maker):
+        self.bot = bot
+        self.db_session_maker = db_session_maker
+        self.job: asyncio.Task | None = None
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self.job is None or self.job.done():
+            self.job = self.bot.loop.create_task(run_training_job(self.db_session_maker))
+
+    async def cog_unload(self):
+        if self.job is not None:
+            self.job.cancel()
+        shutdown_training()
+
+    @app_commands.command(name="classifier",
+                          description="Let a classifier trained on past reviews drop flags moderators would reject.")
+    @app_commands.describe(enabled="Train and apply the classifier for this server",
+                           min_probability="Flags rated below this approval probability are dropped (0.0 - 1.0)")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def classifier(self, interaction: discord.Interaction, enabled: bool, min_probability: float | None = None):
+        if min_probability is not None and not 0.0 <= min_probability <= 1.0:
+            await interaction.response.send_message("Probability must be between 0.0 and 1.0.", ephemeral=True)
+            return
+
+        async with self.db_session_maker() as session:
+            server = (await session.execute(
+                select(Server).options(joinedload(Server.configuration))
+                .filter_by(discord_guild_id=int(interaction.guild_id))
+            )).scalars().first()
+            if not server or not server.configuration:
+                await interaction.response.send_message("This server is not yet initialized.", ephemeral=True)
+                return
+            server.configuration.classifier_enabled = enabled
+            if min_probability is not None:
+                server.configuration.classifier_min_probability = min_probability
+            await session.commit()
+            cutoff = server.configuration.classifier_min_probability
+
+        state = f"enabled (drops flags below {cutoff:.0%})" if enabled else "disabled"
+        await interaction.response.send_message(f"Classifier {state} ✅", ephemeral=True)
+
+    @app_commands.command(name="classifierstatus", description="Show the versions of this server's classifier.")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def classifier_status(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        async with self.db_session_maker() as session:
+            server = (await session.execute(
+                select(Server).filter_by(discord_guild_id=int(interaction.guild_id))
+            )).scalars().first()
+            if not server:
+                await interaction.followup.send("This server is not yet initialized.", ephemeral=True)
+                return
+            versions = (await session.execute(
+                select(ClassifierHead.version, ClassifierHead.samples, ClassifierHead.holdout_size,
+                       ClassifierHead.holdout_loss, ClassifierHead.promoted, ClassifierHead.created_at)
+                .where(ClassifierHead.server_id == server.id)
+                .order_by(ClassifierHead.version.desc())
+                .limit(HISTORY_SHOWN)
+            )).all()
+
+        head = await classifier_heads.get(server.id, self.db_session_maker)
+        lines = [f"**Serving**: v{head.version}" if head else "**Serving**: none yet"]
+        for v in versions:
+            status = "promoted" if v.promoted else "rejected by holdout"
+            lines.append(f"v{v.version} · {v.samples} samples · holdout {v.holdout_size}, "
+                         f"loss {v.holdout_loss:.4f} · {status} · {v.created_at:%Y-%m-%d %H:%M}")
+        await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Classifier(bot, async_session_maker))
@@ -0,0 +1,32 @@
+import logging
+from discord.ext import commands
+
+from ..learning.db import async_session_maker
+from ..loop_watchdog import LOOP_LAG_THRESHOLD, LOOP_WATCHDOG_INTERVAL, loop_watchdog
+
+_log = logging.getLogger(__name__)
+
+
+class LoopWatchdog(commands.Cog):
+    """Runs the event-loop lag watchdog for as long as the cog is loaded."""
+
+    def __init__(self, bot: commands.Bot, db_session_maker):
+        self.bot = bot
+        self.db_session_maker = db_session_maker
+
+    async def cog_load(self):
+        if not LOOP_WATCHDOG_INTERVAL:
+            return
+        loop_watchdog.start()
+        _log.info(f"Loop watchdog: checking every {LOOP_WATCHDOG_INTERVAL * 1000:.0f} ms, "
+                  f"reporting stalls over {LOOP_LAG_THRESHOLD * 1000:.0f} ms")
+
+    async def cog_unload(self):
+        await loop_watchdog.stop()
+        for site, stats in loop_watchdog.report():
+            _log.info(f"Loop stalls at {site}: {stats.stalls}, {stats.seconds:.2f}s in total, "
+                      f"longest {stats.max_seconds * 1000:.0f} ms")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(LoopWatchdog(bot, async_session_maker))
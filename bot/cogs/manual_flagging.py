@@ -2,13 +2,16 @@ import logging
 import discord
 from discord.ext import commands
 from sqlalchemy.future import select
-import torch
-import torch.nn.functional as F
 
 from ..learning.db import async_session_maker
-from ..rules.rule_model import Server, ModerationRule
+from ..learning.query_stats import tracked
+from .. import metrics
+from ..rules.rule_model import Server
 from ..learning.embedding import generate_embedding
 from ..learning.review_flow import post_review_message
+from ..moderation.recent_messages import recent_messages
+from ..moderation.rule_index import rule_index
+from ..moderation.scoring import normalize_embedding
 
 _log = logging.getLogger(__name__)
 MOD_REVIEW_CHANNEL_NAME = "mod-review"
@@ -28,6 +31,7 @@ class Message_flagging(commands.Cog):
         ]
 
     @commands.Cog.listener()
+    @tracked("reaction_flag")
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         # Only handle the flag emoji
         if str(payload.emoji) != FLAG_EMOJI:
@@ -36,6 +40,7 @@ class Message_flagging(commands.Cog):
         guild = self.bot.get_guild(payload.guild_id)
         if not guild:
             return
+        metrics.set_guild(guild)
 
         member = guild.get_member(payload.user_id)
         if not member or member.bot:
@@ -50,10 +55,15 @@ class Message_flagging(commands.Cog):
         if not channel:
             return
 
-        try:
-            message = await channel.fetch_message(payload.message_id)
-        except discord.NotFound:
-            return
+        # Recently scored messages keep their embedding and scores in the ring buffer: no re-embedding.
+        # The message itself comes from discord.py's bounded message cache, else the API.
+        recent = recent_messages.get(guild.id, payload.message_id)
+        message = discord.utils.get(self.bot.cached_messages, id=payload.message_id)
+        if message is None:
+            try:
+                message = await channel.fetch_message(payload.message_id)
+            except discord.NotFound:
+                return
 
         # Remove the reaction to prevent repeated triggers
         try:
@@ -71,14 +81,8 @@ class Message_flagging(commands.Cog):
             if not server:
                 return
 
-            rules = (await session.execute(
-                select(ModerationRule)
-                .where(
-                    ModerationRule.server_id == server.id,
-                    ModerationRule.active.is_(True)  # explicit SQL boolean
-                )
-                .order_by(ModerationRule.id.asc())
-            )).scalars().all()
+        guild_rules = await rule_index.get(guild, server.id, self.db_session_maker)
+        rules = guild_rules.rules
 
         if not rules:
             try:
@@ -87,20 +91,31 @@ class Message_flagging(commands.Cog):
                 pass
             return
 
-        # Auto-pick the first rule
+        # Pre-select the best-scoring rule; fall back to the first one if scoring is unavailable
         picked_rule = rules[0]
-
-        # Optional: compute similarity vs picked rule; if it fails, continue
         similarity = None
-        try:
-            emb = await generate_embedding(message.content)
-            msg_vec = torch.tensor(emb)
-            msg_vec = msg_vec / msg_vec.norm()
-            rule_vec = torch.tensor(picked_rule.embedding_vector)
-            rule_vec = rule_vec / rule_vec.norm()
-            similarity = F.cosine_similarity(msg_vec, rule_vec, dim=0).item()
-        except Exception as e:
-            _log.warning(f"[manualflagging] Similarity computation failed: {e}")
+        emb = None
+        rule_scores = None
+        best = recent.best_rule() if recent is not None else None
+        rules_by_id = {r.id: r for r in rules}
+        if best is not None and best[0] in rules_by_id:
+            picked_rule = rules_by_id[best[0]]
+            similarity = best[1]
+            emb = recent.embedding.tolist()
+            rule_scores = dict(zip(recent.rule_ids, recent.scores.tolist()))
+        else:
+            try:
+                if recent is not None:
+                    emb = recent.embedding.tolist()
+                else:
+                    emb = await generate_embedding(message.content, model_name=guild_rules.embedding_model)
+                scores = guild_rules.matrix @ normalize_embedding(emb)
+                idx = int(scores.argmax())
+                picked_rule = rules[idx]
+                similarity = float(scores[idx])
+                rule_scores = dict(zip(guild_rules.rule_ids, scores.tolist()))
+            except Exception as e:
+                _log.warning(f"[manualflagging] Similarity computation failed: {e}")
 
         # Reuse shared review flow (creates DB record, sends embed+view with dropdown)
         await post_review_message(
@@ -112,6 +127,9 @@ class Message_flagging(commands.Cog):
             moderator_id=int(member.id),   # who flagged it
             similarity=similarity,
             db_session_maker=self.db_session_maker,
+            embedding=emb,
+            embedding_model=guild_rules.embedding_model,
+            rule_scores=rule_scores,
         )
 
 
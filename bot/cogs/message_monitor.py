@@ -5,17 +5,32 @@ from ..rules.rule_model import Server, ModerationRule, FlaggedMessage, FlaggedMe
 from ..learning.db import async_session_maker
 from ..learning.embedding import generate_embedding
 from ..learning.feedback import record_vote_in_flagged_message, update_server_threshold_from_feedback, record_system_feedback
-from ..learning.review_flow import post_review_message
+from ..learning.review_flow import post_review_message, attach_member, pending_flag_of, update_pending_flag
+from ..learning.clustering import flag_clusters
+from ..learning.classifier import classifier_heads
+from ..learning.query_stats import tracked
+from .. import metrics
+from ..logs import LogSampler
+from ..moderation.near_duplicate import NearDuplicateIndex, Verdict, WindowEntry, simhash
+from ..moderation.burst import BurstAggregator, burst_key
+from ..moderation.recent_messages import recent_messages
+from ..moderation.channel_context import channel_contexts
+from ..moderation.rule_index import rule_index
+from ..moderation.trust import author_trust
+from ..moderation.scoring import content_hash, normalize_embedding, score_rules
 from discord.ui import Select
 from sqlalchemy.orm import joinedload
+import asyncio
 import logging
-import torch
-import torch.nn.functional as F
+import time
+import numpy as np
 
 _log = logging.getLogger(__name__)
+_sampler = LogSampler()  # per-message lines, keyed by guild
 
 MOD_REVIEW_CHANNEL_NAME = "mod-review"
 EXTEND_TIMEOUT_SECONDS = 3600
+EDIT_DEBOUNCE_SECONDS = 2.0
 
 
 def confidence_to_color(confidence: float, threshold: float) -> discord.Color:
@@ -58,76 +73,265 @@ class MessageMonitor(commands.Cog):
     def __init__(self, bot: commands.Bot, db_session_maker):
         self.bot = bot
         self.db_session_maker = db_session_maker
+        self.near_duplicates = NearDuplicateIndex()
+        self._pending_edits: dict[int, discord.Message] = {}
+        self.bursts = BurstAggregator(self.score_burst)
+        # near-duplicate entries of buffered burst fragments, resolved with the burst's verdict when it flushes
+        self._burst_entries: dict[int, WindowEntry] = {}
 
     @commands.Cog.listener()
+    @tracked("on_message")
     async def on_message(self, message: discord.Message):
         if message.author.bot or not message.guild:
             return
-        guild_id = int(message.guild.id)
+        await self.process_message(message)
 
-        async with self.db_session_maker() as session:
-            result = await session.execute(
-                select(Server).options(joinedload(Server.configuration)).filter_by(discord_guild_id=guild_id)
-            )
-            server = result.scalars().first()
-            if server is None:
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        message = payload.message
+        if message.author.bot or not message.guild or "content" not in payload.data:
+            return
+        # Link previews and pins also arrive as edits with the text untouched
+        if payload.cached_message is not None and payload.cached_message.content == message.content:
+            return
+        if self.is_unchanged(message):
+            return
+
+        # Debounce: bursts of edits collapse into one rescore of the latest content
+        pending = message.id in self._pending_edits
+        self._pending_edits[message.id] = message
+        if not pending:
+            self.bot.loop.create_task(self._rescore_edit(message.id))
+
+    def is_unchanged(self, message: discord.Message) -> bool:
+        recent = recent_messages.get(message.guild.id, message.id)
+        return recent is not None and recent.content_hash == content_hash(message.content)
+
+    @tracked("message_edit")
+    async def _rescore_edit(self, message_id: int):
+        await asyncio.sleep(EDIT_DEBOUNCE_SECONDS)
+        message = self._pending_edits.pop(message_id, None)
+        if message is None or self.is_unchanged(message):
+            return
+        await self.process_message(message, edited=True)
+
+    async def process_message(self, message: discord.Message, edited: bool = False):
+        guild_id = int(message.guild.id)
+        tier = metrics.set_guild(message.guild)
+
+        covering = None
+        if edited:
+            covering = await pending_flag_of(int(message.id), self.db_session_maker)
+            if covering is not None and covering[1]:
+                # An attached member is decided by its flag's vote: rescoring would attach it twice or open a second review
+                if _sampler.allow(guild_id):
+                    _log.info(f"Edited message {message.id} is attached to pending flag {covering[0]}, not rescoring")
                 return
 
-            result = await session.execute(
-                select(ModerationRule).filter_by(server_id=server.id, active=True)
-            )
-            rules = result.scalars().all()
-            if not rules:
+        # Raids repeat the same text with small variations: reuse the verdict of a recent near-duplicate
+        entry = None
+        signature = simhash(message.content)
+        if signature is not None and covering is None:
+            original = self.near_duplicates.find(guild_id, signature)
+            if original is not None and original.message_id == int(message.id):
+                # An edit that barely moved the fingerprint keeps its verdict
                 return
+            if original is not None:
+                verdict = await self.near_duplicates.wait_verdict(original)
+                if verdict is not None:
+                    # joining the original's review counts as flagged; only a "not flagged" verdict is a skip
+                    if verdict.flagged_message_id is not None:
+                        metrics.MESSAGES_FLAGGED.labels(tier).inc()
+                    else:
+                        metrics.skipped("near_duplicate")
+                    await self.handle_near_duplicate(message, verdict)
+                    return
+            else:
+                entry = self.near_duplicates.add(guild_id, int(message.id), signature)
 
-        threshold = server.configuration.similarity_threshold
-        print(f"Threshold for guild {guild_id}: {threshold}")
+        verdict = None
         try:
-            msg_embedding = await generate_embedding(message.content)
-        except Exception as e:
-            print(f"[Embedding error] {e}")
-            return
-
-        msg_vector = torch.tensor(msg_embedding)
-        msg_vector = msg_vector / msg_vector.norm()
+            verdict = await self.score_message(message, guild_id, edited=edited, entry=entry)
+        finally:
+            if entry is not None and self._burst_entries.get(entry.message_id) is not entry:
+                self.near_duplicates.resolve(entry, verdict)
 
-        flagged_rule = None
-        highest_similarity = 0.0
-        _log.info(f"Using threshold: {threshold}")
-
-        for rule in rules:
-            # if rule.rule_type == RuleType.embedding:
-            rule_vector = torch.tensor(rule.embedding_vector)
-            rule_vector = rule_vector / rule_vector.norm()
+    async def handle_near_duplicate(self, message: discord.Message, verdict: Verdict):
+        if verdict.flagged_message_id is None:
+            return
+        if _sampler.allow(message.guild.id):
+            _log.info(f"Message {message.id} is a near-duplicate of flag {verdict.flagged_message_id}, attaching it")
+        await attach_member(verdict.flagged_message_id, message, self.db_session_maker,
+                            match_kind="near_duplicate", similarity=verdict.similarity)
 
-            similarity = F.cosine_similarity(msg_vector, rule_vector, dim=0).item()
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        rule_index.channel_changed(channel)
 
-            _log.info(f"Message: {message.content[:50]}...")
-            _log.info(f"Similarity to rule '{rule.rule_text[:30]}...': {similarity:.4f}")
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        if getattr(before, "category_id", None) != getattr(after, "category_id", None):
+            rule_index.channel_changed(after)
 
-            if similarity > threshold and similarity > highest_similarity:
-                highest_similarity = similarity
-                flagged_rule = rule
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        rule_index.channel_deleted(channel)
 
-        if flagged_rule:
-            async with self.db_session_maker() as session:
-                rules = (await session.execute(
-                    select(ModerationRule).where(
-                        ModerationRule.server_id == flagged_rule.server_id,
-                        ModerationRule.active.is_(True)  # SQLAlchemy boolean
-                    ).order_by(ModerationRule.id.asc())
-                )).scalars().all()
+    @tracked("burst")
+    async def score_burst(self, messages: list[discord.Message]):
+        verdict = None
+        try:
+            verdict = await self.score_message(messages[0], int(messages[0].guild.id), burst=messages)
+        finally:
+            for fragment in messages:
+                entry = self._burst_entries.pop(int(fragment.id), None)
+                if entry is not None:
+                    self.near_duplicates.resolve(entry, verdict)
+
+    async def score_message(self, message: discord.Message, guild_id: int, edited: bool = False,
+                            burst: list[discord.Message] | None = None,
+                            entry: WindowEntry | None = None) -> Verdict | None:
+        """
+        Score a message against the guild's rules and open a review if it crosses the threshold.
+        For edits, a pending flag on the same message is updated instead of opening another review.
+        `burst` carries the fragments of a flushed burst, which are embedded and flagged as one text.
+        A fragment held for a burst hands its near-duplicate `entry` to the burst, which resolves it on flush.
+        """
+        tier = metrics.set_guild(message.guild)
+        started = time.perf_counter()
+        async with self.db_session_maker() as session:
+            result = await session.execute(
+                select(Server).options(joinedload(Server.configuration)).filter_by(discord_guild_id=guild_id)
+            )
+            server = result.scalars().first()
+            if server is None:
+                metrics.skipped("not_configured")
+                return None
+
+        # Only the rules scoped to this channel are scored
+        guild_rules = await rule_index.get(message.guild, server.id, self.db_session_maker)
+        rows = guild_rules.rows_for(message.channel)
+        if not rows.size:
+            metrics.skipped("no_rules")
+            return None
+        rules = [guild_rules.rules[i] for i in rows]
+
+        # Trusted authors are only sampled; new and previously flagged authors are always scored
+        sample_rate = server.configuration.trusted_sample_rate
+        if burst is None and sample_rate is not None and sample_rate < 1.0:
+            if not await author_trust.should_score(message, server.id, sample_rate, self.db_session_maker):
+                metrics.skipped("trust_sampling")
+                return None
+
+        # Optional burst aggregation: short fragments from one author are embedded together once
+        window_ms = server.configuration.burst_window_ms or 0
+        if burst is None and not edited and window_ms > 0:
+            if self.bursts.accepts(message):
+                if entry is not None:
+                    self._burst_entries[entry.message_id] = entry
+                self.bursts.add(message, window_ms / 1000)
+                return None
+            self.bursts.flush_soon(burst_key(message))
+        fragments = burst or [message]
+        text = "\n".join(m.content for m in fragments)
 
-            await post_review_message(
+        threshold = server.configuration.similarity_threshold
+        metrics.observe_stage("prefilter", time.perf_counter() - started)
+        try:
+            msg_embedding = await generate_embedding(text, model_name=guild_rules.embedding_model)
+        except Exception as e:
+            if _sampler.allow("embedding_error"):
+                _log.warning(f"Embedding failed for message {message.id}: {e!r}",
+                             extra={"guild_id": guild_id, "message_id": message.id})
+            metrics.skipped("embedding_error")
+            return None
+
+        # Optional learned head (one dot product): drops flags moderators of this guild would likely reject
+        head = await classifier_heads.serving(server.id, server.configuration, guild_rules.embedding_model,
+                                              self.db_session_maker)
+
+        started = time.perf_counter()
+        embedding = normalize_embedding(msg_embedding)
+        context = None
+        if guild_rules.uses_context:
+            # Context-aware rules blend in the channel's preceding conversation (one extra mat-vec)
+            if edited:
+                context = channel_contexts.context(message.channel.id)
+            else:
+                context = channel_contexts.observe(message.channel.id, embedding)
+        result = score_rules(guild_rules, rows, embedding[np.newaxis], threshold, [context], head,
+                             server.configuration.classifier_min_probability or 0.0)
+        scores = result.scores[0]
+        rule_ids = tuple(r.id for r in rules)
+        for fragment in fragments:
+            recent_messages.add(guild_id, fragment, content_hash(fragment.content), embedding, scores, rule_ids,
+                                guild_rules.embedding_model)
+
+        best = int(result.best[0])
+        highest_similarity = float(result.similarity[0])
+        limit = float(result.limits[best])
+        crossed = bool(result.crossed[0])
+        metrics.observe_stage("similarity", time.perf_counter() - started)
+        metrics.MESSAGES_SCORED.labels(tier).inc()
+        if _log.isEnabledFor(logging.DEBUG) and _sampler.allow(guild_id):
+            _log.debug(f"Message {message.id}: rule {rules[best].id} scored {highest_similarity:.4f} "
+                       f"against {limit:.4f} ({len(rules)} rules)",
+                       extra={"guild_id": guild_id, "message_id": message.id, "rule_id": rules[best].id,
+                              "similarity": highest_similarity, "flagged": crossed})
+
+        if edited:
+            flagged_message_id = await update_pending_flag(
+                message, rules[best], highest_similarity, embedding.tolist(), limit,
+                self.db_session_maker, embedding_model=guild_rules.embedding_model,
+            )
+            if flagged_message_id is not None:
+                return Verdict(rule_id=rules[best].id if crossed else None, similarity=highest_similarity,
+                               flagged_message_id=flagged_message_id if crossed else None)
+
+        if not crossed:
+            return Verdict(rule_id=None, similarity=highest_similarity)
+        flagged_rule = rules[best]
+        if not result.flagged[0]:
+            _log.info(f"Classifier v{head.version} dropped flag for rule {flagged_rule.id} "
+                      f"(approval probability {float(result.probability[0]):.2f})")
+            return Verdict(rule_id=None, similarity=highest_similarity)
+
+        # Variations of the same violating text within the window join one review item
+        async with flag_clusters.lock(guild_id, flagged_rule.id):
+            match = flag_clusters.match(guild_id, flagged_rule.id, embedding)
+            if match is not None:
+                cluster, _ = match
+                flag_clusters.add_member(cluster, embedding)
+                for fragment in fragments:
+                    await attach_member(cluster.flagged_message_id, fragment, self.db_session_maker,
+                                        match_kind="semantic", similarity=highest_similarity)
+                metrics.MESSAGES_FLAGGED.labels(tier).inc()
+                return Verdict(rule_id=flagged_rule.id, similarity=highest_similarity,
+                               flagged_message_id=cluster.flagged_message_id)
+
+            flagged_message_id = await post_review_message(
                 bot=self.bot,
                 guild=message.guild,
                 message=message,
                 picked_rule=flagged_rule,
-                rules_for_dropdown=rules,
+                rules_for_dropdown=guild_rules.rules,
                 moderator_id=None,
                 similarity=highest_similarity,
-                db_session_maker=self.db_session_maker
+                db_session_maker=self.db_session_maker,
+                embedding=msg_embedding,
+                embedding_model=guild_rules.embedding_model,
+                content=text,
+                rule_scores=dict(zip(rule_ids, scores.tolist())),
             )
+            flag_clusters.open(guild_id, flagged_rule.id, flagged_message_id, embedding)
+        metrics.MESSAGES_FLAGGED.labels(tier).inc()
+
+        # The flag points back to every fragment of the burst
+        for fragment in fragments[1:]:
+            await attach_member(flagged_message_id, fragment, self.db_session_maker,
+                                match_kind="burst", similarity=highest_similarity)
+
+        return Verdict(rule_id=flagged_rule.id, similarity=highest_similarity, flagged_message_id=flagged_message_id)
 
 
 class RuleCorrectionSelect(Select):
@@ -0,0 +1,118 @@
+import logging
+import os
+from aiohttp import web
+from discord.ext import commands
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from .. import logs, metrics
+from ..learning.classifier import classifier_heads
+from ..learning.clustering import flag_clusters
+from ..learning.db import async_session_maker, pool_status
+from ..learning.embedding import queue_depth
+from ..learning.query_stats import operation_report
+from ..moderation.channel_context import channel_contexts
+from ..moderation.recent_messages import recent_messages
+from ..moderation.rule_index import rule_index
+from ..moderation.trust import author_trust
+
+_log = logging.getLogger(__name__)
+
+# Local only by default: the endpoint is for a Prometheus agent on the same host
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 disables the endpoint
+
+
+class DatabaseCollector(Collector):
+    """Pool checkout and per-operation statement figures, read from the db layer at scrape time."""
+
+    def collect(self):
+        checkouts = CounterMetricFamily("modbot_db_pool_checkouts", "Connection checkouts", labels=["pool"])
+        waited = CounterMetricFamily("modbot_db_pool_checkout_waits", "Checkouts that found no idle connection",
+                                     labels=["pool"])
+        wait_seconds = CounterMetricFamily("modbot_db_pool_checkout_wait_seconds", "Time spent waiting for checkouts",
+                                           labels=["pool"])
+        timeouts = CounterMetricFamily("modbot_db_pool_checkout_timeouts", "Checkouts that timed out",
+                                       labels=["pool"])
+        checked_out = GaugeMetricFamily("modbot_db_pool_checked_out", "Connections in use", labels=["pool"])
+        for pool, status in pool_status().items():
+            checkouts.add_metric([pool], status["checkouts"])
+            waited.add_metric([pool], status["waited"])
+            wait_seconds.add_metric([pool], status["wait_seconds"])
+            timeouts.add_metric([pool], status["timeouts"])
+            checked_out.add_metric([pool], status["checked_out"])
+        yield from (checkouts, waited, wait_seconds, timeouts, checked_out)
+
+        calls = CounterMetricFamily("modbot_db_operations", "Tracked logical operations", labels=["operation"])
+        statements = CounterMetricFamily("modbot_db_statements", "SQL statements per logical operation",
+                                         labels=["operation"])
+        seconds = CounterMetricFamily("modbot_db_seconds", "Database time per logical operation", labels=["operation"])
+        n_plus_one = CounterMetricFamily("modbot_db_n_plus_one", "Operations flagged by the N+1 detector",
+                                         labels=["operation"])
+        for operation, report in operation_report().items():
+            calls.add_metric([operation], report["calls"])
+            statements.add_metric([operation], report["statements"])
+            seconds.add_metric([operation], report["db_seconds"])
+            n_plus_one.add_metric([operation], report["n_plus_one"])
+        yield from (calls, statements, seconds, n_plus_one)
+
+
+class LogCollector(Collector):
+    """Records the log queue dropped because it was full (bot/logs.py), read at scrape time."""
+
+    def collect(self):
+        dropped = CounterMetricFamily("modbot_log_records_dropped", "Log records dropped on a full log queue")
+        dropped.add_metric([], logs.dropped_records())
+        yield dropped
+
+
+class Metrics(commands.Cog):
+    """Serves the Prometheus metrics of bot/metrics.py (plus pool and query figures) over HTTP."""
+
+    def __init__(self, bot: commands.Bot, db_session_maker):
+        self.bot = bot
+        self.db_session_maker = db_session_maker
+        self.runner: web.AppRunner | None = None
+        self.collectors = (DatabaseCollector(), LogCollector())
+
+    def _monitor_size(self, attribute: str) -> int:
+        monitor = self.bot.get_cog("MessageMonitor")
+        return getattr(monitor, attribute).size() if monitor is not None else 0
+
+    async def cog_load(self):
+        for collector in self.collectors:
+            REGISTRY.register(collector)
+        metrics.QUEUE_DEPTH.labels("embedding").set_function(queue_depth)
+        metrics.QUEUE_DEPTH.labels("burst").set_function(lambda: self._monitor_size("bursts"))
+        metrics.QUEUE_DEPTH.labels("log").set_function(logs.queue_depth)
+        for name, cache in (("rule_index", rule_index), ("recent_messages", recent_messages),
+                            ("author_trust", author_trust), ("flag_clusters", flag_clusters),
+                            ("classifier_heads", classifier_heads), ("channel_contexts", channel_contexts)):
+            metrics.CACHE_ENTRIES.labels(name).set_function(cache.size)
+        metrics.CACHE_ENTRIES.labels("near_duplicates").set_function(lambda: self._monitor_size("near_duplicates"))
+
+    async def cog_unload(self):
+        for collector in self.collectors:
+            REGISTRY.unregister(collector)
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def serve_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self.runner is not None or not METRICS_PORT:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.serve_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, METRICS_HOST, METRICS_PORT).start()
+        _log.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Metrics(bot, async_session_maker))
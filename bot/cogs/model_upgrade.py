@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import discord
+from discord import app_commands
+from discord.ext import commands
+from sqlalchemy.future import select
+
+from ..learning.db import async_session_maker
+from ..learning.embedding import EMBEDDING_MODEL
+from ..learning.reembed import guilds_behind, run_reembed_job
+from ..moderation.rule_index import rule_index
+from ..rules.rule_model import ReembedCheckpoint
+from .sync import admin
+
+_log = logging.getLogger(__name__)
+
+
+class ModelUpgrade(commands.Cog):
+    """Runs the background re-embedding job whenever a guild still scores with an older model."""
+
+    def __init__(self, bot: commands.Bot, db_session_maker):
+        self.bot = bot
+        self.db_session_maker = db_session_maker
+        self.job: asyncio.Task | None = None
+
+    def start_job(self) -> bool:
+        if self.job is not None and not self.job.done():
+            return False
+        self.job = self.bot.loop.create_task(
+            run_reembed_job(on_cutover=rule_index.invalidate, db_session_maker=self.db_session_maker)
+        )
+        return True
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        behind = await guilds_behind(EMBEDDING_MODEL, self.db_session_maker)
+        if behind and self.start_job():
+            _log.info(f"{behind} guild(s) not on {EMBEDDING_MODEL}, started background re-embedding")
+
+    @app_commands.command(name="reembedstatus", description="Show progress of the embedding model upgrade.")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def reembed_status(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        behind = await guilds_behind(EMBEDDING_MODEL, self.db_session_maker)
+        async with self.db_session_maker() as session:
+            checkpoints = (await session.execute(
+                select(ReembedCheckpoint).filter_by(target_model=EMBEDDING_MODEL)
+            )).scalars().all()
+
+        running = self.job is not None and not self.job.done()
+        lines = [f"**Target model**: `{EMBEDDING_MODEL}`",
+                 f"**Job**: {'running' if running else 'idle'}",
+                 f"**Guilds not yet switched**: {behind}"]
+        for cp in checkpoints:
+            lines.append(f"`{cp.table_name}`: {cp.processed} re-embedded, up to id {cp.last_id}")
+        await interaction.followup.send("\n".join(lines), ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(ModelUpgrade(bot, async_session_maker))
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+import discord
+from discord import app_commands
+from discord.ext import commands
+from sqlalchemy.future import select
+
+from ..learning.db import read_session_maker
+from ..learning.stats import TOP_RULES_SHOWN, load_mod_stats
+from ..rules.rule_model import Server
+
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: list[int]) -> str:
+    top = max(values, default=0)
+    if not top:
+        return ""
+    return "".join(SPARK[min(len(SPARK) - 1, v * len(SPARK) // (top + 1))] for v in values)
+
+
+class ModStats(commands.Cog):
+    def __init__(self, bot: commands.Bot, db_session_maker):
+        self.bot = bot
+        self.db_session_maker = db_session_maker
+
+    @app_commands.command(name="modstats", description="Flag volume, approval rate, rule hits and threshold history.")
+    @app_commands.describe(days="How many days to summarise (default 30)")
+    async def modstats(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 365] = 30):
+        await interaction.response.defer(ephemeral=True)
+        async with self.db_session_maker() as session:
+            server_id = (await session.execute(
+                select(Server.id).filter_by(discord_guild_id=int(interaction.guild_id))
+            )).scalar_one_or_none()
+        if server_id is None:
+            await interaction.followup.send("This server is not yet initialized.", ephemeral=True)
+            return
+
+        stats = await load_mod_stats(server_id, days, self.db_session_maker)
+        rate = f"{stats.approval_rate:.0%}" if stats.approval_rate is not None else "n/a"
+        embed = discord.Embed(title=f"Moderation stats · last {days} day(s)", color=discord.Color.blurple())
+        embed.add_field(name="Flags", value=f"{stats.flagged} (+{stats.members} attached)", inline=True)
+        embed.add_field(name="Approved / rejected", value=f"{stats.approved} / {stats.rejected}", inline=True)
+        embed.add_field(name="Approval rate", value=rate, inline=True)
+
+        by_day = dict(stats.per_day)
+        if by_day:
+            first = datetime.utcnow().date() - timedelta(days=days - 1)
+            volume = [by_day.get(first + timedelta(days=i), 0) for i in range(days)]
+            embed.add_field(name="Daily volume", value=sparkline(volume) or "–", inline=False)
+
+        rules = [f"`{flagged:>4}` {approved}✓ {rejected}✗ · {text[:60]}"
+                 for text, flagged, approved, rejected in stats.per_rule[:TOP_RULES_SHOWN]]
+        embed.add_field(name="Top rules", value="\n".join(rules) or "No flags yet", inline=False)
+
+        changes = []
+        for change in stats.thresholds:
+            scope = f"rule {change.rule_id}" if change.rule_id else "guild"
+            old = f"{change.old_threshold:.2f}" if change.old_threshold is not None else "–"
+            new = f"{change.new_threshold:.2f}" if change.new_threshold is not None else "–"
+            changes.append(f"{change.changed_at:%m-%d %H:%M} {scope}: {old} → {new} ({change.source})")
+        embed.add_field(name="Threshold history", value="\n".join(changes) or "No changes recorded", inline=False)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+
+async def setup(bot: commands.Bot):
+    # reads only rollups, which tolerate replica lag
+    await bot.add_cog(ModStats(bot, read_session_maker))
@@ -0,0 +1,23 @@
+import asyncio
+from discord.ext import commands
+
+from ..learning.db import async_session_maker
+from ..learning.retention import run_retention_job
+
+
+class Retention(commands.Cog):
+    """Keeps flagged_messages and votes to the retention window; older rows become daily aggregates."""
+
+    def __init__(self, bot: commands.Bot, db_session_maker):
+        self.bot = bot
+        self.db_session_maker = db_session_maker
+        self.job: asyncio.Task | None = None
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self.job is None or self.job.done():
+            self.job = self.bot.loop.create_task(run_retention_job(self.db_session_maker))
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Retention(bot, async_session_maker))
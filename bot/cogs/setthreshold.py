@@ -1,15 +1,23 @@
+import io
+import time
 from discord import app_commands
 from discord.ext import commands
 import discord
 from sqlalchemy.future import select
-from ..learning.db import async_session_maker
+from sqlalchemy.orm import joinedload
+from ..learning.backtest import backtest, load_history, render, rescore
+from ..learning.db import async_session_maker, read_session_maker
+from ..learning.stats import record_threshold_change
+from ..moderation.rule_index import rule_index
 from ..rules.rule_model import Server
+from .sync import admin
 
 
 class Threshold(commands.Cog):
-    def __init__(self, bot: commands.Bot, db_session_maker):
+    def __init__(self, bot: commands.Bot, db_session_maker, read_session_maker):
         self.bot = bot
         self.db_session_maker = db_session_maker
+        self.read_session_maker = read_session_maker
 
     async def on_ready(self):
         await self.bot.tree.sync()
@@ -23,18 +31,105 @@ class Threshold(commands.Cog):
 
         async with self.db_session_maker() as session:
             result = await session.execute(
-                select(Server).filter_by(discord_guild_id=int(interaction.guild_id))
+                select(Server).options(joinedload(Server.configuration))
+                .filter_by(discord_guild_id=int(interaction.guild_id))
             )
             server = result.scalars().first()
-            if not server:
+            if not server or not server.configuration:
                 await interaction.response.send_message("This server is not yet initialized.", ephemeral=True)
                 return
 
+            record_threshold_change(session, server.id, server.configuration.similarity_threshold, threshold, "manual")
             server.configuration.similarity_threshold = threshold
             await session.commit()
 
         await interaction.response.send_message(f"Threshold updated to {threshold:.2f} ✅", ephemeral=True)
 
+    @app_commands.command(name="setburstwindow",
+                          description="Score short consecutive messages from one author together (0 = off).")
+    @app_commands.describe(milliseconds="How long to wait for follow-up fragments (0 - 2000 ms)")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def set_burst_window(self, interaction: discord.Interaction, milliseconds: int):
+        if milliseconds < 0 or milliseconds > 2000:
+            await interaction.response.send_message("Burst window must be between 0 and 2000 ms.", ephemeral=True)
+            return
+
+        async with self.db_session_maker() as session:
+            result = await session.execute(
+                select(Server).options(joinedload(Server.configuration))
+                .filter_by(discord_guild_id=int(interaction.guild_id))
+            )
+            server = result.scalars().first()
+            if not server or not server.configuration:
+                await interaction.response.send_message("This server is not yet initialized.", ephemeral=True)
+                return
+
+            server.configuration.burst_window_ms = milliseconds
+            await session.commit()
+
+        state = f"{milliseconds} ms" if milliseconds else "off"
+        await interaction.response.send_message(f"Burst aggregation window set to {state} ✅", ephemeral=True)
+
+    @app_commands.command(name="settrustsampling",
+                          description="Share of trusted members' messages that are still scored (1.0 = all).")
+    @app_commands.describe(rate="0.0 - 1.0; new and previously flagged members are always scored")
+    async def set_trust_sampling(self, interaction: discord.Interaction, rate: float):
+        if rate < 0.0 or rate > 1.0:
+            await interaction.response.send_message("Rate must be between 0.0 and 1.0.", ephemeral=True)
+            return
+
+        async with self.db_session_maker() as session:
+            result = await session.execute(
+                select(Server).options(joinedload(Server.configuration))
+                .filter_by(discord_guild_id=int(interaction.guild_id))
+            )
+            server = result.scalars().first()
+            if not server or not server.configuration:
+                await interaction.response.send_message("This server is not yet initialized.", ephemeral=True)
+                return
+
+            server.configuration.trusted_sample_rate = rate
+            await session.commit()
+
+        await interaction.response.send_message(f"Trusted members' messages sampled at {rate:.0%} ✅", ephemeral=True)
+
+    @app_commands.command(name="backtest",
+                          description="Replay resolved flags to compare thresholds by precision and recall.")
+    @app_commands.describe(rescore_rules="Re-score stored message embeddings against the current rules (slower)")
+    @app_commands.default_permissions(administrator=True)
+    @admin()
+    async def backtest(self, interaction: discord.Interaction, rescore_rules: bool = False):
+        await interaction.response.defer(ephemeral=True)
+        started = time.perf_counter()
+
+        async with self.db_session_maker() as session:
+            server = (await session.execute(
+                select(Server).options(joinedload(Server.configuration))
+                .filter_by(discord_guild_id=int(interaction.guild_id))
+            )).scalars().first()
+        if not server or not server.configuration:
+            await interaction.followup.send("This server is not yet initialized.", ephemeral=True)
+            return
+
+        history = await load_history(server.id, with_embeddings=rescore_rules, db_session_maker=self.read_session_maker)
+        if not len(history):
+            await interaction.followup.send("No resolved flags to backtest yet.", ephemeral=True)
+            return
+        scores = None
+        if rescore_rules:
+            guild_rules = await rule_index.get(interaction.guild, server.id, self.db_session_maker)
+            if guild_rules.rules:
+                scores = rescore(history, guild_rules.matrix)
+
+        result = backtest(history, scores)
+        report = render(history, result, current=server.configuration.similarity_threshold)
+        await interaction.followup.send(
+            f"```\n{report}\n```({time.perf_counter() - started:.2f}s)",
+            file=discord.File(io.BytesIO(result.to_csv().encode()), filename="threshold-sweep.csv"),
+            ephemeral=True,
+        )
+
 
 async def setup(bot: commands.Bot):
-    await bot.add_cog(Threshold(bot, async_session_maker))
+    await bot.add_cog(Threshold(bot, async_session_maker, read_session_maker))
@@ -5,6 +5,7 @@ from discord import app_commands
 from sqlalchemy.future import select
 
 from ..learning.db import async_session_maker
+from ..learning.query_stats import tracked
 from ..rules.rule_model import Server, ServerConfiguration
 
 
@@ -126,6 +127,7 @@ class ChannelDropdown(discord.ui.Select):
         options = [discord.SelectOption(label=ch.name, value=str(ch.id)) for ch in channels]
         super().__init__(placeholder="Choose a mod-review channel", options=options, min_values=1, max_values=1)
 
+    @tracked("setup")
     async def callback(self, interaction: discord.Interaction):
         new_channel_id = int(self.values[0])
 
@@ -155,6 +157,7 @@ class ThresholdGrid(discord.ui.View):
             for label in row:
                 self.add_item(ThresholdButton(label, self))
 
+    @tracked("setup")
     async def update_threshold(self, interaction: discord.Interaction):
         # normalize displayed value
         s = "".join(self.value).replace("Del", "")
@@ -211,6 +214,7 @@ class VoteTimeoutDropdown(discord.ui.Select):
         options = [discord.SelectOption(label=t, value=t) for t in times]
         super().__init__(placeholder="Choose vote timeout", options=options, min_values=1, max_values=1)
 
+    @tracked("setup")
     async def callback(self, interaction: discord.Interaction):
         selected_label = self.values[0]
         minutes = get_minutes_from_label(selected_label)
@@ -235,6 +239,7 @@ class RoleDropdown(discord.ui.Select):
         ]
         super().__init__(placeholder="Select a moderator role", options=options, min_values=1, max_values=1)
 
+    @tracked("setup")
     async def callback(self, interaction: discord.Interaction):
         new_role_id = int(self.values[0])
 
@@ -254,6 +259,7 @@ class Setup(commands.Cog):
         self.db_session_maker = db_session_maker
 
     @app_commands.command(name="setup", description="Initialize server configuration for moderation.")
+    @tracked("setup")
     async def setup_guild(self, interaction: discord.Interaction):
         guild = interaction.guild
         guild_id = int(guild.id)
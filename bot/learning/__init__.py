@@ -1,3 +1,3 @@
-from .db import async_session_maker
+from .db import async_session_maker, read_session_maker
 
-__all__ = ["async_session_maker"]
+__all__ = ["async_session_maker", "read_session_maker"]
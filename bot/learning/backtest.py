@@ -0,0 +1,170 @@
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+import numpy as np
+from sqlalchemy.future import select
+from bot.rules.rule_model import FlaggedMessage
+from ..learning.db import dispose_engines, read_session_maker
+from ..learning.feedback import policy_threshold
+
+THRESHOLDS = np.round(np.arange(0.30, 0.951, 0.005), 3)
+PERCENTILES = (5, 10, 15, 20, 25, 30, 40, 50)
+DEFAULT_BETA = 0.5  # F-beta < 1 weighs precision over recall: a false flag costs moderators more
+
+
+@dataclass
+class FeedbackHistory:
+    """Resolved flags of one guild as parallel arrays."""
+    similarity: np.ndarray  # float32, score the flag was raised with
+    approved: np.ndarray  # bool
+    weights: np.ndarray  # float64, cluster weight of each flag
+    rule_ids: np.ndarray  # int64
+    embeddings: np.ndarray | None = None  # float32 rows (NaN where none was stored), if loaded
+
+    def __len__(self) -> int:
+        return int(self.similarity.size)
+
+
+@dataclass
+class SweepResult:
+    thresholds: np.ndarray
+    precision: np.ndarray
+    recall: np.ndarray
+    flagged: np.ndarray  # weighted number of historical flags still raised at each threshold
+    f_beta: np.ndarray
+    recommended: float
+    policies: list[tuple[int, float, float, float]]  # (percentile, threshold, precision, recall)
+
+    def at(self, threshold: float) -> tuple[float, float, float]:
+        """(precision, recall, flagged) at the swept threshold nearest to `threshold`."""
+        i = int(np.abs(self.thresholds - threshold).argmin())
+        return float(self.precision[i]), float(self.recall[i]), float(self.flagged[i])
+
+    def to_csv(self) -> str:
+        lines = ["threshold,precision,recall,flagged,f_beta"]
+        lines += [f"{t:.3f},{p:.4f},{r:.4f},{n:.1f},{f:.4f}"
+                  for t, p, r, n, f in zip(self.thresholds, self.precision, self.recall, self.flagged, self.f_beta)]
+        return "\n".join(lines)
+
+
+async def load_history(server_id: int, with_embeddings: bool = False,
+                       db_session_maker=read_session_maker) -> FeedbackHistory:
+    """One query for every resolved flag of the server; pending flags carry no label and are skipped."""
+    columns = [FlaggedMessage.similarity, FlaggedMessage.approved, FlaggedMessage.member_count, FlaggedMessage.rule_id]
+    if with_embeddings:
+        columns.append(FlaggedMessage.embedding_vector)
+    async with db_session_maker() as session:
+        rows = (await session.execute(
+            select(*columns)
+            .where(FlaggedMessage.server_id == server_id)
+            .where(FlaggedMessage.approved.is_not(None))
+            .where(FlaggedMessage.similarity.is_not(None))
+        )).all()
+
+    if not rows:
+        empty = np.zeros(0)
+        return FeedbackHistory(empty.astype(np.float32), empty.astype(bool), empty, empty.astype(np.int64))
+
+    similarity, approved, member_count, rule_ids = (list(c) for c in zip(*(row[:4] for row in rows)))
+    counts = np.array([c or 1 for c in member_count], dtype=np.int64)
+    history = FeedbackHistory(
+        similarity=np.array(similarity, dtype=np.float32),
+        approved=np.array(approved, dtype=bool),
+        weights=1.0 + np.log(counts),  # clustering.cluster_weight, vectorised
+        rule_ids=np.array(rule_ids, dtype=np.int64),
+    )
+    if with_embeddings:
+        dim = next((len(row[4]) for row in rows if row[4]), 0)
+        history.embeddings = np.full((len(rows), dim), np.nan, dtype=np.float32)
+        for i, row in enumerate(rows):
+            if row[4] and len(row[4]) == dim:
+                history.embeddings[i] = row[4]
+    return history
+
+
+def rescore(history: FeedbackHistory, rule_matrix: np.ndarray) -> np.ndarray:
+    """
+    Best score of every stored embedding against today's rule matrix, so edited or newly added rules
+    can be backtested on old traffic. Rows without a stored embedding keep their recorded similarity.
+    """
+    if history.embeddings is None or not history.embeddings.size or history.embeddings.shape[1] != rule_matrix.shape[1]:
+        return history.similarity
+    stored = ~np.isnan(history.embeddings[:, 0])
+    scores = history.similarity.copy()
+    scores[stored] = (history.embeddings[stored] @ rule_matrix.T).max(axis=1)
+    return scores
+
+
+def sweep(scores: np.ndarray, approved: np.ndarray, weights: np.ndarray,
+          thresholds: np.ndarray = THRESHOLDS, beta: float = DEFAULT_BETA) -> tuple[np.ndarray, ...]:
+    """
+    Precision, recall, flag volume and F-beta at every threshold in one pass:
+    sort once, cumulative weighted label sums, one searchsorted for all thresholds.
+    Recall is relative to the approved history, i.e. to what was flagged and confirmed before.
+    """
+    order = np.argsort(scores)
+    scores, approved, weights = scores[order], approved[order], weights[order]
+    # weighted counts of approved / rejected flags scoring at or above each position
+    tp_above = np.concatenate([np.cumsum((weights * approved)[::-1])[::-1], [0.0]])
+    fp_above = np.concatenate([np.cumsum((weights * ~approved)[::-1])[::-1], [0.0]])
+
+    first = np.searchsorted(scores, thresholds, side="right")  # flags raised require score > threshold
+    tp, fp = tp_above[first], fp_above[first]
+    flagged = tp + fp
+    positives = tp_above[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(flagged > 0, tp / flagged, 1.0)
+        recall = tp / positives if positives else np.zeros_like(tp)
+        b2 = beta * beta
+        f_beta = np.where(precision + recall > 0, (1 + b2) * precision * recall / (b2 * precision + recall), 0.0)
+    return precision, recall, flagged, f_beta
+
+
+def backtest(history: FeedbackHistory, scores: np.ndarray | None = None,
+             thresholds: np.ndarray = THRESHOLDS, percentiles=PERCENTILES, beta: float = DEFAULT_BETA) -> SweepResult:
+    """Sweep thresholds and the learner's percentile policies over a guild's history."""
+    scores = history.similarity if scores is None else scores
+    precision, recall, flagged, f_beta = sweep(scores, history.approved, history.weights, thresholds, beta)
+
+    approved, rejected = history.approved, ~history.approved
+    policies = []
+    if approved.any():
+        for percentile in percentiles:
+            threshold = policy_threshold(scores[approved], history.weights[approved], scores[rejected], percentile)
+            p, r, _, _ = sweep(scores, history.approved, history.weights, np.array([threshold]), beta)
+            policies.append((percentile, threshold, float(p[0]), float(r[0])))
+
+    return SweepResult(thresholds, precision, recall, flagged, f_beta,
+                       recommended=float(thresholds[int(f_beta.argmax())]), policies=policies)
+
+
+def render(history: FeedbackHistory, result: SweepResult, current: float | None = None) -> str:
+    approved = int(history.approved.sum())
+    lines = [f"{len(history)} resolved flags ({approved} approved, {len(history) - approved} rejected)"]
+    p, r, n = result.at(result.recommended)
+    lines.append(f"Recommended threshold {result.recommended:.3f}: precision {p:.2f}, recall {r:.2f}, "
+                 f"{n:.0f} of the historical flags raised")
+    if current is not None:
+        p, r, n = result.at(current)
+        lines.append(f"Current threshold {current:.3f}: precision {p:.2f}, recall {r:.2f}, {n:.0f} raised")
+    for percentile, threshold, p, r in result.policies:
+        lines.append(f"  p{percentile:<3d} policy -> {threshold:.3f}: precision {p:.2f}, recall {r:.2f}")
+    return "\n".join(lines)
+
+
+async def _main(server_id: int) -> None:
+    started = time.perf_counter()
+    try:
+        history = await load_history(server_id)
+    finally:
+        await dispose_engines()
+    result = backtest(history)
+    print(render(history, result))
+    print(f"({time.perf_counter() - started:.2f}s)")
+    print(result.to_csv())
+
+
+if __name__ == "__main__":
+    # python -m bot.learning.backtest <server_id>
+    asyncio.run(_main(int(sys.argv[1])))
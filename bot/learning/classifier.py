@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import log_loss
+from sqlalchemy import func
+from sqlalchemy.future import select
+from bot.rules.rule_model import ClassifierHead, FlaggedMessage, ServerConfiguration
+from ..learning.db import async_session_maker
+from ..learning.embedding import DEFAULT_MODEL, active_model
+
+_log = logging.getLogger(__name__)
+
+TRAIN_BATCH = 2048
+MIN_NEW_SAMPLES = 20  # resolved flags needed before another training round
+MIN_HOLDOUT = 20
+HOLDOUT_MODULUS = 5  # flags with id % 5 == 0 are held out and never trained on
+HOLDOUT_ROWS = 5000
+PENDING_GRACE = timedelta(days=2)  # older pending flags no longer hold the watermark back
+TRAIN_INTERVAL_SECONDS = 600
+
+# partial_fit runs in its own process so training never competes with the event loop for the GIL
+_executor: ProcessPoolExecutor | None = None
+
+
+def _training_executor() -> ProcessPoolExecutor:
+    """
+    Created on first use and spawned rather than forked: by then the bot runs several threads (embedding
+    executor, log listener, loop watchdog), and a forked child can deadlock on a lock one of them held.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_training() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+@dataclass(frozen=True)
+class Head:
+    """Served weights of a guild's head: P(moderators approve the flag | message embedding)."""
+    version: int
+    embedding_model: str
+    weights: np.ndarray
+    bias: float
+
+    def probability(self, embedding: np.ndarray) -> float:
+        return float(1.0 / (1.0 + np.exp(-(self.weights @ embedding + self.bias))))
+
+    def probabilities(self, embeddings: np.ndarray) -> np.ndarray:
+        """probability() of each row of an (n, d) matrix."""
+        return 1.0 / (1.0 + np.exp(-(embeddings @ self.weights + self.bias)))
+
+
+def train_round(state: bytes | None, x: np.ndarray, y: np.ndarray, x_holdout: np.ndarray, y_holdout: np.ndarray,
+                served: tuple[list[float], float] | None) -> dict:
+    """
+    Worker-process entry point: one partial_fit pass over the new rows, then holdout log loss of the
+    candidate and of the served head (or of the training base rate when nothing is served yet).
+    """
+    model = pickle.loads(state) if state else SGDClassifier(loss="log_loss", alpha=1e-4, random_state=0)
+    model.partial_fit(x, y, classes=np.array([0, 1]))
+
+    candidate = model.predict_proba(x_holdout)[:, 1]
+    if served is not None:
+        coef, intercept = served
+        baseline = 1.0 / (1.0 + np.exp(-(x_holdout @ np.asarray(coef, dtype=np.float32) + intercept)))
+    else:
+        baseline = np.full(len(y_holdout), np.clip(y.mean(), 0.01, 0.99))
+    return {
+        "state": pickle.dumps(model),
+        "coef": model.coef_[0].tolist(),
+        "intercept": float(model.intercept_[0]),
+        "candidate_loss": float(log_loss(y_holdout, candidate, labels=[0, 1])),
+        "served_loss": float(log_loss(y_holdout, baseline, labels=[0, 1])),
+    }
+
+
+class HeadRegistry:
+    """Per-guild served head, loaded once and replaced in place when a new version is promoted."""
+
+    def __init__(self):
+        self._heads: dict[int, Head | None] = {}
+
+    def size(self) -> int:
+        """Guilds with a head loaded."""
+        return sum(head is not None for head in self._heads.values())
+
+    async def get(self, server_id: int, db_session_maker) -> Head | None:
+        if server_id not in self._heads:
+            async with db_session_maker() as session:
+                row = (await session.execute(
+                    select(ClassifierHead)
+                    .where(ClassifierHead.server_id == server_id, ClassifierHead.promoted.is_(True))
+                    .order_by(ClassifierHead.version.desc())
+                    .limit(1)
+                )).scalar_one_or_none()
+            self._heads[server_id] = _head(row) if row is not None else None
+        return self._heads[server_id]
+
+    async def serving(self, server_id: int, configuration, embedding_model: str, db_session_maker) -> Head | None:
+        """The head that gates a guild's flags: None when disabled, or when trained on another embedding model."""
+        if configuration is None or not configuration.classifier_enabled:
+            return None
+        head = await self.get(server_id, db_session_maker)
+        return head if head is not None and head.embedding_model == embedding_model else None
+
+    def swap(self, server_id: int, head: Head | None) -> None:
+        self._heads[server_id] = head
+
+
+def _head(row: ClassifierHead) -> Head:
+    return Head(row.version, row.embedding_model, np.asarray(row.coef, dtype=np.float32), float(row.intercept))
+
+
+def _labelled(server_id: int, embedding_model: str):
+    return (
+        select(FlaggedMessage.id, FlaggedMessage.embedding_vector, FlaggedMessage.approved)
+        .where(FlaggedMessage.server_id == server_id)
+        .where(FlaggedMessage.approved.is_not(None))
+        .where(FlaggedMessage.embedding_vector.is_not(None))
+        .where(func.coalesce(FlaggedMessage.embedding_model, DEFAULT_MODEL) == embedding_model)
+    )
+
+
+def _arrays(rows) -> tuple[np.ndarray, np.ndarray]:
+    return (np.asarray([r.embedding_vector for r in rows], dtype=np.float32),
+            np.asarray([int(r.approved) for r in rows], dtype=np.int64))
+
+
+async def train_guild(server_id: int, embedding_model: str, db_session_maker=async_session_maker) -> int:
+    """
+    Run one training round for a guild on resolved flags past its watermark and record it as a new version.
+    The version is promoted (and hot-swapped into `classifier_heads`) only if its holdout loss is no worse
+    than the served head's. Returns the number of rows trained on.
+    """
+    async with db_session_maker() as session:
+        latest = (await session.execute(
+            select(ClassifierHead).where(ClassifierHead.server_id == server_id)
+            .order_by(ClassifierHead.version.desc()).limit(1)
+        )).scalar_one_or_none()
+        served = (await session.execute(
+            select(ClassifierHead)
+            .where(ClassifierHead.server_id == server_id, ClassifierHead.promoted.is_(True),
+                   ClassifierHead.embedding_model == embedding_model)
+            .order_by(ClassifierHead.version.desc()).limit(1)
+        )).scalar_one_or_none()
+        # A model change starts a fresh head; the old vectors are not comparable
+        resume = latest is not None and latest.embedding_model == embedding_model
+        watermark = latest.trained_until_id if resume else 0
+
+        # Flags are resolved out of id order: stop below the oldest recent flag still pending
+        oldest_pending = (await session.execute(
+            select(func.min(FlaggedMessage.id))
+            .where(FlaggedMessage.server_id == server_id, FlaggedMessage.approved.is_(None),
+                   FlaggedMessage.created_at > datetime.utcnow() - PENDING_GRACE)
+        )).scalar_one_or_none()
+
+        train_query = _labelled(server_id, embedding_model).where(
+            FlaggedMessage.id > watermark, FlaggedMessage.id % HOLDOUT_MODULUS != 0
+        )
+        if oldest_pending is not None:
+            train_query = train_query.where(FlaggedMessage.id < oldest_pending)
+        rows = (await session.execute(train_query.order_by(FlaggedMessage.id.asc()).limit(TRAIN_BATCH))).all()
+        if len(rows) < MIN_NEW_SAMPLES:
+            return 0
+        holdout = (await session.execute(
+            _labelled(server_id, embedding_model).where(FlaggedMessage.id % HOLDOUT_MODULUS == 0)
+            .order_by(FlaggedMessage.id.desc()).limit(HOLDOUT_ROWS)
+        )).all()
+
+    x, y = _arrays(rows)
+    x_holdout, y_holdout = _arrays(holdout)
+    if len(holdout) < MIN_HOLDOUT or len(set(y_holdout.tolist())) < 2:
+        _log.info(f"Classifier for server {server_id}: holdout too small to gate a swap, waiting for more feedback")
+        return 0
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        _training_executor(), train_round,
+        latest.state if resume else None, x, y, x_holdout, y_holdout,
+        (served.coef, served.intercept) if served is not None else None,
+    )
+    promoted = result["candidate_loss"] <= result["served_loss"]
+
+    async with db_session_maker() as session:
+        row = ClassifierHead(
+            server_id=server_id,
+            version=(latest.version + 1) if latest is not None else 1,
+            embedding_model=embedding_model,
+            coef=result["coef"],
+            intercept=result["intercept"],
+            state=result["state"],
+            trained_until_id=rows[-1].id,
+            samples=(latest.samples if resume else 0) + len(rows),
+            holdout_size=len(holdout),
+            holdout_loss=result["candidate_loss"],
+            promoted=promoted,
+        )
+        session.add(row)
+        await session.commit()
+
+    if promoted:
+        classifier_heads.swap(server_id, _head(row))
+    _log.info(f"Classifier for server {server_id}: v{row.version} trained on {len(rows)} rows, holdout loss "
+              f"{result['candidate_loss']:.4f} vs served {result['served_loss']:.4f} -> "
+              f"{'promoted' if promoted else 'kept previous'}")
+    return len(rows)
+
+
+async def run_training_job(db_session_maker=async_session_maker) -> None:
+    """Periodically train the heads of every guild that enabled one."""
+    while True:
+        async with db_session_maker() as session:
+            enabled = (await session.execute(
+                select(ServerConfiguration.server_id, ServerConfiguration.embedding_model)
+                .where(ServerConfiguration.classifier_enabled.is_(True))
+            )).all()
+        for server_id, configured in enabled:
+            try:
+                while await train_guild(server_id, active_model(configured), db_session_maker) == TRAIN_BATCH:
+                    pass
+            except Exception:
+                _log.exception(f"Classifier training failed for server {server_id}")
+        await asyncio.sleep(TRAIN_INTERVAL_SECONDS)
+
+
+classifier_heads = HeadRegistry()
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+CLUSTER_SIMILARITY = 0.88
+CLUSTER_WINDOW_SECONDS = 900
+MAX_OPEN_CLUSTERS = 32
+
+
+@dataclass
+class FlagCluster:
+    flagged_message_id: int
+    centroid: np.ndarray
+    size: int
+    last_seen: float
+
+
+def cluster_weight(member_count: int) -> float:
+    """
+    Weight of a resolved cluster in threshold learning.
+    Grows with the number of messages, but logarithmically so one raid can't swamp the history.
+    """
+    return 1.0 + float(np.log(max(member_count, 1)))
+
+
+class FlagClusterer:
+    """
+    Online clustering of open flags by embedding similarity, keyed by (guild, rule).
+    A new flag close to the centroid of a recent open cluster joins it instead of opening a new review.
+    """
+
+    def __init__(self, similarity: float = CLUSTER_SIMILARITY, window_seconds: float = CLUSTER_WINDOW_SECONDS):
+        self.similarity = similarity
+        self.window_seconds = window_seconds
+        self._open: dict[tuple[int, int], list[FlagCluster]] = {}
+        self._locks: dict[tuple[int, int], asyncio.Lock] = {}
+
+    def size(self) -> int:
+        """Open clusters across all guilds and rules."""
+        return sum(len(clusters) for clusters in self._open.values())
+
+    def lock(self, guild_id: int, rule_id: int) -> asyncio.Lock:
+        """Serialises match-or-open for one (guild, rule) so a burst can't open several clusters at once."""
+        key = (guild_id, rule_id)
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    def _live(self, key: tuple[int, int]) -> list[FlagCluster]:
+        cutoff = time.monotonic() - self.window_seconds
+        clusters = [c for c in self._open.get(key, []) if c.last_seen > cutoff]
+        if clusters:
+            self._open[key] = clusters
+        else:
+            self._open.pop(key, None)
+            lock = self._locks.get(key)
+            if lock is not None and not lock.locked():
+                del self._locks[key]
+        return clusters
+
+    def match(self, guild_id: int, rule_id: int, embedding: np.ndarray) -> tuple[FlagCluster, float] | None:
+        clusters = self._live((guild_id, rule_id))
+        if not clusters:
+            return None
+        sims = np.stack([c.centroid for c in clusters]) @ embedding
+        best = int(sims.argmax())
+        if sims[best] < self.similarity:
+            return None
+        return clusters[best], float(sims[best])
+
+    def open(self, guild_id: int, rule_id: int, flagged_message_id: int, embedding: np.ndarray) -> FlagCluster:
+        cluster = FlagCluster(flagged_message_id, embedding.astype(np.float32), 1, time.monotonic())
+        clusters = self._live((guild_id, rule_id))
+        clusters.append(cluster)
+        self._open[(guild_id, rule_id)] = clusters[-MAX_OPEN_CLUSTERS:]
+        return cluster
+
+    @staticmethod
+    def add_member(cluster: FlagCluster, embedding: np.ndarray) -> None:
+        centroid = cluster.centroid * cluster.size + embedding
+        cluster.size += 1
+        cluster.centroid = (centroid / np.linalg.norm(centroid)).astype(np.float32)
+        cluster.last_seen = time.monotonic()
+
+    def close(self, flagged_message_id: int) -> None:
+        """Stop attaching to a flag once its review has been resolved."""
+        for key, clusters in list(self._open.items()):
+            self._open[key] = [c for c in clusters if c.flagged_message_id != flagged_message_id]
+
+
+flag_clusters = FlagClusterer()
@@ -1,23 +1,180 @@
+import asyncio
+import logging
 import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 from ..rules.rule_model import Server, ServerConfiguration
+from .query_stats import instrument
 from sqlalchemy.future import select
-from bot.rules.rule_model import Base
 
 load_dotenv()
 
+_log = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in the environment.")
+# Replica for heavy reads that tolerate lag (backtests, exports, stats); defaults to the primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or DATABASE_URL
+
+POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+READ_POOL_SIZE = int(os.getenv("DATABASE_READ_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "5"))
+POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Prepared statements kept per connection (asyncpg) / compiled statements (sqlite). 0 behind pgbouncer
+STATEMENT_CACHE_SIZE = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", "256"))
+SLOW_CHECKOUT_SECONDS = 0.5
+# SQL statement logging: "info" (statements) or "debug" (also result rows). Set on the logger rather than with
+# echo=True, which would add SQLAlchemy's own synchronous stdout handler
+SQL_ECHO = os.getenv("DATABASE_ECHO", "false").lower()
+if SQL_ECHO in ("1", "true", "yes", "info", "debug"):
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.DEBUG if SQL_ECHO == "debug" else logging.INFO)
+
+# Set on every new SQLite connection. WAL lets readers run alongside the single writer; busy_timeout makes
+# a writer wait for the lock instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # with WAL, only an OS crash (not a bot crash) can lose the last commits
+    "foreign_keys": "ON",  # enforced like on Postgres
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+    "cache_size": -64 * 1024,  # KiB
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    waited: int = 0  # checkouts that found no idle connection
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    timeouts: int = 0
+
+    def record(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        if seconds > 0.001:
+            self.waited += 1
+
+
+# pool name ("primary", "replica") -> checkout wait metrics
+pool_stats: dict[str, PoolStats] = {}
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Queue pool that times every checkout; the engine's pool_logging_name keys its stats."""
+
+    def _do_get(self):
+        stats = pool_stats.setdefault(self._orig_logging_name, PoolStats())
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            stats.timeouts += 1
+            _log.warning(f"Pool {self._orig_logging_name}: checkout timed out, {self.status()}")
+            raise
+        waited = time.perf_counter() - started
+        stats.record(waited)
+        if waited > SLOW_CHECKOUT_SECONDS:
+            _log.warning(f"Pool {self._orig_logging_name}: waited {waited:.2f}s for a connection, {self.status()}")
+        return connection
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def build_engine(url: str, name: str, pool_size: int = POOL_SIZE):
+    """Async engine with the tuned pool (and pragmas on SQLite); `name` keys its pool stats."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # an in-memory database only exists on its one connection
+        new_engine = create_async_engine(url)
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        instrument(new_engine)
+        return new_engine
+
+    connect_args = {}
+    if url.get_driver_name() == "asyncpg":
+        connect_args["prepared_statement_cache_size"] = STATEMENT_CACHE_SIZE
+    elif url.get_backend_name() == "sqlite":
+        connect_args["cached_statements"] = STATEMENT_CACHE_SIZE
+    new_engine = create_async_engine(
+        url,
+        poolclass=MeteredPool,
+        pool_logging_name=name,
+        pool_size=pool_size,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    instrument(new_engine)
+    return new_engine
+
+
+engine = build_engine(DATABASE_URL, "primary", POOL_SIZE)
 
 async_session_maker = sessionmaker(
     engine, expire_on_commit=False, class_=AsyncSession
 )
 
+if DATABASE_READ_URL == DATABASE_URL:
+    read_engine = engine
+    read_session_maker = async_session_maker
+else:
+    read_engine = build_engine(DATABASE_READ_URL, "replica", READ_POOL_SIZE)
+    # Sessions for queries that may see slightly stale data; never write through them
+    read_session_maker = sessionmaker(
+        read_engine, expire_on_commit=False, class_=AsyncSession
+    )
+
+
+def pool_status() -> dict[str, dict[str, float]]:
+    """Checkout metrics plus current occupancy for each pool."""
+    engines = {"primary": engine} if read_engine is engine else {"primary": engine, "replica": read_engine}
+    status = {}
+    for name, eng in engines.items():
+        stats = pool_stats.get(name, PoolStats())
+        pool = eng.pool
+        status[name] = {
+            "checkouts": stats.checkouts,
+            "waited": stats.waited,
+            "wait_seconds": stats.wait_seconds,
+            "max_wait_seconds": stats.max_wait_seconds,
+            "timeouts": stats.timeouts,
+            "size": pool.size() if isinstance(pool, AsyncAdaptedQueuePool) else 1,
+            "checked_out": pool.checkedout() if isinstance(pool, AsyncAdaptedQueuePool) else 0,
+        }
+    return status
+
+
+async def dispose_engines() -> None:
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
 
 async def create_server_configurations():
     async with async_session_maker() as session:
@@ -29,6 +186,13 @@ async def create_server_configurations():
         await session.commit()
 
 
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+async def upgrade_database(revision: str = "head", url: str | None = None):
+    """
+    Apply pending migrations (alembic/versions) to DATABASE_URL, or to `url`.
+    Runs in a thread: env.py drives its own event loop.
+    """
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["configure_logger"] = False
+    if url:
+        config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+    await asyncio.to_thread(command.upgrade, config, revision)
@@ -0,0 +1,165 @@
+"""
+Hot-path latency of the database backends, side by side.
+
+    python -m bot.learning.db_benchmark sqlite+aiosqlite:///bench.db postgresql+asyncpg://.../bench
+
+Each URL must point at a throwaway database: it is migrated and filled with synthetic rows.
+Every operation replays what the bot does per message or per review, through the same
+engine settings as the bot (pool, statement cache, SQLite pragmas).
+"""
+import argparse
+import asyncio
+import random
+import time
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload, sessionmaker
+from bot.rules.rule_model import (
+    AuthorTrust, FlaggedMessage, FlaggedMessageVote, ModerationRule, Server, ServerConfiguration,
+)
+from ..learning.db import build_engine, upgrade_database
+from ..learning.feedback import feedback_samples_query
+from ..learning.stats import bump_rule_stats
+from ..moderation.rule_index import active_rules_query
+
+GUILD_ID = 900_000_000_000_000_001
+RULES = 50
+AUTHORS = 1000
+EMBEDDING_DIM = 384
+
+
+async def seed(dbsm, flags: int) -> int:
+    """Create the benchmark guild once; returns its servers.id."""
+    async with dbsm() as session:
+        server = (await session.execute(select(Server).filter_by(discord_guild_id=GUILD_ID))).scalar_one_or_none()
+        if server is not None:
+            return server.id
+        server = Server(discord_guild_id=GUILD_ID, name="benchmark")
+        session.add(server)
+        await session.flush()
+        session.add(ServerConfiguration(server_id=server.id, similarity_threshold=0.7))
+        rng = np.random.default_rng(0)
+        rules = [ModerationRule(server_id=server.id, rule_text=f"benchmark rule {i}",
+                                embedding_vector=rng.standard_normal(EMBEDDING_DIM).astype(np.float32).tolist())
+                 for i in range(RULES)]
+        session.add_all(rules)
+        session.add_all(AuthorTrust(server_id=server.id, author_id=a) for a in range(AUTHORS))
+        await session.flush()
+        session.add_all(
+            FlaggedMessage(server_id=server.id, rule_id=rules[i % RULES].id, message_id=i, author_id=i % AUTHORS,
+                           approved=(None, True, False)[i % 3], similarity=0.7 + (i % 30) / 100)
+            for i in range(flags)
+        )
+        await session.commit()
+        return server.id
+
+
+def _operations(server_id: int, rule_ids: list[int], dbsm):
+    counter = iter(range(10**9, 2 * 10**9))
+
+    async def config_lookup():
+        async with dbsm() as session:
+            (await session.execute(
+                select(Server).options(joinedload(Server.configuration)).filter_by(discord_guild_id=GUILD_ID)
+            )).scalars().first()
+
+    async def trust_lookup():
+        async with dbsm() as session:
+            (await session.execute(
+                select(AuthorTrust).where(AuthorTrust.server_id == server_id,
+                                          AuthorTrust.author_id == random.randrange(AUTHORS))
+            )).scalar_one_or_none()
+
+    async def rule_load():
+        async with dbsm() as session:
+            (await session.execute(active_rules_query(server_id))).scalars().all()
+
+    async def open_flag():
+        rule_id = random.choice(rule_ids)
+        async with dbsm() as session:
+            session.add(FlaggedMessage(server_id=server_id, rule_id=rule_id, message_id=next(counter),
+                                       author_id=random.randrange(AUTHORS), similarity=0.8))
+            await bump_rule_stats(session, server_id, rule_id, flagged=1)
+            await session.commit()
+
+    async def vote():
+        async with dbsm() as session:
+            flag_id = (await session.execute(
+                select(FlaggedMessage.id).where(FlaggedMessage.server_id == server_id)
+                .order_by(FlaggedMessage.id.desc()).limit(1)
+            )).scalar_one()
+            session.add(FlaggedMessageVote(flagged_message_id=flag_id, moderator_id=next(counter), vote=True))
+            await session.flush()
+            (await session.execute(
+                select(func.count(FlaggedMessageVote.id)).where(FlaggedMessageVote.flagged_message_id == flag_id)
+            )).scalar_one()
+            await session.commit()
+
+    async def feedback_samples():
+        async with dbsm() as session:
+            (await session.execute(feedback_samples_query(server_id, True))).all()
+
+    return {
+        "config lookup": config_lookup,
+        "trust lookup": trust_lookup,
+        "rule load": rule_load,
+        "open flag": open_flag,
+        "vote": vote,
+        "feedback samples": feedback_samples,
+    }
+
+
+async def bench_backend(url: str, iterations: int, flags: int) -> dict[str, np.ndarray]:
+    """Latency samples in milliseconds per operation."""
+    await upgrade_database(url=url)
+    engine = build_engine(url, "benchmark")
+    dbsm = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    try:
+        server_id = await seed(dbsm, flags)
+        async with dbsm() as session:
+            rule_ids = list((await session.execute(
+                select(ModerationRule.id).where(ModerationRule.server_id == server_id)
+            )).scalars())
+        samples = {}
+        for name, operation in _operations(server_id, rule_ids, dbsm).items():
+            for _ in range(min(20, iterations)):  # warm the pool and statement caches
+                await operation()
+            timings = np.empty(iterations)
+            for i in range(iterations):
+                started = time.perf_counter()
+                await operation()
+                timings[i] = (time.perf_counter() - started) * 1000
+            samples[name] = timings
+        return samples
+    finally:
+        await engine.dispose()
+
+
+def render(results: dict[str, dict[str, np.ndarray]]) -> str:
+    lines = [f"{'operation':<18}{'backend':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"]
+    operations = next(iter(results.values())).keys()
+    for operation in operations:
+        for backend, samples in results.items():
+            p50, p95, p99 = np.percentile(samples[operation], [50, 95, 99])
+            lines.append(f"{operation:<18}{backend:<14}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}")
+    return "\n".join(lines)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    results = {}
+    for n, url in enumerate(args.urls, start=1):
+        backend = url.split(":", 1)[0].split("+", 1)[0]
+        results[backend if backend not in results else f"{backend}#{n}"] = await bench_backend(
+            url, args.iterations, args.flags
+        )
+    print(render(results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare hot-path query latency across database backends")
+    parser.add_argument("urls", nargs="+", help="Async SQLAlchemy URLs of throwaway databases")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--flags", type=int, default=20_000, help="Synthetic flag history to seed")
+    asyncio.run(_main(parser.parse_args()))
@@ -1,24 +1,88 @@
 import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor
 from sentence_transformers import SentenceTransformer
 import numpy as np
+from .. import metrics
 
-_model = None
+# Model the existing rule embeddings were created with; guilds without a recorded model use it.
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+# Model new embeddings should converge on; the re-embedding job migrates guilds to it.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+
+_models: dict[str, SentenceTransformer] = {}
 _model_lock = asyncio.Lock()
+# single-message encodes submitted to the executor but not yet started
+_waiting = 0
+_waiting_lock = threading.Lock()
+
+
+def queue_depth() -> int:
+    return _waiting
+
+
+def _dequeue(job: dict) -> None:
+    """Exactly once per job: when a thread picks it up, or when it is cancelled before that."""
+    global _waiting
+    with _waiting_lock:
+        if not job.get("dequeued"):
+            job["dequeued"] = True
+            _waiting -= 1
+
 
+def active_model(configured: str | None) -> str:
+    """Model a guild currently scores with (ServerConfiguration.embedding_model)."""
+    return configured or DEFAULT_MODEL
 
-async def get_model() -> SentenceTransformer:
-    """Load and return the SentenceTransformer model singleton asynchronously."""
-    global _model
+
+async def get_model(name: str | None = None) -> SentenceTransformer:
+    """Load and return the SentenceTransformer for `name` (default EMBEDDING_MODEL), once per process."""
+    name = name or EMBEDDING_MODEL
     async with _model_lock:
-        if _model is None:
+        if name not in _models:
             loop = asyncio.get_running_loop()
-            _model = await loop.run_in_executor(None, SentenceTransformer, 'all-MiniLM-L6-v2')
-    return _model
+            _models[name] = await loop.run_in_executor(None, SentenceTransformer, name)
+    return _models[name]
 
 
-async def generate_embedding(text: str) -> list[float]:
-    model = await get_model()
+async def generate_embedding(text: str, model_name: str | None = None) -> list[float]:
+    global _waiting
+    model = await get_model(model_name)
     loop = asyncio.get_running_loop()
-    embedding = await loop.run_in_executor(None, lambda: model.encode(text, convert_to_numpy=True))
+    job = {}
+
+    def encode():
+        job["started"] = time.perf_counter()
+        _dequeue(job)
+        embedding = model.encode(text, convert_to_numpy=True)
+        job["finished"] = time.perf_counter()
+        return embedding
+
+    with _waiting_lock:
+        _waiting += 1
+    submitted = time.perf_counter()
+    try:
+        embedding = await loop.run_in_executor(None, encode)
+    finally:
+        _dequeue(job)
+    # waiting for an executor thread and encoding are reported apart: one is capacity, the other model cost
+    metrics.observe_stage("embedding_wait", job["started"] - submitted)
+    metrics.observe_stage("embedding_compute", job["finished"] - job["started"])
     norm_embedding = embedding / np.linalg.norm(embedding)
     return norm_embedding.tolist()
+
+
+async def generate_embeddings(texts: list[str], batch_size: int = 64, model_name: str | None = None,
+                              executor: Executor | None = None) -> list[list[float]]:
+    """Embed many texts in one batched encode call; rows are L2-normalized."""
+    if not texts:
+        return []
+    model = await get_model(model_name)
+    loop = asyncio.get_running_loop()
+    embeddings = await loop.run_in_executor(
+        executor, lambda: model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    )
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings.tolist()
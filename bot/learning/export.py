@@ -0,0 +1,214 @@
+"""
+Streaming Parquet export of moderation history for offline analysis and training.
+
+    python -m bot.learning.export out/ [--server-id 3] [--full]
+
+Each run writes flagged_messages and their votes past the watermark stored in
+out/export_state.json to new files, one row group per chunk, so memory stays bounded
+by CHUNK_SIZE whatever the table size. Embeddings become a fixed-size list column.
+
+Flags the retention job has moved to flagged_messages_archive (with their votes) keep their
+ids, so the same range is also read from the archive tables and written to
+flagged_messages_archive-* / flagged_message_votes_archive-* files with the same schemas.
+Readers union both file sets: together they are the full history, whatever its age.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import func
+from sqlalchemy.future import select
+from bot.rules.rule_model import FlaggedMessage, FlaggedMessageArchive, FlaggedMessageVote, FlaggedMessageVoteArchive
+from ..learning.db import dispose_engines, read_session_maker
+
+_log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+PENDING_GRACE = timedelta(days=2)  # flags pending longer than this are exported as they are
+STATE_FILE = "export_state.json"
+
+_FLAG_COLUMNS = (
+    ("id", pa.int64()), ("server_id", pa.int32()), ("message_id", pa.int64()), ("rule_id", pa.int32()),
+    ("author_id", pa.int64()), ("approved", pa.bool_()), ("moderator_id", pa.int64()),
+    ("similarity", pa.float32()), ("created_at", pa.timestamp("us")), ("message_excerpt", pa.string()),
+    ("member_count", pa.int32()), ("embedding_model", pa.string()),
+)
+_VOTE_COLUMNS = (
+    ("id", pa.int64()), ("flagged_message_id", pa.int64()), ("moderator_id", pa.int64()),
+    ("vote", pa.bool_()), ("created_at", pa.timestamp("us")),
+)
+
+
+def flag_schema(embedding_dim: int) -> pa.Schema:
+    fields = [pa.field(name, type_) for name, type_ in _FLAG_COLUMNS]
+    if embedding_dim:
+        fields.append(pa.field("embedding", pa.list_(pa.float32(), embedding_dim), nullable=False))
+    return pa.schema(fields)
+
+
+def vote_schema() -> pa.Schema:
+    return pa.schema([pa.field(name, type_) for name, type_ in _VOTE_COLUMNS])
+
+
+def _flag_batch(rows, schema: pa.Schema, embedding_dim: int) -> pa.RecordBatch:
+    columns = [pa.array([getattr(r, name) for r in rows], type=type_) for name, type_ in _FLAG_COLUMNS]
+    if embedding_dim:
+        # Parquet cannot store null fixed-size lists: vectors of another dimension (older model) are written as
+        # NaN rows, and embedding_model tells them apart
+        values = np.full((len(rows), embedding_dim), np.nan, dtype=np.float32)
+        for i, r in enumerate(rows):
+            if r.embedding_vector and len(r.embedding_vector) == embedding_dim:
+                values[i] = r.embedding_vector
+        columns.append(pa.FixedSizeListArray.from_arrays(pa.array(values.ravel()), embedding_dim))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _vote_batch(rows, schema: pa.Schema) -> pa.RecordBatch:
+    return pa.RecordBatch.from_arrays(
+        [pa.array([getattr(r, name) for r in rows], type=type_) for name, type_ in _VOTE_COLUMNS], schema=schema
+    )
+
+
+def _scope(statement, column, server_id: int | None):
+    return statement.where(column == server_id) if server_id is not None else statement
+
+
+async def _write_flags(db_session_maker, model, path: Path, server_id: int | None, after_id: int, upper: int,
+                       embedding_dim: int) -> int:
+    schema = flag_schema(embedding_dim)
+    columns = [getattr(model, name) for name, _ in _FLAG_COLUMNS]
+    if embedding_dim:
+        columns.append(model.embedding_vector)
+    written = 0
+    async with db_session_maker() as session:
+        # stream() uses a server-side cursor; yield_per bounds what is buffered client-side
+        result = await session.stream(_scope(
+            select(*columns).where(model.id > after_id, model.id < upper)
+            .order_by(model.id.asc()).execution_options(yield_per=CHUNK_SIZE),
+            model.server_id, server_id,
+        ))
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            async for rows in result.partitions(CHUNK_SIZE):
+                writer.write_batch(_flag_batch(rows, schema, embedding_dim))
+                written += len(rows)
+    return written
+
+
+async def _write_votes(db_session_maker, model, flag_model, path: Path, server_id: int | None, after_id: int,
+                       upper: int) -> int:
+    schema = vote_schema()
+    statement = (
+        select(*(getattr(model, name) for name, _ in _VOTE_COLUMNS))
+        .where(model.flagged_message_id > after_id, model.flagged_message_id < upper)
+        .order_by(model.id.asc()).execution_options(yield_per=CHUNK_SIZE)
+    )
+    if server_id is not None:
+        statement = statement.join(flag_model, model.flagged_message_id == flag_model.id) \
+            .where(flag_model.server_id == server_id)
+    written = 0
+    async with db_session_maker() as session:
+        result = await session.stream(statement)
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            async for rows in result.partitions(CHUNK_SIZE):
+                writer.write_batch(_vote_batch(rows, schema))
+                written += len(rows)
+    return written
+
+
+async def export_range(out_dir: Path, server_id: int | None, after_id: int, db_session_maker=read_session_maker
+                       ) -> tuple[int, int, int]:
+    """
+    Export flags with after_id < id < upper bound, and their votes, from the live and the archive tables.
+    The upper bound stops below the oldest recently pending flag, because its outcome and votes can still change.
+    Returns (new watermark, flags written, votes written).
+    """
+    async with db_session_maker() as session:
+        oldest_pending = (await session.execute(_scope(
+            select(func.min(FlaggedMessage.id)).where(
+                FlaggedMessage.approved.is_(None), FlaggedMessage.created_at > datetime.utcnow() - PENDING_GRACE
+            ), FlaggedMessage.server_id, server_id
+        ))).scalar_one_or_none()
+        last_id = max([(await session.execute(_scope(
+            select(func.max(model.id)), model.server_id, server_id
+        ))).scalar_one_or_none() or 0 for model in (FlaggedMessage, FlaggedMessageArchive)])
+        upper = min(oldest_pending, last_id + 1) if oldest_pending is not None else last_id + 1
+        if upper <= after_id + 1:
+            return after_id, 0, 0
+        archived = (await session.execute(_scope(
+            select(func.count(FlaggedMessageArchive.id))
+            .where(FlaggedMessageArchive.id > after_id, FlaggedMessageArchive.id < upper),
+            FlaggedMessageArchive.server_id, server_id
+        ))).scalar_one()
+        sample = None
+        for model in (FlaggedMessage, FlaggedMessageArchive):
+            sample = sample or (await session.execute(_scope(
+                select(model.embedding_vector)
+                .where(model.id > after_id, model.embedding_vector.is_not(None))
+                .order_by(model.id.desc()).limit(1), model.server_id, server_id
+            ))).scalar_one_or_none()
+    embedding_dim = len(sample) if sample else 0
+
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    suffix = f"{'all' if server_id is None else f'server{server_id}'}-{after_id + 1}-{upper - 1}-{stamp}"
+    tables = [(FlaggedMessage, FlaggedMessageVote, "flagged_messages", "flagged_message_votes")]
+    if archived:
+        tables.append((FlaggedMessageArchive, FlaggedMessageVoteArchive,
+                       "flagged_messages_archive", "flagged_message_votes_archive"))
+
+    flags = votes = 0
+    paths = []
+    try:
+        for flag_model, vote_model, flag_name, vote_name in tables:
+            flag_path = out_dir / f"{flag_name}-{suffix}.parquet"
+            vote_path = out_dir / f"{vote_name}-{suffix}.parquet"
+            paths += [flag_path, vote_path]
+            flags += await _write_flags(db_session_maker, flag_model, flag_path, server_id, after_id, upper,
+                                        embedding_dim)
+            votes += await _write_votes(db_session_maker, vote_model, flag_model, vote_path, server_id, after_id,
+                                        upper)
+    except BaseException:
+        # a half-written file would be picked up by readers of out_dir; the next run redoes this range
+        for path in paths:
+            path.unlink(missing_ok=True)
+        raise
+
+    return upper - 1, flags, votes
+
+
+async def export(out_dir: Path, server_id: int | None = None, full: bool = False,
+                 db_session_maker=read_session_maker) -> tuple[int, int]:
+    """Incremental export from the watermark in `out_dir` (or from scratch with `full`)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state_path = out_dir / STATE_FILE
+    state = json.loads(state_path.read_text()) if state_path.exists() and not full else {}
+    key = "all" if server_id is None else str(server_id)
+
+    started = time.perf_counter()
+    watermark, flags, votes = await export_range(out_dir, server_id, state.get(key, 0), db_session_maker)
+    state[key] = watermark
+    state_path.write_text(json.dumps(state, indent=2))
+    _log.info(f"Exported {flags} flags and {votes} votes up to id {watermark} "
+              f"in {time.perf_counter() - started:.1f}s")
+    return flags, votes
+
+
+async def _main(args: argparse.Namespace) -> None:
+    try:
+        flags, votes = await export(Path(args.out_dir), args.server_id, args.full)
+        print(f"{flags} flags, {votes} votes")
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export moderation history to Parquet")
+    parser.add_argument("out_dir")
+    parser.add_argument("--server-id", type=int, default=None, help="Internal servers.id; default all servers")
+    parser.add_argument("--full", action="store_true", help="Ignore the watermark and export everything")
+    asyncio.run(_main(parser.parse_args()))
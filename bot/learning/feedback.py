@@ -1,12 +1,18 @@
 import logging
+from collections import defaultdict
+from sqlalchemy import update
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
 from bot.rules.rule_model import ModerationRule, FlaggedMessage, FlaggedMessageVote, ServerConfiguration
 from ..learning.db import async_session_maker
+from ..learning.clustering import cluster_weight
+from ..learning.stats import record_threshold_change
 import numpy as np
 
 _log = logging.getLogger(__name__)
 
+MIN_RULE_SAMPLES = 10  # approved flags a rule needs before it gets its own threshold
+
 
 async def get_feedback_similarities(server_id: int, approved: bool) -> list[float]:
     """
@@ -14,19 +20,60 @@ async def get_feedback_similarities(server_id: int, approved: bool) -> list[floa
     """
     async with async_session_maker() as session:
         result = await session.execute(
-            select(FlaggedMessage, ModerationRule)
-            .join(ModerationRule, FlaggedMessage.rule_id == ModerationRule.id)
-            .where(ModerationRule.server_id == server_id)
+            select(FlaggedMessage.similarity)
+            .where(FlaggedMessage.server_id == server_id)
             .where(FlaggedMessage.approved == approved)
         )
-        rows = result.all()
+        rows = result.scalars().all()
+
+    return [float(sim) for sim in rows if sim is not None]
+
+
+def feedback_samples_query(server_id: int, approved: bool):
+    """Served by ix_flagged_messages_server_approved_created (see learning/query_plans.py)."""
+    return (
+        select(FlaggedMessage.similarity, FlaggedMessage.member_count)
+        .where(FlaggedMessage.server_id == server_id)
+        .where(FlaggedMessage.approved == approved)
+        .where(FlaggedMessage.similarity.is_not(None))
+    )
+
+
+async def get_feedback_samples(server_id: int, approved: bool) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fetch (similarities, weights) for resolved flags of a server.
+    A clustered flag stands for all of its member messages and is weighted accordingly.
+    """
+    async with async_session_maker() as session:
+        rows = (await session.execute(feedback_samples_query(server_id, approved))).all()
 
-    similarities = []
-    for flagged_msg, rule in rows:
-        sim = getattr(flagged_msg, "similarity", None)
-        if sim is not None:
-            similarities.append(float(sim))
-    return similarities
+    similarities = np.array([float(sim) for sim, _ in rows], dtype=np.float64)
+    weights = np.array([cluster_weight(count or 1) for _, count in rows], dtype=np.float64)
+    return similarities, weights
+
+
+def weighted_percentile(values: np.ndarray, weights: np.ndarray, percentile: float) -> float:
+    """Linear-interpolated percentile; identical to np.percentile when all weights are 1."""
+    order = np.argsort(values)
+    values, weights = values[order], weights[order]
+    if values.size == 1:
+        return float(values[0])
+    cdf = (np.cumsum(weights) - weights) / (weights.sum() - weights[-1])
+    return float(np.interp(percentile / 100.0, cdf, values))
+
+
+def policy_threshold(approved: np.ndarray, approved_weights: np.ndarray, rejected: np.ndarray,
+                     percentile: float = 25) -> float:
+    """
+    The learner's rule: the given percentile of approved scores,
+    raised just above the highest rejected score to avoid false positives.
+    """
+    threshold = weighted_percentile(approved, approved_weights, percentile)
+    if rejected.size:
+        max_rejected = float(rejected.max())
+        if threshold < max_rejected:
+            threshold = max_rejected + 0.01
+    return threshold
 
 
 async def set_server_threshold(server_id: int, threshold: float) -> None:
@@ -38,6 +85,7 @@ async def set_server_threshold(server_id: int, threshold: float) -> None:
             select(ServerConfiguration).where(ServerConfiguration.server_id == server_id)
         )).scalar_one_or_none()
         if cfg:
+            record_threshold_change(session, server_id, cfg.similarity_threshold, threshold, "manual")
             cfg.similarity_threshold = threshold
             await session.commit()
     _log.info(f"Updated server {server_id} similarity_threshold to {threshold:.3f}")
@@ -48,32 +96,78 @@ async def update_server_threshold_from_feedback(server_id: int, percentile: int
     Update the server's similarity_threshold based on feedback similarities.
     Adjusts threshold to minimize false positives.
     """
-    approved_scores = await get_feedback_similarities(server_id, approved=True)
-    rejected_scores = await get_feedback_similarities(server_id, approved=False)
+    approved_scores, approved_weights = await get_feedback_samples(server_id, approved=True)
+    rejected_scores, _ = await get_feedback_samples(server_id, approved=False)
 
-    if not approved_scores:
+    if not approved_scores.size:
         _log.info(f"No approved feedback for server {server_id}, skipping threshold update.")
         return
 
-    new_threshold = float(np.percentile(approved_scores, percentile))
+    new_threshold = policy_threshold(approved_scores, approved_weights, rejected_scores, percentile)
     _log.info(f"Computed new threshold={new_threshold:.3f} (percentile={percentile}) for server {server_id}")
 
-    if rejected_scores:
-        max_rejected = max(rejected_scores)
-        if new_threshold < max_rejected:
-            new_threshold = max_rejected + 0.01
-            _log.info(f"Adjusted new threshold to {new_threshold:.3f} to avoid false positives")
-
     async with async_session_maker() as session:
         cfg = (await session.execute(
             select(ServerConfiguration).where(ServerConfiguration.server_id == server_id)
         )).scalar_one_or_none()
         if cfg:
+            record_threshold_change(session, server_id, cfg.similarity_threshold, new_threshold, "feedback")
             cfg.similarity_threshold = new_threshold
             await session.commit()
     _log.info(f"Updated server {server_id} similarity_threshold to {new_threshold:.3f}")
 
 
+async def update_rule_thresholds_from_feedback(server_id: int, percentile: int = 25) -> bool:
+    """
+    Learn a threshold for every active rule of the server from that rule's own resolved flags,
+    with the same policy as the guild threshold. Rules with fewer than MIN_RULE_SAMPLES approved
+    flags are reset to None and fall back to the guild threshold.
+    Returns whether any rule's threshold changed.
+    """
+    async with async_session_maker() as session:
+        rules = (await session.execute(
+            select(ModerationRule.id, ModerationRule.similarity_threshold)
+            .where(ModerationRule.server_id == server_id, ModerationRule.active.is_(True))
+        )).all()
+        rows = (await session.execute(
+            select(FlaggedMessage.rule_id, FlaggedMessage.similarity, FlaggedMessage.approved,
+                   FlaggedMessage.member_count)
+            .where(FlaggedMessage.server_id == server_id)
+            .where(FlaggedMessage.approved.is_not(None))
+            .where(FlaggedMessage.similarity.is_not(None))
+        )).all()
+
+    samples = defaultdict(lambda: ([], [], []))  # rule_id -> (approved sims, approved weights, rejected sims)
+    for rule_id, sim, approved, count in rows:
+        approved_sims, approved_weights, rejected_sims = samples[rule_id]
+        if approved:
+            approved_sims.append(float(sim))
+            approved_weights.append(cluster_weight(count or 1))
+        else:
+            rejected_sims.append(float(sim))
+
+    changes = []
+    for rule_id, current in rules:
+        approved_sims, approved_weights, rejected_sims = samples.get(rule_id, ([], [], []))
+        learned = None
+        if len(approved_sims) >= MIN_RULE_SAMPLES:
+            learned = round(policy_threshold(np.array(approved_sims), np.array(approved_weights),
+                                             np.array(rejected_sims), percentile), 4)
+        if learned != current:
+            changes.append((rule_id, current, learned))
+
+    if changes:
+        async with async_session_maker() as session:
+            await session.execute(update(ModerationRule), [
+                {"id": rule_id, "similarity_threshold": learned} for rule_id, _, learned in changes
+            ])
+            for rule_id, old, learned in changes:
+                record_threshold_change(session, server_id, old, learned, "rule_feedback", rule_id=rule_id)
+            await session.commit()
+        _log.info(f"Updated {len(changes)} per-rule threshold(s) for server {server_id}")
+    return bool(changes)
+
+
 async def record_vote_in_flagged_message(
     flagged_message_id: int,
     moderator_id: str,
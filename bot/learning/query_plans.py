@@ -0,0 +1,76 @@
+"""
+Query-plan regression check for the hot feedback and rule-load queries.
+
+    python -m bot.learning.query_plans
+
+Run against a migrated database; exits non-zero if a query stops using its index.
+tests/test_queries.py runs the same check on a migrated SQLite database.
+"""
+import asyncio
+import json
+import sys
+from sqlalchemy import text
+from ..learning.db import async_session_maker, dispose_engines
+from ..learning.feedback import feedback_samples_query
+from ..moderation.rule_index import active_rules_query
+
+# query name -> (statement, index that must serve it)
+HOT_QUERIES = {
+    "feedback samples": (feedback_samples_query(1, True), "ix_flagged_messages_server_approved_created"),
+    "active rules": (active_rules_query(1), "ix_moderation_rules_server_active"),
+}
+
+
+def _postgres_indexes(node: dict) -> set[str]:
+    found = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        found |= _postgres_indexes(child)
+    return found
+
+
+async def explain(session, statement) -> tuple[set[str], str]:
+    """Indexes the planner uses for `statement`, plus the plan as text."""
+    dialect = session.bind.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == "postgresql":
+        # Tables in a test database are tiny; without this the planner rightly prefers a sequential scan
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = (await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar_one()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return _postgres_indexes(plan[0]["Plan"]), json.dumps(plan, indent=2)
+
+    if dialect.name == "sqlite":
+        rows = (await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all()
+        details = [row[-1] for row in rows]
+        used = {word for detail in details for word in detail.replace("(", " ").split() if word.startswith("ix_")}
+        return used, "\n".join(details)
+
+    raise NotImplementedError(f"No plan inspection for {dialect.name}")
+
+
+async def check_query_plans(db_session_maker=async_session_maker) -> dict[str, bool]:
+    """For every hot query, whether its plan uses the expected index."""
+    results = {}
+    for name, (statement, index) in HOT_QUERIES.items():
+        async with db_session_maker() as session:
+            used, plan = await explain(session, statement)
+            await session.rollback()
+        results[name] = index in used
+        if not results[name]:
+            print(f"{name}: expected {index}, plan uses {sorted(used) or 'no index'}\n{plan}", file=sys.stderr)
+    return results
+
+
+async def _main() -> dict[str, bool]:
+    try:
+        return await check_query_plans()
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    outcome = asyncio.run(_main())
+    for query, ok in outcome.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {query}")
+    sys.exit(0 if all(outcome.values()) else 1)
@@ -0,0 +1,133 @@
+"""
+SQL statement counts and database time per logical operation (on_message, vote, finalize, ...).
+
+    with track_operation("vote") as stats:
+        ...
+    assert stats.statements <= 6
+
+Engine events attribute each statement to the operations open in the current task (a
+contextvar, so concurrent handlers never mix). An operation that repeats one statement more
+than N_PLUS_ONE_THRESHOLD times is logged as a likely N+1.
+"""
+import functools
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+
+_log = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+STATEMENT_LOGGED_CHARS = 200
+
+
+@dataclass
+class OperationStats:
+    name: str
+    statements: int = 0
+    db_seconds: float = 0.0
+    shapes: Counter = field(default_factory=Counter)  # statement text (parameters are bound) -> executions
+    closed: bool = False
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """Statements executed more than `threshold` times, most repeated first."""
+        return [(statement, n) for statement, n in self.shapes.most_common() if n > threshold]
+
+
+@dataclass
+class OperationTotals:
+    calls: int = 0
+    statements: int = 0
+    db_seconds: float = 0.0
+    max_statements: int = 0
+    n_plus_one: int = 0  # calls flagged by the detector
+
+
+# operation name -> totals since startup
+operation_totals: dict[str, OperationTotals] = {}
+
+_active: ContextVar[tuple[OperationStats, ...]] = ContextVar("sql_operations", default=())
+
+
+@contextmanager
+def track_operation(name: str):
+    """Count the statements run inside the block; operations nest, and the outer ones see inner statements too."""
+    stats = OperationStats(name)
+    token = _active.set(_active.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+        _close(stats)
+
+
+def tracked(name: str):
+    """Decorator form of track_operation for async handlers."""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track_operation(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _close(stats: OperationStats) -> None:
+    # tasks spawned inside the block inherit the contextvar; they must not count into a finished operation
+    stats.closed = True
+    totals = operation_totals.setdefault(stats.name, OperationTotals())
+    totals.calls += 1
+    totals.statements += stats.statements
+    totals.db_seconds += stats.db_seconds
+    totals.max_statements = max(totals.max_statements, stats.statements)
+    repeated = stats.repeated()
+    if repeated:
+        totals.n_plus_one += 1
+        statement, n = repeated[0]
+        _log.warning(f"Possible N+1 in {stats.name}: {n} executions of "
+                     f"{' '.join(statement.split())[:STATEMENT_LOGGED_CHARS]!r} "
+                     f"({stats.statements} statements, {stats.db_seconds * 1000:.1f} ms in total)")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _active.get():
+        context._operation_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_operation_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    for stats in _active.get():
+        if not stats.closed:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+            stats.shapes[statement] += 1
+
+
+def instrument(engine) -> None:
+    """Attach the statement hooks to an engine (async engines are instrumented through their sync_engine)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def operation_report() -> dict[str, dict[str, float]]:
+    """Totals per operation, with averages, for the metrics surface."""
+    return {
+        name: {
+            "calls": totals.calls,
+            "statements": totals.statements,
+            "statements_per_call": totals.statements / totals.calls if totals.calls else 0.0,
+            "max_statements": totals.max_statements,
+            "db_seconds": totals.db_seconds,
+            "db_ms_per_call": totals.db_seconds * 1000 / totals.calls if totals.calls else 0.0,
+            "n_plus_one": totals.n_plus_one,
+        }
+        for name, totals in operation_totals.items()
+    }
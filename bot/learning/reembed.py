@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, update, or_
+from sqlalchemy.future import select
+from bot.rules.rule_model import ModerationRule, FlaggedMessage, ReembedCheckpoint, Server, ServerConfiguration
+from ..learning.db import async_session_maker
+from ..learning.embedding import EMBEDDING_MODEL, active_model, generate_embeddings
+
+_log = logging.getLogger(__name__)
+
+BATCH_SIZE = 256
+THROTTLE_SECONDS = 1.0  # pause between batches so live scoring keeps the CPU
+RESCAN_SECONDS = 300
+
+# (model, table, text column) re-embedded by the job
+_TARGETS = (
+    (ModerationRule, "moderation_rules", ModerationRule.rule_text),
+    (FlaggedMessage, "flagged_messages", FlaggedMessage.message_excerpt),
+)
+
+# Background batches get their own single worker so they never queue ahead of live embeddings
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reembed")
+
+
+async def _checkpoint(session, target_model: str, table_name: str) -> ReembedCheckpoint:
+    cp = (await session.execute(
+        select(ReembedCheckpoint).filter_by(target_model=target_model, table_name=table_name)
+    )).scalar_one_or_none()
+    if cp is None:
+        cp = ReembedCheckpoint(target_model=target_model, table_name=table_name, last_id=0, processed=0)
+        session.add(cp)
+        await session.flush()
+    return cp
+
+
+async def reembed_table(model, table_name: str, text_column, target_model: str, db_session_maker) -> int:
+    """
+    Fill next_embedding_vector for rows not yet embedded with `target_model`, in id order.
+    Progress is checkpointed after every batch, so a restart resumes where it stopped.
+    """
+    done = 0
+    while True:
+        async with db_session_maker() as session:
+            cp = await _checkpoint(session, target_model, table_name)
+            rows = (await session.execute(
+                select(model.id, text_column)
+                .where(model.id > cp.last_id, text_column.is_not(None))
+                .where(or_(model.embedding_model.is_(None), model.embedding_model != target_model))
+                .where(or_(model.next_embedding_model.is_(None), model.next_embedding_model != target_model))
+                .order_by(model.id.asc())
+                .limit(BATCH_SIZE)
+            )).all()
+            await session.commit()
+        if not rows:
+            return done
+
+        # No connection is held while the batch is encoded
+        started = time.perf_counter()
+        vectors = await generate_embeddings([text for _, text in rows], model_name=target_model, executor=_executor)
+
+        async with db_session_maker() as session:
+            await session.execute(update(model), [
+                {"id": row_id, "next_embedding_vector": vector, "next_embedding_model": target_model}
+                for (row_id, _), vector in zip(rows, vectors)
+            ])
+            await session.execute(
+                update(ReembedCheckpoint)
+                .where(ReembedCheckpoint.target_model == target_model, ReembedCheckpoint.table_name == table_name)
+                .values(last_id=rows[-1][0], processed=ReembedCheckpoint.processed + len(rows))
+            )
+            await session.commit()
+
+        done += len(rows)
+        _log.info(f"Re-embedded {len(rows)} {table_name} rows with {target_model} "
+                  f"in {time.perf_counter() - started:.2f}s (up to id {rows[-1][0]})")
+        await asyncio.sleep(THROTTLE_SECONDS)
+
+
+def _swap_in(model, target_model: str):
+    """UPDATE that makes the `target_model` vectors of `model` rows current; callers add the row filter."""
+    return (
+        update(model)
+        .values(embedding_vector=model.next_embedding_vector,
+                embedding_model=target_model,
+                next_embedding_vector=None,
+                next_embedding_model=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def cutover_ready_guilds(target_model: str, db_session_maker) -> list[int]:
+    """
+    Switch every guild whose active rules all have a `target_model` vector.
+    Vectors, rule model tags and the guild's configured model change in one transaction.
+    Returns the Discord guild ids that were switched.
+    """
+    switched = []
+    async with db_session_maker() as session:
+        pending = (await session.execute(
+            select(Server.id, Server.discord_guild_id, ServerConfiguration.embedding_model)
+            .join(ServerConfiguration, ServerConfiguration.server_id == Server.id)
+        )).all()
+
+    for server_id, guild_id, configured in pending:
+        if active_model(configured) == target_model:
+            continue
+        async with db_session_maker() as session:
+            async with session.begin():
+                missing = (await session.execute(
+                    select(func.count(ModerationRule.id)).where(
+                        ModerationRule.server_id == server_id,
+                        ModerationRule.active.is_(True),
+                        or_(ModerationRule.next_embedding_model.is_(None),
+                            ModerationRule.next_embedding_model != target_model),
+                        or_(ModerationRule.embedding_model.is_(None),
+                            ModerationRule.embedding_model != target_model),
+                    )
+                )).scalar_one()
+                if missing:
+                    continue
+
+                await session.execute(_swap_in(ModerationRule, target_model).where(
+                    ModerationRule.server_id == server_id, ModerationRule.next_embedding_model == target_model
+                ))
+                await session.execute(_swap_in(FlaggedMessage, target_model).where(
+                    FlaggedMessage.server_id == server_id, FlaggedMessage.next_embedding_model == target_model
+                ))
+                await session.execute(
+                    update(ServerConfiguration)
+                    .where(ServerConfiguration.server_id == server_id)
+                    .values(embedding_model=target_model)
+                )
+        switched.append(guild_id)
+        _log.info(f"Guild {guild_id} now scores with {target_model}")
+    return switched
+
+
+async def promote_late_flags(target_model: str, db_session_maker) -> int:
+    """
+    Swap in the `target_model` vectors of flags whose guild has already cut over. These are flags stored
+    with the old model between the flagged_messages pass and their guild's cutover; without this they
+    would stay on the old model, out of reach of the classifier and backtests.
+    """
+    async with db_session_maker() as session:
+        configured = (await session.execute(
+            select(ServerConfiguration.server_id, ServerConfiguration.embedding_model)
+        )).all()
+        switched = [server_id for server_id, model in configured if active_model(model) == target_model]
+        if not switched:
+            return 0
+        result = await session.execute(_swap_in(FlaggedMessage, target_model).where(
+            FlaggedMessage.server_id.in_(switched), FlaggedMessage.next_embedding_model == target_model
+        ))
+        await session.commit()
+    return result.rowcount
+
+
+async def run_reembed_job(on_cutover=None, target_model: str = EMBEDDING_MODEL,
+                          db_session_maker=async_session_maker) -> None:
+    """
+    Migrate all guilds to `target_model`: re-embed in batches, then cut guilds over as they become ready.
+    `on_cutover(guild_id)` is called after each switch (e.g. to drop cached rule matrices).
+    Loops until every guild has switched, picking up rows created while it ran.
+    """
+    while True:
+        for model, table_name, text_column in _TARGETS:
+            await reembed_table(model, table_name, text_column, target_model, db_session_maker)
+
+        for guild_id in await cutover_ready_guilds(target_model, db_session_maker):
+            if on_cutover is not None:
+                on_cutover(guild_id)
+
+        # Flags stored with the old model since the pass above: embed them until none are left
+        while await reembed_table(FlaggedMessage, "flagged_messages", FlaggedMessage.message_excerpt,
+                                  target_model, db_session_maker):
+            pass
+        promoted = await promote_late_flags(target_model, db_session_maker)
+        if promoted:
+            _log.info(f"Moved {promoted} flags stored around a cutover to {target_model}")
+
+        if not await guilds_behind(target_model, db_session_maker):
+            _log.info(f"Re-embedding to {target_model} complete")
+            return
+        await asyncio.sleep(RESCAN_SECONDS)
+
+
+async def guilds_behind(target_model: str = EMBEDDING_MODEL, db_session_maker=async_session_maker) -> int:
+    """Number of guilds still scoring with a model other than `target_model`."""
+    async with db_session_maker() as session:
+        configured = (await session.execute(select(ServerConfiguration.embedding_model))).scalars().all()
+    return sum(1 for m in configured if active_model(m) != target_model)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import delete, func, insert, tuple_
+from sqlalchemy.future import select
+from bot.rules.rule_model import (
+    DailyFlagAggregate, FlaggedMessage, FlaggedMessageArchive, FlaggedMessageMember, FlaggedMessageVote,
+    FlaggedMessageVoteArchive,
+)
+from ..learning.db import async_session_maker
+
+_log = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.getenv("FLAG_RETENTION_DAYS", "180"))
+# "archive" moves old rows to the *_archive tables, "delete" keeps only the daily aggregates
+RETENTION_MODE = os.getenv("FLAG_RETENTION_MODE", "archive")
+BATCH_SIZE = 500  # rows per transaction, so no lock is held for long
+BATCH_PAUSE_SECONDS = 0.2
+RUN_INTERVAL_SECONDS = 24 * 3600
+HISTOGRAM_BINS = 20
+
+_ARCHIVED_FLAG_COLUMNS = (
+    "id", "server_id", "message_id", "rule_id", "author_id", "approved", "moderator_id", "similarity",
+    "created_at", "message_excerpt", "embedding_vector", "embedding_model", "member_count",
+)
+_ARCHIVED_VOTE_COLUMNS = ("id", "flagged_message_id", "moderator_id", "vote", "created_at")
+
+
+def _histogram(similarities: list[float]) -> list[int]:
+    return np.histogram(similarities, bins=HISTOGRAM_BINS, range=(0.0, 1.0))[0].tolist()
+
+
+def _add(current: list[int] | None, extra: list[int]) -> list[int]:
+    return extra if not current else [a + b for a, b in zip(current, extra)]
+
+
+async def retain_batch(cutoff: datetime, archive: bool = True, db_session_maker=async_session_maker) -> int:
+    """
+    Roll up to BATCH_SIZE flags created before `cutoff` into daily aggregates, then archive
+    (or just delete) them with their votes and members, all in one short transaction.
+    Returns the number of flags retained.
+    """
+    async with db_session_maker() as session:
+        async with session.begin():
+            # ids grow with time, so the oldest rows are found at the start of the primary key
+            flags = (await session.execute(
+                select(FlaggedMessage.id, FlaggedMessage.server_id, FlaggedMessage.created_at,
+                       FlaggedMessage.approved, FlaggedMessage.similarity, FlaggedMessage.member_count)
+                .where(FlaggedMessage.created_at < cutoff)
+                .order_by(FlaggedMessage.id.asc())
+                .limit(BATCH_SIZE)
+            )).all()
+            if not flags:
+                return 0
+            ids = [f.id for f in flags]
+            votes = dict((await session.execute(
+                select(FlaggedMessageVote.flagged_message_id, func.count(FlaggedMessageVote.id))
+                .where(FlaggedMessageVote.flagged_message_id.in_(ids))
+                .group_by(FlaggedMessageVote.flagged_message_id)
+            )).all())
+
+            days = defaultdict(lambda: {"flagged": 0, "approved": 0, "rejected": 0, "expired": 0, "members": 0,
+                                        "votes": 0, "approved_sims": [], "rejected_sims": []})
+            for f in flags:
+                day = days[(f.server_id, f.created_at.date())]
+                day["flagged"] += 1
+                day["members"] += (f.member_count or 1) - 1
+                day["votes"] += votes.get(f.id, 0)
+                outcome = "expired" if f.approved is None else "approved" if f.approved else "rejected"
+                day[outcome] += 1
+                if f.approved is not None and f.similarity is not None:
+                    day[f"{outcome}_sims"].append(float(f.similarity))
+
+            existing = {
+                (a.server_id, a.day): a for a in (await session.execute(
+                    select(DailyFlagAggregate).where(
+                        tuple_(DailyFlagAggregate.server_id, DailyFlagAggregate.day).in_(list(days))
+                    )
+                )).scalars()
+            }
+            for (server_id, day), counts in days.items():
+                aggregate = existing.get((server_id, day))
+                if aggregate is None:
+                    aggregate = DailyFlagAggregate(server_id=server_id, day=day, flagged=0, approved=0, rejected=0,
+                                                   expired=0, members=0, votes=0)
+                    session.add(aggregate)
+                for field in ("flagged", "approved", "rejected", "expired", "members", "votes"):
+                    setattr(aggregate, field, getattr(aggregate, field) + counts[field])
+                # JSON columns are reassigned, not mutated
+                aggregate.histogram_approved = _add(aggregate.histogram_approved, _histogram(counts["approved_sims"]))
+                aggregate.histogram_rejected = _add(aggregate.histogram_rejected, _histogram(counts["rejected_sims"]))
+            await session.flush()
+
+            if archive:
+                await session.execute(insert(FlaggedMessageArchive).from_select(
+                    _ARCHIVED_FLAG_COLUMNS,
+                    select(*(getattr(FlaggedMessage, c) for c in _ARCHIVED_FLAG_COLUMNS))
+                    .where(FlaggedMessage.id.in_(ids))
+                ))
+                await session.execute(insert(FlaggedMessageVoteArchive).from_select(
+                    _ARCHIVED_VOTE_COLUMNS,
+                    select(*(getattr(FlaggedMessageVote, c) for c in _ARCHIVED_VOTE_COLUMNS))
+                    .where(FlaggedMessageVote.flagged_message_id.in_(ids))
+                ))
+            await session.execute(delete(FlaggedMessageMember).where(FlaggedMessageMember.flagged_message_id.in_(ids)))
+            await session.execute(delete(FlaggedMessageVote).where(FlaggedMessageVote.flagged_message_id.in_(ids)))
+            await session.execute(delete(FlaggedMessage).where(FlaggedMessage.id.in_(ids)))
+    return len(ids)
+
+
+async def run_retention(retention_days: int = RETENTION_DAYS, mode: str = RETENTION_MODE,
+                        db_session_maker=async_session_maker) -> int:
+    """Retain everything older than `retention_days`, batch by batch. Returns the number of flags retained."""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    total = 0
+    while True:
+        retained = await retain_batch(cutoff, archive=mode != "delete", db_session_maker=db_session_maker)
+        total += retained
+        if retained < BATCH_SIZE:
+            break
+        await asyncio.sleep(BATCH_PAUSE_SECONDS)
+    if total:
+        _log.info(f"Retention: rolled up and {'archived' if mode != 'delete' else 'deleted'} {total} flags "
+                  f"older than {cutoff:%Y-%m-%d}")
+    return total
+
+
+async def run_retention_job(db_session_maker=async_session_maker) -> None:
+    """Run retention once at startup and then daily."""
+    while True:
+        try:
+            await run_retention(db_session_maker=db_session_maker)
+        except Exception:
+            _log.exception("Retention run failed")
+        await asyncio.sleep(RUN_INTERVAL_SECONDS)
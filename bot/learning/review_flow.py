@@ -1,13 +1,55 @@
+import asyncio
+import weakref
 import discord
+from sqlalchemy import func, update
 from sqlalchemy.future import select
-from ..rules.rule_model import Server, ModerationRule, FlaggedMessage, ServerConfiguration
+from sqlalchemy.orm import joinedload
+from ..rules.rule_model import Server, ModerationRule, FlaggedMessage, FlaggedMessageMember, ServerConfiguration
 from ..learning.db import async_session_maker
-from ..learning.feedback import record_system_feedback, update_server_threshold_from_feedback
+from ..learning.feedback import (
+    record_system_feedback, update_server_threshold_from_feedback, update_rule_thresholds_from_feedback
+)
+from ..learning.clustering import flag_clusters
+from ..learning.query_stats import tracked
+from ..learning.stats import bump_rule_stats, move_rule_stats
+from .. import metrics
+from ..moderation.rule_index import rule_index
+from ..moderation.trust import author_trust
 from discord.ui import Select
 import logging
 
 _log = logging.getLogger(__name__)
 MOD_REVIEW_CHANNEL_NAME = "mod-review"
+MEMBER_REFRESH_SECONDS = 5
+MEMBER_LINKS_SHOWN = 10
+MAX_SELECT_OPTIONS = 25  # Discord rejects a Select with more options
+
+# flagged_message_id -> open review view, so attached members can update the posted embed
+_open_reviews: dict[int, "FlagReviewButtons"] = {}
+# flagged_message_id -> lock serializing attachments, so each author is counted once per flag
+_member_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+
+async def _flag_authors(session, flagged_message_id: int, author_id: int | None) -> list[int]:
+    """Distinct authors a flag covers: the flagged message's and those of its attached members."""
+    member_authors = (await session.execute(
+        select(FlaggedMessageMember.author_id)
+        .where(FlaggedMessageMember.flagged_message_id == flagged_message_id)
+        .distinct()
+    )).scalars().all()
+    return list({a for a in [author_id, *member_authors] if a})
+
+
+async def _reassign_rule(session, flagged: FlaggedMessage, rule_id: int) -> None:
+    """Point a flag at another rule and move what the rollups counted for it there, on its creation day."""
+    if flagged.rule_id == rule_id:
+        return
+    counts = {"flagged": 1, "members": (flagged.member_count or 1) - 1}
+    if flagged.approved is not None:
+        counts["approved" if flagged.approved else "rejected"] = 1
+    await move_rule_stats(session, flagged.server_id, flagged.rule_id, rule_id,
+                          day=flagged.created_at and flagged.created_at.date(), **counts)
+    flagged.rule_id = rule_id
 
 
 def confidence_to_color(confidence: float | None, threshold: float) -> discord.Color:
@@ -31,13 +73,26 @@ def confidence_to_color(confidence: float | None, threshold: float) -> discord.C
 
 
 async def get_threshold_for_guild(guild_id: int) -> float:
+    # one joined select: touching a lazy relationship in an async session raises MissingGreenlet
     async with async_session_maker() as session:
-        server = (await session.execute(
-            select(Server).where(Server.discord_guild_id == int(guild_id))
-        )).scalars().first()
-        if server and server.configuration:
-            return float(server.configuration.similarity_threshold or 0.75)
-    return 0.75
+        threshold = (await session.execute(
+            select(ServerConfiguration.similarity_threshold)
+            .join(Server, ServerConfiguration.server_id == Server.id)
+            .where(Server.discord_guild_id == int(guild_id))
+        )).scalar_one_or_none()
+    return float(threshold or 0.75)
+
+
+def dropdown_rules(picked_rule: ModerationRule, rules: list[ModerationRule],
+                   scores: dict[int, float] | None = None) -> list[ModerationRule]:
+    """
+    Rules offered for correction: the flagged rule first, then the others by similarity to the message
+    (in their own order without scores), capped at what a Discord Select accepts.
+    """
+    others = [r for r in rules if r.id != picked_rule.id]
+    if scores:
+        others.sort(key=lambda r: scores.get(r.id, float("-inf")), reverse=True)
+    return [picked_rule, *others[:MAX_SELECT_OPTIONS - 1]]
 
 
 class RuleCorrectionSelect(Select):
@@ -61,7 +116,7 @@ class RuleCorrectionSelect(Select):
                 await interaction.response.send_message("Selected rule not found.", ephemeral=True)
                 return
 
-            flagged_msg.rule_id = new_rule_id
+            await _reassign_rule(session, flagged_msg, new_rule_id)
             await session.commit()
 
         # Update embed fields
@@ -81,10 +136,50 @@ class FlagReviewButtons(discord.ui.View):
         self.bot = bot
         self.message: discord.Message | None = None
         self.rule_select: RuleCorrectionSelect | None = None
+        self._member_refresh: asyncio.Task | None = None
 
     async def get_moderators(self, guild: discord.Guild):
         return [m for m in guild.members if any(r.permissions.moderate_members for r in m.roles)]
 
+    def schedule_member_refresh(self):
+        """Coalesce member attachments into at most one embed edit per MEMBER_REFRESH_SECONDS."""
+        if self._member_refresh is None or self._member_refresh.done():
+            self._member_refresh = self.bot.loop.create_task(self._refresh_members())
+
+    async def _refresh_members(self):
+        await asyncio.sleep(MEMBER_REFRESH_SECONDS)
+        if not self.message or not self.message.embeds:
+            return
+        async with self.db_session_maker() as session:
+            count, authors = (await session.execute(
+                select(func.count(FlaggedMessageMember.id), func.count(func.distinct(FlaggedMessageMember.author_id)))
+                .where(FlaggedMessageMember.flagged_message_id == self.flagged_message_id)
+            )).one()
+            recent = (await session.execute(
+                select(FlaggedMessageMember)
+                .where(FlaggedMessageMember.flagged_message_id == self.flagged_message_id)
+                .order_by(FlaggedMessageMember.id.desc())
+                .limit(MEMBER_LINKS_SHOWN)
+            )).scalars().all()
+
+        guild_id = self.message.guild.id
+        links = " ".join(
+            f"[{m.message_id}](https://discord.com/channels/{guild_id}/{m.channel_id}/{m.message_id})" for m in recent
+        )
+        value = f"{count} more message(s) from {authors} account(s) — one vote resolves all of them\n{links}"
+
+        embed = self.message.embeds[0]
+        for i, f in enumerate(embed.fields):
+            if f.name == "Cluster":
+                embed.set_field_at(i, name="Cluster", value=value[:1024], inline=False)
+                break
+        else:
+            embed.add_field(name="Cluster", value=value[:1024], inline=False)
+        try:
+            await self.message.edit(embed=embed)
+        except discord.HTTPException as e:
+            _log.warning(f"Could not update cluster members on review {self.flagged_message_id}: {e}")
+
     async def update_button_labels(self, session=None):
         from ..rules.rule_model import FlaggedMessageVote
         owns = session is None
@@ -100,6 +195,17 @@ class FlagReviewButtons(discord.ui.View):
         if owns:
             await session.__aexit__(None, None, None)
 
+    async def on_timeout(self):
+        _open_reviews.pop(self.flagged_message_id, None)
+        flag_clusters.close(self.flagged_message_id)
+        # the view also times out after a vote finalized it; only an unresolved flag is withdrawn from trust
+        async with self.db_session_maker() as session:
+            fm = await session.get(FlaggedMessage, self.flagged_message_id)
+            if fm is None or fm.approved is not None:
+                return
+            authors = await _flag_authors(session, fm.id, fm.author_id)
+        await author_trust.flag_expired(fm.server_id, authors, self.db_session_maker)
+
     @discord.ui.button(label="✅ Approve Flag", style=discord.ButtonStyle.green)
     async def approve(self, interaction: discord.Interaction, _):
         await self._record_vote_and_maybe_finalize(interaction, True)
@@ -108,6 +214,7 @@ class FlagReviewButtons(discord.ui.View):
     async def reject(self, interaction: discord.Interaction, _):
         await self._record_vote_and_maybe_finalize(interaction, False)
 
+    @tracked("vote")
     async def _record_vote_and_maybe_finalize(self, interaction: discord.Interaction, approve: bool):
         from ..rules.rule_model import FlaggedMessageVote, FlaggedMessage, Server
         # record vote
@@ -150,7 +257,8 @@ class FlagReviewButtons(discord.ui.View):
             majority = 0.75
             # optional: per-server majority from config
             server = (await session.execute(
-                select(Server).where(Server.discord_guild_id == int(guild.id))
+                select(Server).options(joinedload(Server.configuration))
+                .where(Server.discord_guild_id == int(guild.id))
             )).scalars().first()
             if server and server.configuration and server.configuration.majority_required:
                 majority = float(server.configuration.majority_required)
@@ -160,13 +268,21 @@ class FlagReviewButtons(discord.ui.View):
             elif reject_count / total >= majority:
                 await self._finalize(session, guild, approved=False)
 
+    @tracked("finalize")
     async def _finalize(self, session, guild: discord.Guild, approved: bool):
         from ..rules.rule_model import FlaggedMessage, ModerationRule, Server
         fm = await session.get(FlaggedMessage, self.flagged_message_id)
         if not fm:
             return
+        newly_resolved = fm.approved is None
+        if newly_resolved:
+            # keyed by the flag's creation day, like its flagged count and the 0005 seed
+            await bump_rule_stats(session, fm.server_id, fm.rule_id, day=fm.created_at and fm.created_at.date(),
+                                  **{"approved" if approved else "rejected": 1})
         fm.approved = approved
         await session.commit()
+        _open_reviews.pop(self.flagged_message_id, None)
+        flag_clusters.close(self.flagged_message_id)
 
         # load server + config
         server = (await session.execute(
@@ -181,6 +297,11 @@ class FlagReviewButtons(discord.ui.View):
             if cfg:
                 old_thr = cfg.similarity_threshold
 
+            # every author covered by this flag gets the outcome on their trust record, once
+            if newly_resolved:
+                authors = await _flag_authors(session, self.flagged_message_id, fm.author_id)
+                await author_trust.flag_resolved(server.id, authors, approved, self.db_session_maker)
+
         # trigger threshold update
         rule = await session.get(ModerationRule, fm.rule_id)
         if rule:
@@ -196,6 +317,8 @@ class FlagReviewButtons(discord.ui.View):
             approved=approved,
             similarity=fm.similarity
         )
+        if rule:
+            self.bot.loop.create_task(_learn_rule_thresholds(rule.server_id, guild.id))
 
         # disable controls and annotate embed
         for c in self.children:
@@ -239,33 +362,49 @@ async def post_review_message(
     moderator_id: int | None,
     similarity: float | None,
     db_session_maker,
-) -> None:
-    """Creates FlaggedMessage, builds embed+view, and sends to #mod-review."""
+    embedding: list[float] | None = None,
+    content: str | None = None,
+    embedding_model: str | None = None,
+    rule_scores: dict[int, float] | None = None,
+) -> int:
+    """
+    Creates FlaggedMessage, builds embed+view, and sends to #mod-review. Returns the FlaggedMessage id.
+    `content` overrides the text shown and stored (e.g. the joined fragments of a burst).
+    `rule_scores` (rule id -> similarity) orders the correction dropdown when there are too many rules.
+    """
+    content = message.content if content is None else content
     # insert DB record
-    async with db_session_maker() as session:
-        flagged = FlaggedMessage(
-            message_id=int(message.id),
-            rule_id=picked_rule.id,
-            approved=None,
-            moderator_id=int(moderator_id or 0),
-            similarity=similarity,
-            message_excerpt=message.content[:500]
-        )
-        session.add(flagged)
-        await session.commit()
-        await session.refresh(flagged)
+    with metrics.stage("db_persist"):
+        async with db_session_maker() as session:
+            flagged = FlaggedMessage(
+                message_id=int(message.id),
+                rule_id=picked_rule.id,
+                server_id=picked_rule.server_id,
+                author_id=int(message.author.id),
+                approved=None,
+                moderator_id=int(moderator_id or 0),
+                similarity=similarity,
+                message_excerpt=content[:500],
+                embedding_vector=embedding,
+                embedding_model=embedding_model if embedding is not None else None,
+            )
+            session.add(flagged)
+            await bump_rule_stats(session, picked_rule.server_id, picked_rule.id, flagged=1)
+            await session.commit()
+            await session.refresh(flagged)
+    await author_trust.flag_opened(picked_rule.server_id, [int(message.author.id)], db_session_maker)
 
     review_channel = discord.utils.get(guild.text_channels, name=MOD_REVIEW_CHANNEL_NAME)
     if not review_channel:
         _log.warning(f"No review channel named '{MOD_REVIEW_CHANNEL_NAME}' in {guild.name}.")
-        return
+        return flagged.id
 
     threshold = await get_threshold_for_guild(guild.id)
     color = confidence_to_color(similarity, threshold)
 
     embed = discord.Embed(
         title="🚩 Flagged Message" if moderator_id is None else "🚩 Flagged by Moderator",
-        description=message.content,
+        description=content,
         color=color
     )
     embed.add_field(name="Author", value=message.author.mention, inline=True)
@@ -282,11 +421,147 @@ async def post_review_message(
 
     # Build view
     view = FlagReviewButtons(flagged.id, db_session_maker, bot)
-    options = [discord.SelectOption(label=r.rule_text[:100], value=str(r.id)) for r in rules_for_dropdown]
+    options = [discord.SelectOption(label=r.rule_text[:100], value=str(r.id))
+               for r in dropdown_rules(picked_rule, rules_for_dropdown, rule_scores)]
     rule_select = RuleCorrectionSelect(flagged.id, db_session_maker, view, options)
     view.add_item(rule_select)
     view.rule_select = rule_select
 
-    sent = await review_channel.send(embed=embed, view=view)
+    with metrics.stage("discord_post"):
+        sent = await review_channel.send(embed=embed, view=view)
+    if moderator_id is None:
+        metrics.review_posted(message)
     view.message = sent
     await view.update_button_labels()
+    _open_reviews[flagged.id] = view
+    return flagged.id
+
+
+async def attach_member(
+    flagged_message_id: int,
+    message: discord.Message,
+    db_session_maker,
+    match_kind: str = "near_duplicate",
+    similarity: float | None = None,
+) -> None:
+    """Attach a message to an existing flag instead of opening a new review; the flag's vote covers it."""
+    author_id = int(message.author.id)
+    lock = _member_locks.setdefault(flagged_message_id, asyncio.Lock())
+    with metrics.stage("db_persist"):
+        async with lock, db_session_maker() as session:
+            server_id, rule_id, flag_author_id, created_at = (await session.execute(
+                select(FlaggedMessage.server_id, FlaggedMessage.rule_id, FlaggedMessage.author_id,
+                       FlaggedMessage.created_at)
+                .where(FlaggedMessage.id == flagged_message_id)
+            )).one()
+            # trust counts a flag once per author, however many of their messages it covers
+            new_author = author_id != flag_author_id and (await session.execute(
+                select(FlaggedMessageMember.id).where(FlaggedMessageMember.flagged_message_id == flagged_message_id,
+                                                      FlaggedMessageMember.author_id == author_id).limit(1)
+            )).first() is None
+            session.add(FlaggedMessageMember(
+                flagged_message_id=flagged_message_id,
+                message_id=int(message.id),
+                channel_id=int(message.channel.id),
+                author_id=author_id,
+                match_kind=match_kind,
+                similarity=similarity,
+            ))
+            await session.execute(
+                update(FlaggedMessage)
+                .where(FlaggedMessage.id == flagged_message_id)
+                .values(member_count=FlaggedMessage.member_count + 1)
+            )
+            await bump_rule_stats(session, server_id, rule_id, day=created_at and created_at.date(), members=1)
+            await session.commit()
+    if new_author:
+        await author_trust.flag_opened(server_id, [author_id], db_session_maker)
+
+    view = _open_reviews.get(flagged_message_id)
+    if view is not None:
+        view.schedule_member_refresh()
+
+
+async def _learn_rule_thresholds(server_id: int, guild_id: int) -> None:
+    if await update_rule_thresholds_from_feedback(server_id):
+        rule_index.invalidate(guild_id)
+
+
+def _upsert_field(embed: discord.Embed, name: str, value: str, inline: bool = False) -> None:
+    for i, f in enumerate(embed.fields):
+        if f.name == name:
+            embed.set_field_at(i, name=name, value=value, inline=inline)
+            return
+    embed.add_field(name=name, value=value, inline=inline)
+
+
+async def pending_flag_of(message_id: int, db_session_maker) -> tuple[int, bool] | None:
+    """
+    The pending flag covering a message, as (flag id, attached): attached is False for the flagged
+    message itself and True for a near-duplicate, cluster or burst member. None when no pending flag covers it.
+    """
+    async with db_session_maker() as session:
+        flagged_id = (await session.execute(
+            select(FlaggedMessage.id)
+            .where(FlaggedMessage.message_id == message_id, FlaggedMessage.approved.is_(None))
+            .order_by(FlaggedMessage.id.desc()).limit(1)
+        )).scalar()
+        if flagged_id is not None:
+            return flagged_id, False
+        flagged_id = (await session.execute(
+            select(FlaggedMessageMember.flagged_message_id)
+            .join(FlaggedMessage, FlaggedMessage.id == FlaggedMessageMember.flagged_message_id)
+            .where(FlaggedMessageMember.message_id == message_id, FlaggedMessage.approved.is_(None))
+            .order_by(FlaggedMessageMember.flagged_message_id.desc()).limit(1)
+        )).scalar()
+    return None if flagged_id is None else (flagged_id, True)
+
+
+async def update_pending_flag(
+    message: discord.Message,
+    rule: ModerationRule,
+    similarity: float,
+    embedding: list[float],
+    threshold: float,
+    db_session_maker,
+    embedding_model: str | None = None,
+) -> int | None:
+    """
+    Refresh a still-pending flag after its message was edited.
+    Returns the FlaggedMessage id, or None if the message has no pending flag.
+    """
+    async with db_session_maker() as session:
+        flagged = (await session.execute(
+            select(FlaggedMessage)
+            .where(FlaggedMessage.message_id == int(message.id), FlaggedMessage.approved.is_(None))
+            .order_by(FlaggedMessage.id.desc())
+        )).scalars().first()
+        if flagged is None:
+            return None
+
+        auto_flagged = not flagged.moderator_id
+        if auto_flagged:
+            await _reassign_rule(session, flagged, rule.id)
+        flagged.similarity = similarity
+        flagged.message_excerpt = message.content[:500]
+        flagged.embedding_vector = embedding
+        flagged.embedding_model = embedding_model
+        await session.commit()
+        flagged_id = flagged.id
+
+    view = _open_reviews.get(flagged_id)
+    if view is not None and view.message and view.message.embeds:
+        embed = view.message.embeds[0]
+        embed.description = message.content
+        embed.color = confidence_to_color(similarity, threshold)
+        if auto_flagged:
+            _upsert_field(embed, "Rule Matched", rule.rule_text)
+        _upsert_field(embed, "Confidence", f"{similarity:.2f}", inline=True)
+        _upsert_field(embed, "Edited", f"Rescored after edit: {similarity:.2f} (threshold {threshold:.2f})")
+        try:
+            await view.message.edit(embed=embed)
+        except discord.HTTPException as e:
+            _log.warning(f"Could not update review {flagged_id} after edit: {e}")
+
+    _log.info(f"Updated pending flag {flagged_id} after edit of message {message.id}: similarity={similarity:.3f}")
+    return flagged_id
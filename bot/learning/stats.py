@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.future import select
+from bot.rules.rule_model import ModerationRule, RuleDailyStats, ThresholdChange
+
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+THRESHOLD_HISTORY_SHOWN = 5
+TOP_RULES_SHOWN = 10
+
+
+async def bump_rule_stats(session, server_id: int, rule_id: int, day: date | None = None, **increments: int) -> None:
+    """
+    Atomically add `increments` (flagged / approved / rejected / members) to a rule's row for the day.
+    Callers pass the flag's creation day, so a flag's counts all land on one row; `day` defaults to today.
+    Runs in the caller's session, so the rollup commits together with the change it counts.
+    """
+    insert = UPSERTS[session.bind.dialect.name]
+    day = day or datetime.utcnow().date()
+    statement = insert(RuleDailyStats).values(server_id=server_id, rule_id=rule_id, day=day, **increments)
+    await session.execute(statement.on_conflict_do_update(
+        index_elements=["server_id", "rule_id", "day"],
+        set_={name: getattr(RuleDailyStats, name) + statement.excluded[name] for name in increments},
+    ))
+
+
+async def move_rule_stats(session, server_id: int, old_rule_id: int, new_rule_id: int, day: date | None = None,
+                          **counts: int) -> None:
+    """Move `counts` from one rule's row for the day to another's, e.g. when a flag is reassigned to another rule."""
+    await bump_rule_stats(session, server_id, old_rule_id, day, **{name: -count for name, count in counts.items()})
+    await bump_rule_stats(session, server_id, new_rule_id, day, **counts)
+
+
+def record_threshold_change(session, server_id: int, old: float | None, new: float | None, source: str,
+                            rule_id: int | None = None) -> None:
+    """Add a threshold history row (guild threshold when `rule_id` is None) to the caller's session."""
+    if old != new:
+        session.add(ThresholdChange(server_id=server_id, rule_id=rule_id, old_threshold=old, new_threshold=new,
+                                    source=source))
+
+
+@dataclass
+class ModStats:
+    days: int
+    flagged: int
+    approved: int
+    rejected: int
+    members: int
+    per_rule: list[tuple[str, int, int, int]]  # (rule text, flagged, approved, rejected), most flagged first
+    per_day: list[tuple[date, int]]
+    thresholds: list[ThresholdChange]
+
+    @property
+    def approval_rate(self) -> float | None:
+        resolved = self.approved + self.rejected
+        return self.approved / resolved if resolved else None
+
+
+async def load_mod_stats(server_id: int, days: int, db_session_maker) -> ModStats:
+    """Read only rollup rows: cost depends on `days` x rules, not on the size of the flag history."""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    async with db_session_maker() as session:
+        per_rule = (await session.execute(
+            select(ModerationRule.rule_text,
+                   func.sum(RuleDailyStats.flagged), func.sum(RuleDailyStats.approved),
+                   func.sum(RuleDailyStats.rejected), func.sum(RuleDailyStats.members))
+            .join(ModerationRule, RuleDailyStats.rule_id == ModerationRule.id)
+            .where(RuleDailyStats.server_id == server_id, RuleDailyStats.day >= since)
+            .group_by(ModerationRule.id, ModerationRule.rule_text)
+            .order_by(func.sum(RuleDailyStats.flagged).desc())
+        )).all()
+        per_day = (await session.execute(
+            select(RuleDailyStats.day, func.sum(RuleDailyStats.flagged))
+            .where(RuleDailyStats.server_id == server_id, RuleDailyStats.day >= since)
+            .group_by(RuleDailyStats.day)
+            .order_by(RuleDailyStats.day.asc())
+        )).all()
+        thresholds = (await session.execute(
+            select(ThresholdChange).where(ThresholdChange.server_id == server_id)
+            .order_by(ThresholdChange.id.desc()).limit(THRESHOLD_HISTORY_SHOWN)
+        )).scalars().all()
+
+    return ModStats(
+        days=days,
+        flagged=sum(r[1] for r in per_rule),
+        approved=sum(r[2] for r in per_rule),
+        rejected=sum(r[3] for r in per_rule),
+        members=sum(r[4] for r in per_rule),
+        per_rule=[(text, flagged, approved, rejected) for text, flagged, approved, rejected, _ in per_rule],
+        per_day=[(day, flagged) for day, flagged in per_day],
+        thresholds=list(thresholds),
+    )
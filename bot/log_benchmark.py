@@ -0,0 +1,89 @@
+"""
+Messages scored per second with logging off, with the old synchronous per-rule lines, and
+with the queued pipeline of bot/logs.py.
+
+    python -m bot.log_benchmark [--messages 20000] [--rules 50] [--output bench.log]
+
+Each event is one message scored against the guild's rules (the mat-vec of score_message)
+plus the log lines the bot writes for it. Output goes to --output (default: os.devnull, so
+the figures show formatting and handler cost; a file or a terminal adds the I/O itself).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import numpy as np
+from .logs import LogSampler, setup_logging, stop_logging, TEXT_FORMAT, DATE_FORMAT
+
+EMBEDDING_DIM = 384
+MODES = ("off", "sync per-rule", "queue", "queue + sampled debug")
+
+_log = logging.getLogger("bot.cogs.message_monitor")
+
+
+async def _score(matrix: np.ndarray, embedding: np.ndarray) -> tuple[np.ndarray, int]:
+    scores = matrix @ embedding
+    await asyncio.sleep(0)  # one loop iteration per message, as in on_message
+    return scores, int(scores.argmax())
+
+
+async def run(mode: str, messages: int, rules: int, output) -> float:
+    """Events per second for one mode."""
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((rules, EMBEDDING_DIM)).astype(np.float32)
+    embeddings = rng.standard_normal((256, EMBEDDING_DIM)).astype(np.float32)
+    rule_texts = [f"benchmark rule {i} about some behaviour that is not allowed here" for i in range(rules)]
+    text = "a message of ordinary length, long enough to be cut in the log line"
+    sampler = LogSampler()
+    threshold = 0.7
+
+    root = logging.getLogger()
+    sync_handler = None
+    if mode == "off":
+        root.setLevel(logging.WARNING)
+    elif mode == "sync per-rule":
+        sync_handler = logging.StreamHandler(output)
+        sync_handler.setFormatter(logging.Formatter(TEXT_FORMAT, DATE_FORMAT, style="{"))
+        root.addHandler(sync_handler)
+        root.setLevel(logging.INFO)
+    else:
+        setup_logging("DEBUG" if mode.endswith("debug") else "INFO", stream=output)
+
+    started = time.perf_counter()
+    try:
+        for i in range(messages):
+            scores, best = await _score(matrix, embeddings[i % len(embeddings)])
+            if mode == "sync per-rule":
+                # the lines on_message used to write: a print, then two INFO lines per rule
+                print(f"Threshold for guild 1: {threshold}", file=output)
+                _log.info(f"Using threshold: {threshold}")
+                for rule_text, similarity in zip(rule_texts, scores.tolist()):
+                    _log.info(f"Message: {text[:50]}...")
+                    _log.info(f"Similarity to rule '{rule_text[:30]}...': {similarity:.4f}")
+            elif _log.isEnabledFor(logging.DEBUG) and sampler.allow(i % 100):
+                _log.debug(f"Message {i}: rule {best} scored {float(scores[best]):.4f} against {threshold:.4f} "
+                           f"({rules} rules)", extra={"guild_id": i % 100, "message_id": i, "rule_id": best})
+        # measured on the loop only: the listener thread may still be writing what was queued
+        return messages / (time.perf_counter() - started)
+    finally:
+        if sync_handler is not None:
+            root.removeHandler(sync_handler)
+        stop_logging()
+
+
+async def _main(args: argparse.Namespace) -> None:
+    with open(args.output, "w") as output:
+        results = {mode: await run(mode, args.messages, args.rules, output) for mode in MODES}
+    baseline = results["off"]
+    print(f"{'logging':<24}{'events/s':>12}{'vs off':>9}")
+    for mode, rate in results.items():
+        print(f"{mode:<24}{rate:>12,.0f}{rate / baseline:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare message throughput with and without hot-path logging")
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--rules", type=int, default=50)
+    parser.add_argument("--output", default=os.devnull, help="Where log lines go")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,139 @@
+"""
+Logging that stays off the event loop: the root logger only enqueues records, and a
+QueueListener thread formats and writes them.
+
+    setup_logging()  # once, before the bot starts (replaces discord.utils.setup_logging)
+
+LOG_FORMAT=json writes one JSON object per line, including the record's `extra` fields.
+Per-message lines go through a LogSampler, so a busy guild cannot flood the log:
+
+    if _log.isEnabledFor(logging.DEBUG) and _sampler.allow(guild_id):
+        _log.debug(f"...", extra={"guild_id": guild_id})
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Sampled lines per key: LOG_SAMPLE_BURST at once, then LOG_SAMPLE_RATE per second
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+
+TEXT_FORMAT = "[{asctime}] [{levelname:<8}] {name}: {message}"  # discord.py's console format
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the loop: when the writer thread falls behind and the queue is full, records are dropped."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is resolved here, since args may be mutated later; formatting, including
+        # tracebacks, is left to the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """Token bucket per key (usually a guild id); lines over budget are counted in `suppressed`."""
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE, burst: int = LOG_SAMPLE_BURST, max_keys: int = 10_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.suppressed = 0
+        self._buckets: dict[object, list[float]] = {}  # key -> [tokens, last refill]
+
+    def allow(self, key=None) -> bool:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.clear()
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            self.suppressed += 1
+            return False
+        bucket[0] -= 1
+        return True
+
+
+_handler: DroppingQueueHandler | None = None
+_listener: QueueListener | None = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None) -> None:
+    """Route the root logger through the queue to one stream handler (stderr by default)."""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(stream)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT, DATE_FORMAT, style="{"))
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = DroppingQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush what is queued and detach the handler."""
+    global _handler, _listener
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.flush()
+    _handler = _listener = None
+
+
+def queue_depth() -> int:
+    return _handler.queue.qsize() if _handler is not None else 0
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
@@ -0,0 +1,152 @@
+"""
+Event-loop lag watchdog with attribution of what blocked it.
+
+A task on the loop sleeps INTERVAL and records how late it woke (the loop lag). A thread
+watches that heartbeat; once it is THRESHOLD late, the thread captures the loop thread's
+stack, i.e. whatever coroutine or callback is running instead of yielding. Stalls are
+aggregated by call site, the innermost frame in the bot's own code, and reported through
+modbot_event_loop_* metrics and rate-limited warnings.
+
+The cost is one timer per INTERVAL on the loop and one thread wake-up per INTERVAL; stacks
+are only captured during a stall. Work that holds the GIL for the whole stall (a C extension
+that does not release it) blocks the watchdog thread too and is reported without a stack.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from . import metrics
+from .logs import LogSampler
+
+_log = logging.getLogger(__name__)
+
+LOOP_WATCHDOG_INTERVAL = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "100")) / 1000  # 0 disables the watchdog
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000
+MAX_SITES = 200  # distinct call sites kept (and used as metric labels); later ones count as "other"
+UNATTRIBUTED = "unattributed"
+
+_PACKAGE_ROOT = Path(__file__).resolve().parent
+_REPO_ROOT = _PACKAGE_ROOT.parent
+
+
+@dataclass
+class SiteStats:
+    stalls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    stack: str = ""  # most recent stack captured at this site
+
+
+def call_site(stack: traceback.StackSummary) -> str:
+    """The innermost frame in the bot's code (the line that called into whatever blocked), else the innermost one."""
+    for frame in reversed(stack):
+        path = Path(frame.filename)
+        if path.is_relative_to(_PACKAGE_ROOT) and path.name != "loop_watchdog.py":
+            return f"{path.relative_to(_REPO_ROOT).as_posix()}:{frame.lineno} {frame.name}"
+    frame = stack[-1]
+    return f"{Path(frame.filename).name}:{frame.lineno} {frame.name}"
+
+
+def _task_frames(stack: traceback.StackSummary) -> traceback.StackSummary:
+    """Drop the frames of the loop itself, above the callback or coroutine step being run."""
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].name == "_run" and Path(stack[i].filename).match("asyncio/events.py"):
+            return traceback.StackSummary.from_list(stack[i + 1:])
+    return stack
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = LOOP_WATCHDOG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.sites: dict[str, SiteStats] = {}
+        self._sampler = LogSampler(rate=1 / 60, burst=3)  # per site
+        self._beat = time.monotonic()
+        self._seq = 0  # heartbeat number, so a captured stack is matched to the stall it belongs to
+        self._captured: tuple[int, traceback.StackSummary] | None = None
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start on the running loop's thread."""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._thread.join(timeout=1)
+        self._task = self._thread = None
+
+    async def _tick(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            captured = self._captured
+            stack = captured[1] if captured is not None and captured[0] == self._seq else None
+            self._seq += 1
+            self._beat = now
+            metrics.LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                self._record(lag, stack)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            seq = self._seq
+            late = time.monotonic() - self._beat - self.interval
+            if late < self.threshold or (self._captured is not None and self._captured[0] == seq):
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            try:
+                stack = traceback.extract_stack(frame)
+            finally:
+                del frame
+            self._captured = (seq, stack)
+
+    def _record(self, lag: float, stack: traceback.StackSummary | None) -> None:
+        site = call_site(stack) if stack else UNATTRIBUTED
+        if site not in self.sites and len(self.sites) >= MAX_SITES:
+            site = "other"
+        stats = self.sites.setdefault(site, SiteStats())
+        stats.stalls += 1
+        stats.seconds += lag
+        stats.max_seconds = max(stats.max_seconds, lag)
+        if stack:
+            stats.stack = "".join(_task_frames(stack).format())
+        metrics.LOOP_STALLS.labels(site).inc()
+        metrics.LOOP_STALL_SECONDS.labels(site).inc(lag)
+        if self._sampler.allow(site):
+            _log.warning(f"Event loop blocked for {lag * 1000:.0f} ms at {site} "
+                         f"({stats.stalls} stalls there so far)"
+                         + (f"\n{stats.stack}" if stack else ""),
+                         extra={"site": site, "lag_ms": round(lag * 1000)})
+
+    def report(self, limit: int = 10) -> list[tuple[str, SiteStats]]:
+        """Call sites that stalled the loop the longest in total."""
+        return sorted(self.sites.items(), key=lambda item: item[1].seconds, reverse=True)[:limit]
+
+
+loop_watchdog = LoopWatchdog()
@@ -0,0 +1,87 @@
+"""
+Prometheus metrics for the message -> review pipeline, served by the Metrics cog on
+http://METRICS_HOST:METRICS_PORT/metrics.
+
+Per-guild labels would grow without bound, so stages are labelled by guild tier (a member-count
+bucket). The tier is kept in a contextvar once the guild is known, so stages deep in the call
+chain (embedding, persistence, posting) label themselves without it being passed down.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import discord
+from prometheus_client import Counter, Gauge, Histogram
+
+# upper member-count bound -> tier
+GUILD_TIERS = ((100, "tiny"), (1_000, "small"), (10_000, "medium"), (100_000, "large"))
+LARGEST_TIER = "huge"
+
+STAGES = ("prefilter", "embedding_wait", "embedding_compute", "similarity", "db_persist", "discord_post")
+
+STAGE_SECONDS = Histogram(
+    "modbot_stage_seconds", "Latency of one pipeline stage for one message", ["stage", "tier"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+MESSAGE_TO_REVIEW_SECONDS = Histogram(
+    "modbot_message_to_review_seconds", "From message creation to its review being posted", ["tier"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0),
+)
+MESSAGES_SCORED = Counter("modbot_messages_scored_total", "Messages scored against the rules", ["tier"])
+MESSAGES_FLAGGED = Counter("modbot_messages_flagged_total", "Messages that opened or joined a review", ["tier"])
+MESSAGES_SKIPPED = Counter("modbot_messages_skipped_total", "Messages not scored, by reason", ["reason", "tier"])
+QUEUE_DEPTH = Gauge("modbot_queue_depth", "Work waiting in an in-process queue", ["queue"])
+CACHE_ENTRIES = Gauge("modbot_cache_entries", "Entries held by an in-process cache", ["cache"])
+LOOP_LAG_SECONDS = Histogram(
+    "modbot_event_loop_lag_seconds", "How late the event loop ran a timer callback",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_STALLS = Counter("modbot_event_loop_stalls_total", "Loop stalls over the threshold, by call site", ["site"])
+LOOP_STALL_SECONDS = Counter("modbot_event_loop_stall_seconds_total", "Time the loop was stalled, by call site",
+                             ["site"])
+
+_tier: ContextVar[str] = ContextVar("guild_tier", default="unknown")
+
+
+def guild_tier(guild: discord.Guild | None) -> str:
+    count = getattr(guild, "member_count", None)
+    if count is None:
+        return "unknown"
+    for bound, tier in GUILD_TIERS:
+        if count < bound:
+            return tier
+    return LARGEST_TIER
+
+
+def set_guild(guild: discord.Guild | None) -> str:
+    """Label everything measured from here on in this task with the guild's tier."""
+    tier = guild_tier(guild)
+    _tier.set(tier)
+    return tier
+
+
+def current_tier() -> str:
+    return _tier.get()
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage, _tier.get()).observe(seconds)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+def skipped(reason: str) -> None:
+    MESSAGES_SKIPPED.labels(reason, _tier.get()).inc()
+
+
+def review_posted(message: discord.Message) -> None:
+    """Message-to-review latency, the pipeline's end-to-end SLO."""
+    age = (datetime.now(timezone.utc) - message.created_at).total_seconds()
+    MESSAGE_TO_REVIEW_SECONDS.labels(_tier.get()).observe(max(age, 0.0))
@@ -0,0 +1,4 @@
+from .near_duplicate import NearDuplicateIndex, Verdict, simhash
+from .recent_messages import RecentMessageBuffer, recent_messages
+
+__all__ = ["NearDuplicateIndex", "Verdict", "simhash", "RecentMessageBuffer", "recent_messages"]
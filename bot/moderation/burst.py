@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+import discord
+
+SHORT_MESSAGE_CHARS = 120
+BURST_MAX_CHARS = 600
+BURST_MAX_MESSAGES = 8
+MAX_HOLD_FACTOR = 3  # a burst is never held longer than this many windows after its first message
+
+BurstKey = tuple[int, int, int]
+
+_log = logging.getLogger(__name__)
+
+
+@dataclass
+class _Burst:
+    messages: list[discord.Message] = field(default_factory=list)
+    chars: int = 0
+    first_at: float = 0.0
+    deadline: float = 0.0
+    task: asyncio.Task | None = None
+
+
+def burst_key(message: discord.Message) -> BurstKey:
+    return int(message.guild.id), int(message.channel.id), int(message.author.id)
+
+
+class BurstAggregator:
+    """
+    Buffers consecutive short messages per (guild, channel, author) so they can be scored as one text.
+    A burst flushes after `window` seconds without a new fragment, after MAX_HOLD_FACTOR windows in total,
+    or as soon as it reaches BURST_MAX_CHARS / BURST_MAX_MESSAGES.
+    """
+
+    def __init__(self, on_flush: Callable[[list[discord.Message]], Awaitable[None]]):
+        self.on_flush = on_flush
+        self._bursts: dict[BurstKey, _Burst] = {}
+
+    def size(self) -> int:
+        """Bursts waiting to be flushed."""
+        return len(self._bursts)
+
+    @staticmethod
+    def accepts(message: discord.Message) -> bool:
+        return 0 < len(message.content) <= SHORT_MESSAGE_CHARS
+
+    def add(self, message: discord.Message, window: float) -> None:
+        loop = asyncio.get_running_loop()
+        key = burst_key(message)
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst(first_at=loop.time())
+            burst.task = loop.create_task(self._flush_when_due(key))
+
+        burst.messages.append(message)
+        burst.chars += len(message.content)
+        burst.deadline = min(loop.time() + window, burst.first_at + MAX_HOLD_FACTOR * window)
+
+        if burst.chars >= BURST_MAX_CHARS or len(burst.messages) >= BURST_MAX_MESSAGES:
+            self.flush_soon(key)
+
+    def flush_soon(self, key: BurstKey) -> None:
+        burst = self._bursts.get(key)
+        if burst is not None:
+            burst.deadline = 0.0
+            if burst.task is not None:
+                burst.task.cancel()
+            burst.task = asyncio.get_running_loop().create_task(self._flush_when_due(key))
+
+    async def _flush_when_due(self, key: BurstKey) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            burst = self._bursts.get(key)
+            if burst is None:
+                return
+            delay = burst.deadline - loop.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        burst = self._bursts.pop(key)
+        try:
+            await self.on_flush(burst.messages)
+        except Exception:
+            # nothing awaits this task: log here or the error only shows up when the task is collected
+            _log.exception(f"Flushing a burst of {len(burst.messages)} message(s) in channel {key[1]} failed")
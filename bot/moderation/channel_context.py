@@ -0,0 +1,79 @@
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CONTEXT_HALF_LIFE_SECONDS = 120
+CONTEXT_WEIGHT = 0.35  # share of a context-aware rule's score that comes from the channel context
+MIN_CONTEXT_MASS = 0.5  # below this (decayed message count) there is no usable context
+IDLE_SECONDS = 10 * CONTEXT_HALF_LIFE_SECONDS
+MAX_CHANNELS = 4096
+
+
+class _Context:
+    __slots__ = ("vector", "mass", "updated_at")
+
+    def __init__(self, dim: int, now: float):
+        self.vector = np.zeros(dim, dtype=np.float32)
+        self.mass = 0.0
+        self.updated_at = now
+
+
+class ChannelContexts:
+    """
+    Rolling per-channel context: an exponentially time-decayed sum of recent message embeddings.
+    Each update is O(d); idle channels are evicted so memory stays bounded.
+    """
+
+    def __init__(self, half_life: float = CONTEXT_HALF_LIFE_SECONDS, max_channels: int = MAX_CHANNELS):
+        self.decay_rate = math.log(2) / half_life
+        self.max_channels = max_channels
+        self._channels: OrderedDict[int, _Context] = OrderedDict()
+
+    def size(self) -> int:
+        """Channels with a live context."""
+        return len(self._channels)
+
+    def _decayed(self, ctx: _Context, now: float) -> float:
+        return math.exp(-self.decay_rate * (now - ctx.updated_at))
+
+    def context(self, channel_id: int, now: float | None = None) -> np.ndarray | None:
+        """Normalized context vector of the channel so far, or None without enough recent messages."""
+        ctx = self._channels.get(channel_id)
+        if ctx is None or ctx.mass * self._decayed(ctx, time.monotonic() if now is None else now) < MIN_CONTEXT_MASS:
+            return None
+        norm = np.linalg.norm(ctx.vector)
+        return ctx.vector / norm if norm > 0 else None
+
+    def observe(self, channel_id: int, embedding: np.ndarray, now: float | None = None) -> np.ndarray | None:
+        """
+        Return the context preceding this message, then fold the message into it. `now` defaults to the
+        monotonic clock; a replay of history passes message timestamps instead.
+        """
+        now = time.monotonic() if now is None else now
+        prior = self.context(channel_id, now)
+
+        ctx = self._channels.get(channel_id)
+        if ctx is None or ctx.vector.shape[0] != embedding.shape[0]:
+            ctx = self._channels[channel_id] = _Context(embedding.shape[0], now)
+        else:
+            decay = self._decayed(ctx, now)
+            ctx.vector *= decay
+            ctx.mass *= decay
+        ctx.vector += embedding
+        ctx.mass += 1.0
+        ctx.updated_at = now
+        self._channels.move_to_end(channel_id)
+        self._evict(now)
+        return prior
+
+    def _evict(self, now: float) -> None:
+        while self._channels:
+            oldest_id, oldest = next(iter(self._channels.items()))
+            if len(self._channels) <= self.max_channels and now - oldest.updated_at < IDLE_SECONDS:
+                break
+            del self._channels[oldest_id]
+
+
+channel_contexts = ChannelContexts()
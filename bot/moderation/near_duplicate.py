@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+
+import numpy as np
+
+SHINGLE_SIZE = 4
+MIN_NORMALIZED_LENGTH = 12
+MAX_HAMMING_DISTANCE = 4
+WINDOW_SECONDS = 300
+WINDOW_CAPACITY = 512
+VERDICT_WAIT_SECONDS = 10.0
+
+_NON_WORD = re.compile(r"[\W_]+")
+_REPEATS = re.compile(r"(.)\1+")
+
+
+@dataclass
+class Verdict:
+    """Outcome of scoring a message, shared with its near-duplicates."""
+    rule_id: int | None
+    similarity: float
+    flagged_message_id: int | None = None
+
+
+@dataclass
+class WindowEntry:
+    message_id: int
+    signature: int
+    verdict: asyncio.Future = field(repr=False)
+
+
+def normalize_text(text: str) -> str:
+    """Casefold, drop punctuation/emoji and collapse repeated characters."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _NON_WORD.sub(" ", text).strip()
+    return _REPEATS.sub(r"\1", text)
+
+
+def simhash(text: str) -> int | None:
+    """
+    64-bit SimHash over character shingles of the normalized text.
+    Returns None for texts too short to give a stable signature.
+    """
+    norm = normalize_text(text)
+    if len(norm) < MIN_NORMALIZED_LENGTH:
+        return None
+
+    shingles = {norm[i:i + SHINGLE_SIZE] for i in range(len(norm) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0, dtype=np.int32) * 2 > len(shingles)
+    return int(np.packbits(majority, bitorder="little").view("<u8")[0])
+
+
+class _GuildWindow:
+    def __init__(self, capacity: int):
+        self.signatures = np.zeros(capacity, dtype=np.uint64)
+        self.timestamps = np.full(capacity, -np.inf, dtype=np.float64)
+        self.entries: list[WindowEntry | None] = [None] * capacity
+        self.cursor = 0
+
+
+class NearDuplicateIndex:
+    """
+    Per-guild sliding window of recently scored message signatures.
+    Lookups are a single vectorised XOR + popcount over the window.
+    """
+
+    def __init__(self, capacity: int = WINDOW_CAPACITY, window_seconds: float = WINDOW_SECONDS,
+                 max_distance: int = MAX_HAMMING_DISTANCE):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.max_distance = max_distance
+        self._guilds: dict[int, _GuildWindow] = {}
+
+    def size(self) -> int:
+        """Signatures held across all guild windows."""
+        return sum(sum(entry is not None for entry in window.entries) for window in self._guilds.values())
+
+    def find(self, guild_id: int, signature: int) -> WindowEntry | None:
+        window = self._guilds.get(guild_id)
+        if window is None:
+            return None
+
+        live = window.timestamps > time.monotonic() - self.window_seconds
+        if not live.any():
+            del self._guilds[guild_id]
+            return None
+
+        distances = np.bitwise_count(window.signatures ^ np.uint64(signature)).astype(np.int16)
+        distances[~live] = self.max_distance + 1
+        best = int(distances.argmin())
+        if distances[best] > self.max_distance:
+            return None
+        return window.entries[best]
+
+    def add(self, guild_id: int, message_id: int, signature: int) -> WindowEntry:
+        """Register a message before it is scored; resolve its verdict once known."""
+        window = self._guilds.get(guild_id)
+        if window is None:
+            window = self._guilds[guild_id] = _GuildWindow(self.capacity)
+
+        entry = WindowEntry(message_id, signature, asyncio.get_running_loop().create_future())
+        slot = window.cursor
+        window.signatures[slot] = signature
+        window.timestamps[slot] = time.monotonic()
+        window.entries[slot] = entry
+        window.cursor = (slot + 1) % self.capacity
+        return entry
+
+    @staticmethod
+    def resolve(entry: WindowEntry, verdict: Verdict | None) -> None:
+        """Publish the verdict (None when scoring did not complete)."""
+        if not entry.verdict.done():
+            entry.verdict.set_result(verdict)
+
+    @staticmethod
+    async def wait_verdict(entry: WindowEntry) -> Verdict | None:
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry.verdict), VERDICT_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            return None
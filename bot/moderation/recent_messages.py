@@ -0,0 +1,144 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import discord
+import numpy as np
+
+# float16 rows: 2048 x 384 dims is 1.5 MB per guild, plus ids and an excerpt (~0.3 MB) per message
+BUFFER_CAPACITY = int(os.getenv("RECENT_MESSAGE_CAPACITY", "2048"))
+MAX_GUILDS = 256
+INITIAL_SCORE_WIDTH = 16
+EXCERPT_CHARS = 80
+
+
+@dataclass
+class RecentMessage:
+    guild_id: int
+    message_id: int
+    channel_id: int
+    author_id: int
+    excerpt: str  # first EXCERPT_CHARS characters of the content
+    content_hash: int
+    embedding: np.ndarray
+    scores: np.ndarray
+    rule_ids: tuple[int, ...]
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild_id}/{self.channel_id}/{self.message_id}"
+
+    def best_rule(self) -> tuple[int, float] | None:
+        if not self.rule_ids:
+            return None
+        idx = int(self.scores.argmax())
+        return self.rule_ids[idx], float(self.scores[idx])
+
+
+class _GuildBuffer:
+    def __init__(self, capacity: int, dim: int, embedding_model: str | None):
+        self.embedding_model = embedding_model
+        self.message_ids = np.zeros(capacity, dtype=np.int64)
+        self.channel_ids = np.zeros(capacity, dtype=np.int64)
+        self.author_ids = np.zeros(capacity, dtype=np.int64)
+        self.content_hashes = np.zeros(capacity, dtype=np.uint64)
+        self.embeddings = np.zeros((capacity, dim), dtype=np.float16)
+        self.scores = np.zeros((capacity, INITIAL_SCORE_WIDTH), dtype=np.float32)
+        self.rule_ids: list[tuple[int, ...]] = [()] * capacity
+        self.excerpts: list[str] = [""] * capacity
+        self.slot_of: dict[int, int] = {}
+        self.cursor = 0
+        self.filled = 0
+
+    def ensure_score_width(self, width: int):
+        if width > self.scores.shape[1]:
+            grown = np.zeros((self.scores.shape[0], max(width, self.scores.shape[1] * 2)), dtype=np.float32)
+            grown[:, :self.scores.shape[1]] = self.scores
+            self.scores = grown
+
+
+class RecentMessageBuffer:
+    """
+    Bounded per-guild ring buffer of recently scored messages.
+    Embeddings and score vectors live in preallocated arrays, so a reaction or edit on a
+    recent message can reuse them instead of re-embedding it. Messages themselves are not
+    kept (they pin their author, embeds and attachments, outside discord.py's own cache
+    bound): only their ids and a short excerpt for /previewrule.
+    Embeddings are kept as float16 (unit vectors lose nothing that matters for a cosine
+    score), which also makes the whole window cheap enough to score candidate rules against.
+    Least recently written guilds are dropped once MAX_GUILDS buffers exist.
+    """
+
+    def __init__(self, capacity: int = BUFFER_CAPACITY, max_guilds: int = MAX_GUILDS):
+        self.capacity = capacity
+        self.max_guilds = max_guilds
+        self._guilds: OrderedDict[int, _GuildBuffer] = OrderedDict()
+
+    def size(self) -> int:
+        """Messages held across all guild buffers."""
+        return sum(buf.filled for buf in self._guilds.values())
+
+    def add(self, guild_id: int, message: discord.Message, content_hash: int,
+            embedding: np.ndarray, scores: np.ndarray, rule_ids: tuple[int, ...],
+            embedding_model: str | None = None) -> None:
+        buf = self._guilds.get(guild_id)
+        if buf is None or buf.embedding_model != embedding_model or buf.embeddings.shape[1] != embedding.shape[0]:
+            # Vectors of different models are not comparable: start a fresh window
+            buf = self._guilds[guild_id] = _GuildBuffer(self.capacity, embedding.shape[0], embedding_model)
+            while len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+        self._guilds.move_to_end(guild_id)
+
+        message_id = int(message.id)
+        slot = buf.slot_of.get(message_id)
+        if slot is None:
+            slot = buf.cursor
+            buf.cursor = (slot + 1) % self.capacity
+            if buf.filled == self.capacity:
+                buf.slot_of.pop(int(buf.message_ids[slot]), None)
+            else:
+                buf.filled += 1
+
+        buf.ensure_score_width(len(rule_ids))
+        buf.message_ids[slot] = message_id
+        buf.channel_ids[slot] = int(message.channel.id)
+        buf.author_ids[slot] = int(message.author.id)
+        buf.excerpts[slot] = message.content[:EXCERPT_CHARS]
+        buf.content_hashes[slot] = content_hash
+        buf.embeddings[slot] = embedding
+        buf.scores[slot, :len(rule_ids)] = scores
+        buf.rule_ids[slot] = rule_ids
+        buf.slot_of[message_id] = slot
+
+    def get(self, guild_id: int, message_id: int) -> RecentMessage | None:
+        buf = self._guilds.get(guild_id)
+        if buf is None:
+            return None
+        slot = buf.slot_of.get(int(message_id))
+        if slot is None:
+            return None
+        width = len(buf.rule_ids[slot])
+        return RecentMessage(
+            guild_id=guild_id,
+            message_id=int(message_id),
+            channel_id=int(buf.channel_ids[slot]),
+            author_id=int(buf.author_ids[slot]),
+            excerpt=buf.excerpts[slot],
+            content_hash=int(buf.content_hashes[slot]),
+            embedding=buf.embeddings[slot].astype(np.float32),
+            scores=buf.scores[slot, :width],
+            rule_ids=buf.rule_ids[slot],
+        )
+
+    def window(self, guild_id: int, embedding_model: str | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        All retained embeddings of a guild (float16, one row per message) and their message ids,
+        or an empty window if nothing was stored with `embedding_model`. `get` describes a row.
+        """
+        buf = self._guilds.get(guild_id)
+        if buf is None or buf.embedding_model != embedding_model:
+            return np.zeros((0, 0), dtype=np.float16), np.zeros(0, dtype=np.int64)
+        return buf.embeddings[:buf.filled], buf.message_ids[:buf.filled]
+
+
+recent_messages = RecentMessageBuffer()
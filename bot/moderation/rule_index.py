@@ -0,0 +1,158 @@
+import time
+
+import discord
+import numpy as np
+from sqlalchemy.future import select
+
+from ..learning.embedding import active_model
+from ..rules.rule_model import ModerationRule, ServerConfiguration
+from .channel_context import CONTEXT_WEIGHT
+from .scoring import build_rule_matrix
+
+CACHE_TTL_SECONDS = 600
+
+
+def _scope_channel(channel) -> tuple[int, int | None]:
+    """(channel id, category id) used for scoping; threads are scoped like their parent channel."""
+    if isinstance(channel, discord.Thread) and channel.parent is not None:
+        channel = channel.parent
+    return int(channel.id), getattr(channel, "category_id", None)
+
+
+def rule_applies(rule: ModerationRule, channel_id: int, category_id: int | None) -> bool:
+    """
+    Channel entries win over category entries, deny wins over allow at the same level.
+    A rule without an allow list applies everywhere that isn't denied.
+    """
+    allow = rule.channel_allow or []
+    deny = rule.channel_deny or []
+    if channel_id in deny:
+        return False
+    if channel_id in allow:
+        return True
+    if category_id is not None and category_id in deny:
+        return False
+    return not allow or (category_id is not None and category_id in allow)
+
+
+def active_rules_query(server_id: int):
+    """Served by ix_moderation_rules_server_active (see learning/query_plans.py)."""
+    return select(ModerationRule).where(
+        ModerationRule.server_id == server_id,
+        ModerationRule.active.is_(True)
+    ).order_by(ModerationRule.id.asc())
+
+
+class GuildRules:
+    """
+    Active rules of one guild, their normalized embedding matrix, per-channel row masks,
+    per-rule thresholds and the per-rule weight given to channel context. `embedding_model` is
+    loaded together with the vectors, so messages are always embedded with the model the matrix
+    was built from.
+    """
+
+    def __init__(self, server_id: int, rules: list[ModerationRule], guild: discord.Guild | None = None,
+                 embedding_model: str | None = None):
+        self.server_id = server_id
+        self.embedding_model = active_model(embedding_model)
+        self.rules = [r for r in rules if r.embedding_vector]
+        self.rule_ids = tuple(r.id for r in self.rules)
+        self.matrix = build_rule_matrix(self.rules) if self.rules else np.zeros((0, 0), dtype=np.float32)
+        self.loaded_at = time.monotonic()
+        self.scoped = any(r.channel_allow or r.channel_deny for r in self.rules)
+        self.context_weights = np.array([CONTEXT_WEIGHT if r.use_context else 0.0 for r in self.rules],
+                                        dtype=np.float32)
+        self.uses_context = bool(self.context_weights.any())
+        # NaN where a rule has no learned threshold of its own
+        self._learned_thresholds = np.array(
+            [np.nan if r.similarity_threshold is None else r.similarity_threshold for r in self.rules],
+            dtype=np.float32,
+        )
+        self._thresholds: tuple[float, np.ndarray] | None = None
+        self._all_rows = np.arange(len(self.rules))
+        self._masks: dict[int, np.ndarray] = {}
+        if guild is not None and self.scoped:
+            for channel in guild.channels:
+                if not isinstance(channel, discord.CategoryChannel):
+                    self.update_channel(channel)
+
+    def update_channel(self, channel) -> None:
+        channel_id, category_id = _scope_channel(channel)
+        self._masks[channel_id] = np.flatnonzero(
+            [rule_applies(r, channel_id, category_id) for r in self.rules]
+        )
+
+    def drop_channel(self, channel_id: int) -> None:
+        self._masks.pop(int(channel_id), None)
+
+    def thresholds(self, guild_threshold: float) -> np.ndarray:
+        """Threshold of every rule, with the guild threshold filled in where none was learned."""
+        if self._thresholds is None or self._thresholds[0] != guild_threshold:
+            filled = np.where(np.isnan(self._learned_thresholds), guild_threshold, self._learned_thresholds)
+            self._thresholds = (guild_threshold, filled.astype(np.float32))
+        return self._thresholds[1]
+
+    def rows_for(self, channel) -> np.ndarray:
+        """Indices into `rules`/`matrix` of the rules that apply in this channel."""
+        if not self.scoped:
+            return self._all_rows
+        channel_id, _ = _scope_channel(channel)
+        rows = self._masks.get(channel_id)
+        if rows is None:
+            self.update_channel(channel)
+            rows = self._masks[channel_id]
+        return rows
+
+
+class RuleIndexCache:
+    """
+    Per-guild GuildRules, loaded once and reused for every message.
+    Rule edits must call `invalidate`; channel events keep the masks current in place.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._guilds: dict[int, GuildRules] = {}
+
+    def size(self) -> int:
+        """Guilds with a loaded rule index."""
+        return len(self._guilds)
+
+    async def get(self, guild: discord.Guild, server_id: int, db_session_maker) -> GuildRules:
+        cached = self._guilds.get(guild.id)
+        if cached is not None and cached.server_id == server_id and time.monotonic() - cached.loaded_at < self.ttl:
+            return cached
+
+        async with db_session_maker() as session:
+            embedding_model = (await session.execute(
+                select(ServerConfiguration.embedding_model).where(ServerConfiguration.server_id == server_id)
+            )).scalar_one_or_none()
+            rules = (await session.execute(active_rules_query(server_id))).scalars().all()
+
+        # Rule rows carry their own model tag, which a cutover rewrites in the same statement as the vectors
+        if rules:
+            embedding_model = rules[0].embedding_model
+        index = self._guilds[guild.id] = GuildRules(server_id, list(rules), guild, embedding_model)
+        return index
+
+    def invalidate(self, guild_id: int) -> None:
+        self._guilds.pop(int(guild_id), None)
+
+    def channel_changed(self, channel) -> None:
+        index = self._guilds.get(channel.guild.id)
+        if index is None or not index.scoped:
+            return
+        if isinstance(channel, discord.CategoryChannel):
+            # Category scoping changes for every channel underneath it
+            for child in channel.channels:
+                index.update_channel(child)
+        else:
+            index.update_channel(channel)
+
+    def channel_deleted(self, channel) -> None:
+        index = self._guilds.get(channel.guild.id)
+        if index is not None:
+            index.drop_channel(channel.id)
+
+
+rule_index = RuleIndexCache()
@@ -0,0 +1,66 @@
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+
+from .near_duplicate import normalize_text
+
+
+def build_rule_matrix(rules) -> np.ndarray:
+    """Stack rule embeddings into a row-normalised (n_rules, dim) float32 matrix."""
+    matrix = np.asarray([r.embedding_vector for r in rules], dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def normalize_embedding(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def content_hash(text: str) -> int:
+    """64-bit hash of the normalized text; equal for edits that only change case, punctuation or emoji."""
+    return int.from_bytes(hashlib.blake2b(normalize_text(text).encode(), digest_size=8).digest(), "little")
+
+
+@dataclass
+class RuleScores:
+    """Scores of n messages against the rule rows that apply in their channel; per-message arrays have length n."""
+    scores: np.ndarray  # (n, rows), context blended
+    limits: np.ndarray  # threshold of each row
+    best: np.ndarray  # position in rows of the top score among the rules crossed, else of the top score
+    similarity: np.ndarray  # score of the best rule
+    crossed: np.ndarray  # the best rule is over its threshold
+    probability: np.ndarray | None  # classifier approval probability where crossed (NaN elsewhere), if gated
+    flagged: np.ndarray  # crossed, and not dropped by the classifier
+
+
+def score_rules(guild_rules, rows: np.ndarray, embeddings: np.ndarray, threshold: float,
+                contexts: list[np.ndarray | None] | None = None, head=None,
+                min_probability: float = 0.0) -> RuleScores:
+    """
+    The scoring shared by live moderation and backfill scans: rule similarities, the context blend of
+    context-aware rules, per-rule thresholds and the classifier gate. `embeddings` are normalized
+    (n, d); `contexts[i]` is the channel context preceding message i, or None.
+    """
+    matrix = guild_rules.matrix[rows]
+    scores = embeddings @ matrix.T
+    if contexts is not None and guild_rules.uses_context:
+        present = [i for i, context in enumerate(contexts) if context is not None]
+        if present:
+            context_scores = np.stack([contexts[i] for i in present]) @ matrix.T
+            scores[present] += guild_rules.context_weights[rows] * (context_scores - scores[present])
+
+    limits = guild_rules.thresholds(threshold)[rows]
+    over = scores > limits
+    best = np.where(over.any(axis=1), np.where(over, scores, -np.inf).argmax(axis=1), scores.argmax(axis=1))
+    index = np.arange(len(scores))
+    crossed = over[index, best]
+
+    probability = None
+    flagged = crossed
+    if head is not None:
+        probability = np.full(len(scores), np.nan, dtype=np.float32)
+        if crossed.any():
+            probability[crossed] = head.probabilities(embeddings[crossed])
+        flagged = crossed & (probability >= min_probability)
+    return RuleScores(scores, limits, best, scores[index, best], crossed, probability, flagged)
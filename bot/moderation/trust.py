@@ -0,0 +1,131 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import discord
+from sqlalchemy import case
+from sqlalchemy.future import select
+
+from ..learning.stats import UPSERTS
+from ..rules.rule_model import AuthorTrust
+
+ACCOUNT_AGE_FULL_DAYS = 180
+MEMBER_AGE_FULL_DAYS = 90
+TRUSTED_MIN_SCORE = 0.8
+MAX_CACHED_AUTHORS = 50_000
+
+
+@dataclass
+class TrustRecord:
+    flags_opened: int = 0
+    approved_flags: int = 0
+    rejected_flags: int = 0
+
+    @property
+    def previously_flagged(self) -> bool:
+        """Any confirmed violation, or a flag that is still waiting for a vote."""
+        return self.approved_flags > 0 or self.flags_opened > self.approved_flags + self.rejected_flags
+
+
+def age_score(member: discord.Member, now: datetime | None = None) -> float:
+    """0..1 from account and membership age; 1 once both are past their *_FULL_DAYS."""
+    if member.joined_at is None:
+        return 0.0
+    now = now or datetime.now(timezone.utc)
+    account_days = (now - member.created_at).total_seconds() / 86400
+    member_days = (now - member.joined_at).total_seconds() / 86400
+    return min(account_days / ACCOUNT_AGE_FULL_DAYS, 1.0) * min(member_days / MEMBER_AGE_FULL_DAYS, 1.0)
+
+
+def trust_score(record: TrustRecord, member: discord.Member) -> float:
+    if record.previously_flagged:
+        return 0.0
+    return age_score(member)
+
+
+def sample_keeps(guild_id: int, message_id: int, rate: float) -> bool:
+    """Deterministic Bernoulli(rate) keyed on the message, so a replay makes the same decision."""
+    digest = hashlib.blake2b(f"{guild_id}:{message_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2 ** 64 < rate
+
+
+class TrustTracker:
+    """
+    Per-guild author trust. Outcome counters are kept in author_trust and updated
+    incrementally when flags open and resolve; a bounded LRU keeps hot authors in memory.
+    """
+
+    def __init__(self, max_cached: int = MAX_CACHED_AUTHORS):
+        self.max_cached = max_cached
+        self._records: OrderedDict[tuple[int, int], TrustRecord] = OrderedDict()
+
+    def size(self) -> int:
+        """Authors held in the LRU."""
+        return len(self._records)
+
+    def _remember(self, key: tuple[int, int], record: TrustRecord) -> TrustRecord:
+        self._records[key] = record
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_cached:
+            self._records.popitem(last=False)
+        return record
+
+    async def get(self, server_id: int, author_id: int, db_session_maker) -> TrustRecord:
+        key = (server_id, author_id)
+        record = self._records.get(key)
+        if record is not None:
+            self._records.move_to_end(key)
+            return record
+
+        async with db_session_maker() as session:
+            row = (await session.execute(
+                select(AuthorTrust).where(AuthorTrust.server_id == server_id, AuthorTrust.author_id == author_id)
+            )).scalar_one_or_none()
+        if row is None:
+            return self._remember(key, TrustRecord())
+        return self._remember(key, TrustRecord(row.flags_opened, row.approved_flags, row.rejected_flags))
+
+    async def should_score(self, message: discord.Message, server_id: int, sample_rate: float,
+                           db_session_maker) -> bool:
+        """New and previously flagged authors are always scored; trusted authors are sampled at `sample_rate`."""
+        if sample_rate >= 1.0:
+            return True
+        member = message.author
+        if not isinstance(member, discord.Member) or age_score(member) < TRUSTED_MIN_SCORE:
+            return True
+        record = await self.get(server_id, int(member.id), db_session_maker)
+        if trust_score(record, member) < TRUSTED_MIN_SCORE:
+            return True
+        return sample_keeps(int(message.guild.id), int(message.id), sample_rate)
+
+    async def _bump(self, server_id: int, author_ids, db_session_maker, **deltas) -> None:
+        """Add `deltas` to each author's counters with one upsert per author, so concurrent flags never race."""
+        async with db_session_maker() as session:
+            insert = UPSERTS[session.bind.dialect.name]
+            for author_id in set(author_ids):
+                counters = {"flags_opened": 0, "approved_flags": 0, "rejected_flags": 0}
+                counters.update((column, max(delta, 0)) for column, delta in deltas.items())
+                statement = insert(AuthorTrust).values(server_id=server_id, author_id=author_id, **counters)
+                row = (await session.execute(statement.on_conflict_do_update(
+                    index_elements=["server_id", "author_id"],
+                    set_={column: case((getattr(AuthorTrust, column) + delta < 0, 0),
+                                       else_=getattr(AuthorTrust, column) + delta)
+                          for column, delta in deltas.items()},
+                ).returning(AuthorTrust.flags_opened, AuthorTrust.approved_flags, AuthorTrust.rejected_flags))).one()
+                self._remember((server_id, author_id), TrustRecord(*row))
+            await session.commit()
+
+    async def flag_opened(self, server_id: int, author_ids, db_session_maker) -> None:
+        await self._bump(server_id, author_ids, db_session_maker, flags_opened=1)
+
+    async def flag_resolved(self, server_id: int, author_ids, approved: bool, db_session_maker) -> None:
+        column = "approved_flags" if approved else "rejected_flags"
+        await self._bump(server_id, author_ids, db_session_maker, **{column: 1})
+
+    async def flag_expired(self, server_id: int, author_ids, db_session_maker) -> None:
+        """A review that timed out without a vote no longer counts as pending against its authors."""
+        await self._bump(server_id, author_ids, db_session_maker, flags_opened=-1)
+
+
+author_trust = TrustTracker()
@@ -1,8 +1,8 @@
 from sqlalchemy import (
-    Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Float, BigInteger
+    Column, Integer, String, Text, Boolean, Date, DateTime, ForeignKey, JSON, Float, BigInteger, LargeBinary
 )
 from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 from datetime import datetime
 
 Base = declarative_base()
@@ -29,6 +29,11 @@ class ServerConfiguration(Base):
     similarity_threshold = Column(Float, default=0.75)
     vote_duration_minutes = Column(Integer, default=1440)
     majority_required = Column(Float, default=0.75)
+    burst_window_ms = Column(Integer, default=0)  # 0 = burst aggregation off
+    trusted_sample_rate = Column(Float, default=1.0)  # share of trusted authors' messages scored; 1.0 = all
+    embedding_model = Column(String(100), nullable=True)  # model this guild scores with; None = legacy default
+    classifier_enabled = Column(Boolean, default=False)  # gate flags with the guild's learned classifier head
+    classifier_min_probability = Column(Float, default=0.2)  # flags the head rates below this are dropped
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -42,27 +47,52 @@ class ModerationRule(Base):
     server_id = Column(Integer, ForeignKey("servers.id"), nullable=False)
     rule_text = Column(Text, nullable=False)
     embedding_vector = Column(JSON, nullable=True)
+    embedding_model = Column(String(100), nullable=True)
+    # filled by the re-embedding job, swapped into embedding_vector at the guild's cutover
+    next_embedding_vector = Column(JSON, nullable=True)
+    next_embedding_model = Column(String(100), nullable=True)
     active = Column(Boolean, default=True)
+    channel_allow = Column(JSON, nullable=True)  # channel/category ids; empty = everywhere
+    channel_deny = Column(JSON, nullable=True)  # channel/category ids excluded from this rule
+    use_context = Column(Boolean, default=False)  # also score against the channel's recent conversation
+    similarity_threshold = Column(Float, nullable=True)  # learned from this rule's feedback; None = guild threshold
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     server = relationship("Server", back_populates="rules")
     flagged_messages = relationship("FlaggedMessage", back_populates="rule", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_moderation_rules_server_active", "server_id", "active"),
+    )
+
 
 class FlaggedMessage(Base):
     __tablename__ = "flagged_messages"
     id = Column(Integer, primary_key=True, autoincrement=True)
     message_id = Column(BigInteger, nullable=False, index=True)
     rule_id = Column(Integer, ForeignKey("moderation_rules.id"), nullable=False, index=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False)  # denormalised from the rule
+    author_id = Column(BigInteger, nullable=True)
     approved = Column(Boolean, nullable=True)  # None = pending
     moderator_id = Column(BigInteger, nullable=True)
     similarity = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     message_excerpt = Column(Text, nullable=True)
+    embedding_vector = Column(JSON, nullable=True)
+    embedding_model = Column(String(100), nullable=True)
+    next_embedding_vector = Column(JSON, nullable=True)
+    next_embedding_model = Column(String(100), nullable=True)
+    member_count = Column(Integer, nullable=False, default=1)  # this message + attached members
 
     # <- THIS must be named exactly "rule" to match back_populates="rule" above
     rule = relationship("ModerationRule", back_populates="flagged_messages")
+    members = relationship("FlaggedMessageMember", back_populates="flagged_message", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # feedback learner, backtest and classifier: one server's resolved flags
+        Index("ix_flagged_messages_server_approved_created", "server_id", "approved", "created_at"),
+    )
 
 
 class FlaggedMessageVote(Base):
@@ -76,3 +106,161 @@ class FlaggedMessageVote(Base):
     __table_args__ = (
         UniqueConstraint("flagged_message_id", "moderator_id", name="unique_vote_per_mod"),
     )
+
+
+class FlaggedMessageMember(Base):
+    __tablename__ = "flagged_message_members"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    flagged_message_id = Column(Integer, ForeignKey("flagged_messages.id"), nullable=False, index=True)
+    message_id = Column(BigInteger, nullable=False, index=True)  # edits look up the flag covering them
+    channel_id = Column(BigInteger, nullable=True)
+    author_id = Column(BigInteger, nullable=True)
+    match_kind = Column(String(16), nullable=False, default="near_duplicate")  # near_duplicate | semantic | burst
+    similarity = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    flagged_message = relationship("FlaggedMessage", back_populates="members")
+
+
+class AuthorTrust(Base):
+    __tablename__ = "author_trust"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False)
+    author_id = Column(BigInteger, nullable=False)
+    flags_opened = Column(Integer, nullable=False, default=0)
+    approved_flags = Column(Integer, nullable=False, default=0)
+    rejected_flags = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("server_id", "author_id", name="unique_trust_per_author"),
+    )
+
+
+class ReembedCheckpoint(Base):
+    __tablename__ = "reembed_checkpoints"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    target_model = Column(String(100), nullable=False)
+    table_name = Column(String(64), nullable=False)
+    last_id = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("target_model", "table_name", name="unique_checkpoint_per_table"),
+    )
+
+
+class BackfillCheckpoint(Base):
+    __tablename__ = "backfill_checkpoints"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False)
+    channel_id = Column(BigInteger, nullable=False)
+    since = Column(DateTime, nullable=False)  # scan lower bound
+    oldest_message_id = Column(BigInteger, nullable=True)  # position: history is walked newest -> oldest
+    scanned = Column(Integer, nullable=False, default=0)
+    flagged = Column(Integer, nullable=False, default=0)
+    finished = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("server_id", "channel_id", name="unique_backfill_per_channel"),
+    )
+
+
+class ClassifierHead(Base):
+    """One training round of a guild's linear head; the newest promoted row is served."""
+    __tablename__ = "classifier_heads"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    embedding_model = Column(String(100), nullable=False)
+    coef = Column(JSON, nullable=False)
+    intercept = Column(Float, nullable=False)
+    state = Column(LargeBinary, nullable=False)  # pickled estimator, resumed with partial_fit
+    trained_until_id = Column(Integer, nullable=False)  # flagged_messages watermark
+    samples = Column(Integer, nullable=False)
+    holdout_size = Column(Integer, nullable=False)
+    holdout_loss = Column(Float, nullable=True)
+    promoted = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("server_id", "version", name="unique_head_version"),
+    )
+
+
+class FlaggedMessageArchive(Base):
+    """Flags moved out of flagged_messages by the retention job; same ids, no foreign keys."""
+    __tablename__ = "flagged_messages_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    server_id = Column(Integer, nullable=False, index=True)
+    message_id = Column(BigInteger, nullable=False)
+    rule_id = Column(Integer, nullable=False)
+    author_id = Column(BigInteger, nullable=True)
+    approved = Column(Boolean, nullable=True)
+    moderator_id = Column(BigInteger, nullable=True)
+    similarity = Column(Float, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    message_excerpt = Column(Text, nullable=True)
+    embedding_vector = Column(JSON, nullable=True)
+    embedding_model = Column(String(100), nullable=True)
+    member_count = Column(Integer, nullable=False, default=1)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class FlaggedMessageVoteArchive(Base):
+    __tablename__ = "flagged_message_votes_archive"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    flagged_message_id = Column(Integer, nullable=False, index=True)
+    moderator_id = Column(BigInteger, nullable=False)
+    vote = Column(Boolean, nullable=False)
+    created_at = Column(DateTime, nullable=True)
+
+
+class DailyFlagAggregate(Base):
+    """Per-server daily summary of flags that aged out of flagged_messages."""
+    __tablename__ = "flag_daily_aggregates"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    flagged = Column(Integer, nullable=False, default=0)
+    approved = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    expired = Column(Integer, nullable=False, default=0)  # still pending when retained
+    members = Column(Integer, nullable=False, default=0)
+    votes = Column(Integer, nullable=False, default=0)
+    histogram_approved = Column(JSON, nullable=True)  # similarity counts in HISTOGRAM_BINS equal bins over [0, 1]
+    histogram_rejected = Column(JSON, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("server_id", "day", name="unique_aggregate_per_day"),
+    )
+
+
+class RuleDailyStats(Base):
+    """Incrementally maintained per-rule daily counts, read by /modstats."""
+    __tablename__ = "rule_daily_stats"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False)
+    rule_id = Column(Integer, ForeignKey("moderation_rules.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    flagged = Column(Integer, nullable=False, default=0)
+    approved = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    members = Column(Integer, nullable=False, default=0)  # messages attached to existing flags
+
+    __table_args__ = (
+        UniqueConstraint("server_id", "rule_id", "day", name="unique_rule_stats_per_day"),
+    )
+
+
+class ThresholdChange(Base):
+    __tablename__ = "threshold_history"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    server_id = Column(Integer, ForeignKey("servers.id"), nullable=False, index=True)
+    rule_id = Column(Integer, ForeignKey("moderation_rules.id"), nullable=True)  # None = guild threshold
+    old_threshold = Column(Float, nullable=True)
+    new_threshold = Column(Float, nullable=True)
+    source = Column(String(32), nullable=False)  # manual | feedback | rule_feedback
+    changed_at = Column(DateTime, default=datetime.utcnow)
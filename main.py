@@ -2,10 +2,10 @@ import os
 import argparse
 import asyncio
 from dotenv import load_dotenv
-import discord
 from bot.bot import AMABot
+from bot.logs import setup_logging
 
-from bot.learning.db import create_tables
+from bot.learning.db import upgrade_database
 from bot.learning import async_session_maker
 
 # pg_ctl -D "C:\Program Files\PostgreSQL\17\data" start
@@ -29,9 +29,9 @@ bot = AMABot(command_prefix=COMMAND_PREFIX,
 
 
 async def main(cogs_to_load):
-    discord.utils.setup_logging()
+    setup_logging()
     await bot.load_cogs(cogs_to_load)
-    await create_tables()
+    await upgrade_database()
     await bot.start(TOKEN)
     await bot.tree.sync()
 
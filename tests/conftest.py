@@ -0,0 +1,40 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# bot.learning.db builds its engines at import: point the primary and the replica at throwaway SQLite files
+# first. Nothing replicates between them; tests that read through the replica write its rows themselves
+_DB_DIR = tempfile.mkdtemp(prefix="modbot-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_DIR}/test.db"
+os.environ["DATABASE_READ_URL"] = f"sqlite+aiosqlite:///{_DB_DIR}/replica.db"
+
+from bot.learning.db import DATABASE_READ_URL, DATABASE_URL, dispose_engines, upgrade_database  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def database() -> str:
+    """The migrated test database, shared by the session."""
+    asyncio.run(upgrade_database(url=DATABASE_URL))
+    return DATABASE_URL
+
+
+@pytest.fixture(scope="session")
+def replica(database) -> str:
+    """The replica stand-in behind read_session_maker, migrated like the primary."""
+    asyncio.run(upgrade_database(url=DATABASE_READ_URL))
+    return DATABASE_READ_URL
+
+
+@pytest.fixture
+def run(database):
+    """Run a coroutine on a fresh event loop; pooled connections are disposed with it."""
+    def runner(coro):
+        async def wrapped():
+            try:
+                return await coro
+            finally:
+                await dispose_engines()
+        return asyncio.run(wrapped())
+    return runner
@@ -0,0 +1,36 @@
+import numpy as np
+
+from bot.learning.backtest import DEFAULT_BETA, THRESHOLDS, FeedbackHistory, backtest, sweep
+
+
+def _brute_force(scores, approved, weights, thresholds, beta=DEFAULT_BETA):
+    rows = []
+    positives = weights[approved].sum()
+    for threshold in thresholds:
+        raised = scores > threshold
+        tp, fp = weights[raised & approved].sum(), weights[raised & ~approved].sum()
+        precision = tp / (tp + fp) if tp + fp else 1.0
+        recall = tp / positives if positives else 0.0
+        b2 = beta * beta
+        f_beta = (1 + b2) * precision * recall / (b2 * precision + recall) if precision + recall else 0.0
+        rows.append((precision, recall, tp + fp, f_beta))
+    return tuple(np.array(column) for column in zip(*rows))
+
+
+def test_sweep_matches_a_threshold_by_threshold_loop():
+    rng = np.random.default_rng(0)
+    scores = np.round(rng.uniform(0.3, 0.95, 500), 3).astype(np.float32)  # ties with the swept thresholds too
+    approved = rng.uniform(size=500) < scores
+    weights = 1.0 + np.log(rng.integers(1, 5, 500))
+    for swept, expected in zip(sweep(scores, approved, weights), _brute_force(scores, approved, weights, THRESHOLDS)):
+        np.testing.assert_allclose(swept, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_backtest_recommends_the_best_f_beta_threshold():
+    scores = np.array([0.5, 0.6, 0.7, 0.8, 0.9], dtype=np.float32)
+    approved = np.array([False, False, True, True, True])
+    history = FeedbackHistory(scores, approved, np.ones(5), np.zeros(5, dtype=np.int64))
+    result = backtest(history)
+    assert 0.6 <= result.recommended < 0.7
+    assert result.at(result.recommended) == (1.0, 1.0, 3.0)
+    assert [percentile for percentile, *_ in result.policies] == [5, 10, 15, 20, 25, 30, 40, 50]
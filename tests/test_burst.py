@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import bot.cogs.message_monitor as message_monitor
+from bot.cogs.message_monitor import MessageMonitor
+from bot.learning.db import async_session_maker
+from bot.moderation.burst import BURST_MAX_MESSAGES, MAX_HOLD_FACTOR, BurstAggregator
+from bot.rules.rule_model import ModerationRule, Server, ServerConfiguration
+
+GUILD_ID = 323_456_789
+BURST_WINDOW_MS = 20
+
+
+def _message(message_id: int, content: str, author_id: int, guild: SimpleNamespace) -> SimpleNamespace:
+    return SimpleNamespace(id=message_id, content=content, guild=guild, channel=SimpleNamespace(id=9),
+                           author=SimpleNamespace(id=author_id, bot=False, mention=f"<@{author_id}>"))
+
+
+async def _burst_guild(guild_id: int) -> SimpleNamespace:
+    async with async_session_maker() as session:
+        server = Server(discord_guild_id=guild_id, name="bursts")
+        session.add(server)
+        await session.flush()
+        session.add(ServerConfiguration(server_id=server.id, similarity_threshold=0.7, burst_window_ms=BURST_WINDOW_MS))
+        session.add(ModerationRule(server_id=server.id, rule_text="no spam", embedding_vector=[1.0, 0.0]))
+        await session.commit()
+    # no #mod-review channel: the flag is stored without posting a review
+    return SimpleNamespace(id=guild_id, name="bursts", text_channels=[])
+
+
+@pytest.fixture
+def embedded(monkeypatch) -> list[str]:
+    texts = []
+
+    async def generate_embedding(text, model_name=None):
+        texts.append(text)
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(message_monitor, "generate_embedding", generate_embedding)
+    return texts
+
+
+def test_near_copy_of_a_buffered_fragment_reuses_the_burst_verdict(run, embedded):
+    async def scenario():
+        guild = await _burst_guild(GUILD_ID)
+        monitor = MessageMonitor(bot=None, db_session_maker=async_session_maker)
+        await monitor.process_message(_message(1, "free nitro on my server, join now!!", 7, guild))
+        entry = monitor.near_duplicates.find(GUILD_ID, message_monitor.simhash("free nitro on my server, join now!!"))
+        await asyncio.sleep(BURST_WINDOW_MS * 5 / 1000)
+        await monitor.process_message(_message(2, "free nitro on my server join now", 8, guild))
+        return entry.verdict.result(), monitor._burst_entries
+
+    verdict, burst_entries = run(scenario())
+    assert verdict is not None and verdict.flagged_message_id is not None
+    assert embedded == ["free nitro on my server, join now!!"]
+    assert burst_entries == {}
+
+
+def test_failed_flush_is_logged(run, caplog):
+    async def on_flush(messages):
+        raise RuntimeError("scoring failed")
+
+    async def scenario():
+        bursts = BurstAggregator(on_flush)
+        bursts.add(_message(1, "hi", 7, SimpleNamespace(id=GUILD_ID)), 0.01)
+        await asyncio.sleep(0.05)
+        return bursts.size()
+
+    with caplog.at_level(logging.ERROR, logger="bot.moderation.burst"):
+        assert run(scenario()) == 0
+    assert any(record.exc_info and "scoring failed" in str(record.exc_info[1]) for record in caplog.records)
+
+
+def _collector(flushed: list):
+    async def on_flush(messages):
+        flushed.append((asyncio.get_running_loop().time(), [m.id for m in messages]))
+    return on_flush
+
+
+def test_burst_flushes_at_the_message_cap(run):
+    async def scenario():
+        flushed = []
+        bursts = BurstAggregator(_collector(flushed))
+        guild = SimpleNamespace(id=GUILD_ID)
+        for message_id in range(BURST_MAX_MESSAGES + 1):
+            bursts.add(_message(message_id, "hey", 7, guild), window=10.0)
+            await asyncio.sleep(0)
+        return flushed, bursts.size()
+
+    flushed, waiting = run(scenario())
+    assert [ids for _, ids in flushed] == [list(range(BURST_MAX_MESSAGES))]
+    assert waiting == 1  # the next fragment started a new burst
+
+
+def test_burst_is_held_at_most_max_hold_windows(run):
+    window = 0.05
+
+    async def scenario():
+        flushed = []
+        bursts = BurstAggregator(_collector(flushed))
+        guild = SimpleNamespace(id=GUILD_ID)
+        started = asyncio.get_running_loop().time()
+        # a fragment every half window would keep extending a plain debounce forever
+        for message_id in range(2 * MAX_HOLD_FACTOR + 4):
+            bursts.add(_message(message_id, "hey", 7, guild), window)
+            await asyncio.sleep(window / 2)
+            if flushed:
+                break
+        return started, flushed
+
+    started, flushed = run(scenario())
+    held = flushed[0][0] - started
+    assert MAX_HOLD_FACTOR * window <= held < (MAX_HOLD_FACTOR + 1) * window
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+
+from bot.learning.db import async_session_maker
+from bot.learning.export import export
+from bot.learning.retention import run_retention
+from bot.rules.rule_model import FlaggedMessage, FlaggedMessageVote, ModerationRule, Server
+
+GUILD_ID = 133_456_789
+
+
+def _ids(out_dir, prefix: str, column: str) -> list[int]:
+    return sorted(i for path in out_dir.glob(f"{prefix}-*.parquet")
+                  for i in pq.read_table(path, columns=[column]).column(column).to_pylist())
+
+
+def test_full_export_includes_archived_history(run, tmp_path):
+    async def scenario():
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            server = Server(discord_guild_id=GUILD_ID, name="export")
+            session.add(server)
+            await session.flush()
+            rule = ModerationRule(server_id=server.id, rule_text="no spam", embedding_vector=[1.0, 0.0])
+            session.add(rule)
+            await session.flush()
+            flags = [FlaggedMessage(server_id=server.id, rule_id=rule.id, message_id=i, approved=True, similarity=0.8,
+                                    embedding_vector=[1.0, 0.0], created_at=now - timedelta(days=age))
+                     for i, age in enumerate((400, 300, 1))]
+            session.add_all(flags)
+            await session.flush()
+            session.add_all(FlaggedMessageVote(flagged_message_id=f.id, moderator_id=1, vote=True) for f in flags)
+            await session.commit()
+        await run_retention(retention_days=200)  # the two old flags move to the archive tables
+        await export(tmp_path, server.id, full=True, db_session_maker=async_session_maker)
+        return [f.id for f in flags]
+
+    ids = run(scenario())
+    assert _ids(tmp_path, "flagged_messages", "id") == ids[2:]
+    assert _ids(tmp_path, "flagged_messages_archive", "id") == ids[:2]
+    assert _ids(tmp_path, "flagged_message_votes", "flagged_message_id") == ids[2:]
+    assert _ids(tmp_path, "flagged_message_votes_archive", "flagged_message_id") == ids[:2]
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy.future import select
+
+import bot.cogs.message_monitor as message_monitor
+import bot.learning.review_flow as review_flow
+from bot.learning.db import async_session_maker
+from bot.moderation.trust import author_trust
+from bot.rules.rule_model import (
+    AuthorTrust, FlaggedMessage, FlaggedMessageMember, ModerationRule, RuleDailyStats, Server, ServerConfiguration
+)
+
+GUILD_ID = 623_456_789
+RAID_TEXT = "free nitro for everyone who joins my server today"
+
+
+class Bot:
+    """Just enough of commands.Bot for cog setup and the background tasks the review flow starts."""
+
+    @property
+    def loop(self):
+        return asyncio.get_running_loop()
+
+    async def add_cog(self, cog):
+        self.cog = cog
+
+
+def _guild() -> SimpleNamespace:
+    guild = SimpleNamespace(id=GUILD_ID, name="hot path", member_count=50)
+    posted = []
+
+    async def send(embed=None, view=None):
+        async def edit(**kwargs):
+            pass
+        posted.append(SimpleNamespace(guild=guild, embeds=[embed], edit=edit))
+        return posted[-1]
+
+    guild.text_channels = [SimpleNamespace(name=review_flow.MOD_REVIEW_CHANNEL_NAME, send=send)]
+    guild.posted = posted
+    return guild
+
+
+def _counted() -> tuple[float, float]:
+    """(flagged, skipped as near-duplicate) for the test guild's tier."""
+    return (REGISTRY.get_sample_value("modbot_messages_flagged_total", {"tier": "tiny"}) or 0.0,
+            REGISTRY.get_sample_value("modbot_messages_skipped_total",
+                                      {"reason": "near_duplicate", "tier": "tiny"}) or 0.0)
+
+
+def _message(message_id: int, author_id: int, guild: SimpleNamespace) -> SimpleNamespace:
+    author = SimpleNamespace(id=author_id, bot=False, mention=f"<@{author_id}>")
+    return SimpleNamespace(id=message_id, content=RAID_TEXT + "!" * (message_id % 3), guild=guild, author=author,
+                           channel=SimpleNamespace(id=11), created_at=datetime.now(timezone.utc))
+
+
+def _moderator_vote(guild: SimpleNamespace) -> SimpleNamespace:
+    async def edit_message(**kwargs):
+        pass
+
+    moderator = SimpleNamespace(id=1, roles=[SimpleNamespace(permissions=SimpleNamespace(moderate_members=True))])
+    guild.members = [moderator]
+    return SimpleNamespace(user=moderator, guild=guild, response=SimpleNamespace(edit_message=edit_message))
+
+
+async def _settle() -> None:
+    """Wait for the threshold, feedback and member-refresh tasks the review flow starts."""
+    while tasks := [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]:
+        await asyncio.gather(*tasks)
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    async def generate_embedding(text, model_name=None):
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(message_monitor, "generate_embedding", generate_embedding)
+    monkeypatch.setattr(review_flow, "MEMBER_REFRESH_SECONDS", 0)
+
+
+def test_flag_attach_vote_and_finalize_on_sqlite(run, embedded):
+    async def scenario():
+        async with async_session_maker() as session:
+            server = Server(discord_guild_id=GUILD_ID, name="hot path")
+            session.add(server)
+            await session.flush()
+            session.add(ServerConfiguration(server_id=server.id, similarity_threshold=0.7))
+            rule = ModerationRule(server_id=server.id, rule_text="no spam", embedding_vector=[1.0, 0.0])
+            session.add(rule)
+            await session.commit()
+
+        bot, guild = Bot(), _guild()
+        await message_monitor.setup(bot)
+        monitor = bot.cog
+        before = _counted()
+        await monitor.on_message(_message(1, 21, guild))  # scored, opens a review
+        await monitor.on_message(_message(2, 22, guild))  # near-duplicate, joins it
+        await _settle()
+        counted = tuple(after - b for after, b in zip(_counted(), before))
+
+        async with async_session_maker() as session:
+            flag = (await session.execute(
+                select(FlaggedMessage).where(FlaggedMessage.server_id == server.id)
+            )).scalars().one()
+        view = review_flow._open_reviews[flag.id]
+        await view._record_vote_and_maybe_finalize(_moderator_vote(guild), True)
+        await _settle()
+
+        async with async_session_maker() as session:
+            flag = await session.get(FlaggedMessage, flag.id)
+            members = (await session.execute(
+                select(FlaggedMessageMember.message_id).where(FlaggedMessageMember.flagged_message_id == flag.id)
+            )).scalars().all()
+            rollup = (await session.execute(
+                select(RuleDailyStats).where(RuleDailyStats.rule_id == rule.id)
+            )).scalars().one()
+            trust = (await session.execute(
+                select(AuthorTrust.author_id, AuthorTrust.flags_opened, AuthorTrust.approved_flags)
+                .where(AuthorTrust.server_id == server.id).order_by(AuthorTrust.author_id)
+            )).all()
+        return len(guild.posted), counted, flag, members, rollup, trust
+
+    posted, counted, flag, members, rollup, trust = run(scenario())
+    assert posted == 1 and counted == (2, 0)
+    assert flag.approved is True and flag.member_count == 2 and members == [2]
+    assert (rollup.flagged, rollup.approved, rollup.rejected, rollup.members) == (1, 1, 0, 1)
+    assert [tuple(row) for row in trust] == [(21, 1, 1), (22, 1, 1)]
+
+
+def test_trust_upsert_returns_and_clamps_counters(run):
+    async def scenario():
+        async with async_session_maker() as session:
+            server = Server(discord_guild_id=GUILD_ID + 1, name="trust")
+            session.add(server)
+            await session.commit()
+        await author_trust.flag_opened(server.id, [5, 5], async_session_maker)
+        await author_trust.flag_opened(server.id, [5], async_session_maker)
+        await author_trust.flag_resolved(server.id, [5], False, async_session_maker)
+        for _ in range(3):
+            await author_trust.flag_expired(server.id, [5], async_session_maker)
+        cached = author_trust._records[(server.id, 5)]
+        author_trust._records.clear()
+        return cached, await author_trust.get(server.id, 5, async_session_maker)
+
+    cached, stored = run(scenario())
+    assert cached == stored
+    assert (stored.flags_opened, stored.approved_flags, stored.rejected_flags) == (0, 0, 1)
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from bot.cogs.message_monitor import MessageMonitor
+from bot.learning.db import async_session_maker
+from bot.learning.review_flow import attach_member
+from bot.moderation.near_duplicate import Verdict, simhash
+from bot.rules.rule_model import FlaggedMessage, FlaggedMessageMember, ModerationRule, Server, ServerConfiguration
+
+GUILD_ID = 223_456_789
+CHANNEL_ID = 5
+RAID_TEXT = "join my server for free nitro giveaway right now"
+
+
+def _message(message_id: int, content: str, author_id: int = 7) -> SimpleNamespace:
+    return SimpleNamespace(id=message_id, content=content, guild=SimpleNamespace(id=GUILD_ID),
+                           channel=SimpleNamespace(id=CHANNEL_ID), author=SimpleNamespace(id=author_id, bot=False))
+
+
+async def _flag_with_member(guild_id: int, member_message: SimpleNamespace) -> int:
+    async with async_session_maker() as session:
+        server = Server(discord_guild_id=guild_id, name="edits")
+        session.add(server)
+        await session.flush()
+        session.add(ServerConfiguration(server_id=server.id, similarity_threshold=0.7))
+        rule = ModerationRule(server_id=server.id, rule_text="no spam", embedding_vector=[1.0, 0.0])
+        session.add(rule)
+        await session.flush()
+        flag = FlaggedMessage(server_id=server.id, rule_id=rule.id, message_id=member_message.id - 1, author_id=2,
+                              similarity=0.9)
+        session.add(flag)
+        await session.commit()
+    await attach_member(flag.id, member_message, async_session_maker, similarity=0.9)
+    return flag.id
+
+
+async def _members(flag_id: int) -> tuple[int, int]:
+    async with async_session_maker() as session:
+        rows = (await session.execute(
+            select(func.count(FlaggedMessageMember.id)).where(FlaggedMessageMember.flagged_message_id == flag_id)
+        )).scalar()
+        return rows, (await session.get(FlaggedMessage, flag_id)).member_count
+
+
+async def _edit(monitor: MessageMonitor, flag_id: int, original_id: int, edited: SimpleNamespace) -> list:
+    # the raid original is still in the near-duplicate window with its verdict
+    entry = monitor.near_duplicates.add(GUILD_ID, original_id, simhash(RAID_TEXT))
+    monitor.near_duplicates.resolve(entry, Verdict(rule_id=1, similarity=0.9, flagged_message_id=flag_id))
+    scored = []
+
+    async def score_message(message, guild_id, **kwargs):
+        scored.append(message.id)
+
+    monitor.score_message = score_message
+    await monitor.process_message(edited, edited=True)
+    return scored
+
+
+def test_edit_near_the_original_is_not_attached_again(run):
+    async def scenario():
+        member = _message(1001, RAID_TEXT + "!!")
+        flag_id = await _flag_with_member(GUILD_ID, member)
+        monitor = MessageMonitor(bot=None, db_session_maker=async_session_maker)
+        scored = await _edit(monitor, flag_id, 1000, _message(1001, RAID_TEXT + " :)"))
+        return scored, await _members(flag_id)
+
+    scored, members = run(scenario())
+    assert scored == []
+    assert members == (1, 2)
+
+
+def test_edit_away_from_the_original_opens_no_second_review(run):
+    async def scenario():
+        member = _message(2001, RAID_TEXT + "!!")
+        flag_id = await _flag_with_member(GUILD_ID + 1, member)
+        monitor = MessageMonitor(bot=None, db_session_maker=async_session_maker)
+        edited = _message(2001, "sorry, wrong channel, meant to ask about the patch notes")
+        edited.guild = SimpleNamespace(id=GUILD_ID + 1)
+        scored = await _edit(monitor, flag_id, 2000, edited)
+        return scored, await _members(flag_id)
+
+    scored, members = run(scenario())
+    assert scored == []
+    assert members == (1, 2)
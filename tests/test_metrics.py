@@ -0,0 +1,16 @@
+import logging
+import queue
+
+from bot import logs
+from bot.cogs.metrics import LogCollector
+
+
+def test_dropped_log_records_are_exported(monkeypatch):
+    handler = logs.DroppingQueueHandler(queue.Queue(1))
+    monkeypatch.setattr(logs, "_handler", handler)
+    for i in range(3):
+        handler.handle(logging.LogRecord("bot", logging.INFO, __file__, 1, f"line {i}", None, None))
+
+    (family,) = LogCollector().collect()
+    assert family.name == "modbot_log_records_dropped"
+    assert [sample.value for sample in family.samples if sample.name.endswith("_total")] == [2]
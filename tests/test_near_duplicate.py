@@ -0,0 +1,63 @@
+import asyncio
+
+from bot.moderation import near_duplicate
+from bot.moderation.near_duplicate import MAX_HAMMING_DISTANCE, NearDuplicateIndex, Verdict, simhash
+
+GUILD_ID = 823_456_789
+RAID_TEXT = "Free Nitro for everyone!!! Claim it at my server before it runs out"
+
+
+def _distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_tolerates_raid_variations_only():
+    original = simhash(RAID_TEXT)
+    assert simhash(RAID_TEXT.upper().replace("!!!", "!")) == original
+    assert _distance(simhash(RAID_TEXT + " 🎉🎉"), original) <= MAX_HAMMING_DISTANCE
+    assert _distance(simhash("Does anyone know when the next patch notes are due?"), original) > MAX_HAMMING_DISTANCE
+    assert simhash("hi there!") is None
+
+
+def test_near_duplicates_share_a_verdict_and_far_ones_do_not(run):
+    async def scenario():
+        index = NearDuplicateIndex()
+        entry = index.add(GUILD_ID, 1, simhash(RAID_TEXT))
+        index.resolve(entry, Verdict(rule_id=3, similarity=0.9, flagged_message_id=7))
+        near = index.find(GUILD_ID, simhash(RAID_TEXT.lower() + "!!"))
+        far = index.find(GUILD_ID, simhash("Does anyone know when the next patch notes are due?"))
+        other_guild = index.find(GUILD_ID + 1, simhash(RAID_TEXT))
+        return near, far, other_guild, await index.wait_verdict(near)
+
+    near, far, other_guild, verdict = run(scenario())
+    assert near.message_id == 1 and verdict.flagged_message_id == 7
+    assert far is None and other_guild is None
+
+
+def test_signatures_leave_the_window(run):
+    async def scenario():
+        index = NearDuplicateIndex(window_seconds=0.01)
+        index.add(GUILD_ID, 1, simhash(RAID_TEXT))
+        await asyncio.sleep(0.02)
+        return index.find(GUILD_ID, simhash(RAID_TEXT)), index.size()
+
+    assert run(scenario()) == (None, 0)
+
+
+def test_in_flight_verdict_is_awaited_and_timeouts_leave_it_pending(run, monkeypatch):
+    monkeypatch.setattr(near_duplicate, "VERDICT_WAIT_SECONDS", 0.05)
+
+    async def scenario():
+        index = NearDuplicateIndex()
+        entry = index.add(GUILD_ID, 1, simhash(RAID_TEXT))
+        timed_out = await index.wait_verdict(entry)  # the original is still being scored
+
+        waiter = asyncio.ensure_future(index.wait_verdict(entry))
+        await asyncio.sleep(0)
+        index.resolve(entry, Verdict(rule_id=None, similarity=0.2))
+        index.resolve(entry, Verdict(rule_id=3, similarity=0.9))  # only the first verdict counts
+        return timed_out, await waiter
+
+    timed_out, verdict = run(scenario())
+    assert timed_out is None
+    assert verdict == Verdict(rule_id=None, similarity=0.2)
@@ -0,0 +1,5 @@
+from bot.learning.query_plans import check_query_plans
+
+
+def test_hot_queries_use_their_indexes(run):
+    assert run(check_query_plans()) == {"feedback samples": True, "active rules": True}
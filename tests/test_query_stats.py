@@ -0,0 +1,78 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.future import select
+
+from bot.learning.db import async_session_maker
+from bot.learning.query_stats import N_PLUS_ONE_THRESHOLD, operation_totals, track_operation
+from bot.learning.review_flow import FlagReviewButtons
+from bot.rules.rule_model import FlaggedMessage, ModerationRule, Server, ServerConfiguration
+
+GUILD_ID = 123_456_789
+MODERATORS = 4
+# One vote short of a majority: upsert the vote (2), relabel the buttons (1), re-count for the majority (3)
+VOTE_STATEMENT_BUDGET = 6
+
+
+async def _seed_flag(guild_id: int) -> int:
+    async with async_session_maker() as session:
+        server = Server(discord_guild_id=guild_id, name="test")
+        session.add(server)
+        await session.flush()
+        session.add(ServerConfiguration(server_id=server.id, similarity_threshold=0.7))
+        rule = ModerationRule(server_id=server.id, rule_text="no spam", embedding_vector=[1.0, 0.0])
+        session.add(rule)
+        await session.flush()
+        flag = FlaggedMessage(server_id=server.id, rule_id=rule.id, message_id=1, author_id=2, similarity=0.8)
+        session.add(flag)
+        await session.commit()
+        return flag.id
+
+
+def _interaction(guild_id: int, user_id: int) -> SimpleNamespace:
+    async def edit_message(**kwargs):
+        pass
+
+    moderator_role = SimpleNamespace(permissions=SimpleNamespace(moderate_members=True))
+    members = [SimpleNamespace(id=i, roles=[moderator_role]) for i in range(MODERATORS)]
+    return SimpleNamespace(user=SimpleNamespace(id=user_id), guild=SimpleNamespace(id=guild_id, members=members),
+                           response=SimpleNamespace(edit_message=edit_message))
+
+
+# (moderator, approve) in order: a first vote, a second moderator's, and the first moderator changing theirs
+@pytest.mark.parametrize("votes", [[(1, True)], [(1, True), (2, False)], [(1, True), (2, False), (1, False)]])
+def test_vote_stays_within_statement_budget(run, votes):
+    guild_id = GUILD_ID + len(votes)
+
+    async def vote():
+        view = FlagReviewButtons(await _seed_flag(guild_id), async_session_maker, bot=None)
+        per_vote = []
+        for moderator, approve in votes:
+            with track_operation("vote") as stats:
+                await view._record_vote_and_maybe_finalize(_interaction(guild_id, moderator), approve)
+            per_vote.append(stats)
+        return per_vote
+
+    for stats in run(vote()):
+        assert stats.statements <= VOTE_STATEMENT_BUDGET
+        assert not stats.repeated()
+
+
+def test_repeated_statement_is_reported_as_n_plus_one(run, caplog):
+    async def lookups():
+        async with async_session_maker() as session:
+            with track_operation("n_plus_one_probe") as stats:
+                for server_id in range(N_PLUS_ONE_THRESHOLD + 1):
+                    await session.execute(select(Server.id).where(Server.id == server_id))
+                await session.execute(select(ModerationRule.id).limit(1))
+        return stats
+
+    with caplog.at_level(logging.WARNING, logger="bot.learning.query_stats"):
+        stats = run(lookups())
+    (statement, executions), = stats.repeated()
+    assert executions == N_PLUS_ONE_THRESHOLD + 1 and "FROM servers" in statement
+    assert stats.statements == N_PLUS_ONE_THRESHOLD + 2
+    totals = operation_totals["n_plus_one_probe"]
+    assert (totals.calls, totals.n_plus_one, totals.max_statements) == (1, 1, N_PLUS_ONE_THRESHOLD + 2)
+    assert any("Possible N+1 in n_plus_one_probe" in record.getMessage() for record in caplog.records)
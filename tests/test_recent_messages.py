@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from bot.moderation.recent_messages import EXCERPT_CHARS, RecentMessageBuffer
+
+GUILD_ID = 423_456_789
+
+
+def _message(message_id: int, content: str) -> SimpleNamespace:
+    return SimpleNamespace(id=message_id, content=content, channel=SimpleNamespace(id=5),
+                           author=SimpleNamespace(id=message_id * 10))
+
+
+def test_buffer_keeps_ids_and_an_excerpt_not_the_message():
+    buffer = RecentMessageBuffer(capacity=2)
+    for message_id in (1, 2, 3):
+        embedding = np.eye(4, dtype=np.float32)[message_id]
+        buffer.add(GUILD_ID, _message(message_id, "x" * 200), message_id, embedding, np.array([0.5]), (9,))
+
+    assert buffer.get(GUILD_ID, 1) is None
+    recent = buffer.get(GUILD_ID, 3)
+    assert (recent.channel_id, recent.author_id, recent.excerpt) == (5, 30, "x" * EXCERPT_CHARS)
+    assert recent.jump_url == f"https://discord.com/channels/{GUILD_ID}/5/3"
+    assert recent.best_rule() == (9, 0.5)
+
+    window, message_ids = buffer.window(GUILD_ID)
+    assert sorted(message_ids.tolist()) == [2, 3]
+    assert window.shape == (2, 4)
+    assert buffer.size() == 2
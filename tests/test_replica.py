@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from bot.cogs import modstats
+from bot.learning.backtest import load_history
+from bot.learning.db import async_session_maker, pool_stats, pool_status, read_session_maker
+from bot.learning.stats import bump_rule_stats, load_mod_stats
+from bot.rules.rule_model import FlaggedMessage, ModerationRule, Server
+
+# explicit ids, so "replicated" rows are the same on both databases
+SERVER_ID = RULE_ID = 900_001
+GUILD_ID = 523_456_789
+
+
+async def _seed(db_session_maker, flag_ids: list[int]) -> None:
+    async with db_session_maker() as session:
+        if await session.get(Server, SERVER_ID) is None:
+            session.add(Server(id=SERVER_ID, discord_guild_id=GUILD_ID, name="replica"))
+            session.add(ModerationRule(id=RULE_ID, server_id=SERVER_ID, rule_text="no spam", embedding_vector=[1.0]))
+            await session.flush()
+        for flag_id in flag_ids:
+            session.add(FlaggedMessage(id=flag_id, server_id=SERVER_ID, rule_id=RULE_ID, message_id=flag_id,
+                                       approved=True, similarity=0.8, created_at=datetime.utcnow()))
+            await bump_rule_stats(session, SERVER_ID, RULE_ID, flagged=1, approved=1)
+        await session.commit()
+
+
+def _checkouts() -> dict[str, int]:
+    return {name: stats.checkouts for name, stats in pool_stats.items()}
+
+
+def _delta(before: dict[str, int]) -> dict[str, int]:
+    return {name: count - before.get(name, 0) for name, count in _checkouts().items()}
+
+
+def test_reads_go_to_the_replica_and_writes_to_the_primary(run, replica):
+    class Bot:
+        async def add_cog(self, cog):
+            self.cog = cog
+
+    async def scenario():
+        # the replica has caught up to the first flag; the second is only on the primary so far
+        await _seed(read_session_maker, [900_001])
+        await _seed(async_session_maker, [900_001, 900_002])
+
+        before = _checkouts()
+        history = await load_history(SERVER_ID)
+        bot = Bot()
+        await modstats.setup(bot)
+        stats = await load_mod_stats(SERVER_ID, 1, bot.cog.db_session_maker)
+        reads = _delta(before)
+
+        before = _checkouts()
+        async with async_session_maker() as session:
+            await bump_rule_stats(session, SERVER_ID, RULE_ID, rejected=1)
+            await session.commit()
+        writes = _delta(before)
+        return history, stats, reads, writes
+
+    history, stats, reads, writes = run(scenario())
+    assert len(history.similarity) == 1 and stats.flagged == 1
+    assert reads["replica"] == 2 and reads.get("primary", 0) == 0
+    assert writes["primary"] == 1 and writes.get("replica", 0) == 0
+    assert set(pool_status()) == {"primary", "replica"}
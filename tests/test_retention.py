@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from bot.learning import retention
+from bot.learning.db import async_session_maker
+from bot.rules.rule_model import (
+    DailyFlagAggregate, FlaggedMessage, FlaggedMessageArchive, FlaggedMessageMember, FlaggedMessageVote,
+    FlaggedMessageVoteArchive, ModerationRule, Server,
+)
+
+GUILD_ID = 923_456_789
+OUTCOMES = (True, True, False, None, True)  # approved, approved, rejected, still pending
+
+
+async def _count(session, column, ids) -> int:
+    return (await session.execute(select(func.count()).where(column.in_(ids)))).scalar()
+
+
+def test_retention_archives_rows_and_keeps_aggregate_totals(run, monkeypatch):
+    monkeypatch.setattr(retention, "BATCH_SIZE", 2)
+    monkeypatch.setattr(retention, "BATCH_PAUSE_SECONDS", 0)
+
+    async def scenario():
+        created = datetime.utcnow() - timedelta(days=60)
+        async with async_session_maker() as session:
+            server = Server(discord_guild_id=GUILD_ID, name="retention")
+            session.add(server)
+            await session.flush()
+            rule = ModerationRule(server_id=server.id, rule_text="no spam", embedding_vector=[1.0])
+            session.add(rule)
+            await session.flush()
+            flags = [FlaggedMessage(server_id=server.id, rule_id=rule.id, message_id=i, approved=approved,
+                                    similarity=0.5 + i / 10, member_count=2, created_at=created)
+                     for i, approved in enumerate(OUTCOMES)]
+            session.add_all(flags)
+            await session.flush()
+            for flag in flags:
+                session.add(FlaggedMessageVote(flagged_message_id=flag.id, moderator_id=1, vote=bool(flag.approved)))
+                session.add(FlaggedMessageMember(flagged_message_id=flag.id, message_id=100 + flag.message_id))
+            await session.commit()
+        ids = [f.id for f in flags]
+
+        retained = await retention.run_retention(retention_days=30)
+        async with async_session_maker() as session:
+            left = await _count(session, FlaggedMessage.id, ids)
+            left += await _count(session, FlaggedMessageVote.flagged_message_id, ids)
+            left += await _count(session, FlaggedMessageMember.flagged_message_id, ids)
+            archived = (await session.execute(
+                select(FlaggedMessageArchive.id, FlaggedMessageArchive.approved, FlaggedMessageArchive.member_count)
+                .where(FlaggedMessageArchive.id.in_(ids)).order_by(FlaggedMessageArchive.id)
+            )).all()
+            archived_votes = await _count(session, FlaggedMessageVoteArchive.flagged_message_id, ids)
+            aggregate = (await session.execute(
+                select(DailyFlagAggregate).where(DailyFlagAggregate.server_id == server.id)
+            )).scalars().one()
+        return ids, retained, left, archived, archived_votes, aggregate, created
+
+    ids, retained, left, archived, archived_votes, aggregate, created = run(scenario())
+    assert retained >= len(OUTCOMES) and left == 0
+    assert [tuple(row) for row in archived] == [(i, a, 2) for i, a in zip(ids, OUTCOMES)]
+    assert archived_votes == len(OUTCOMES)
+    assert aggregate.day == created.date()
+    assert (aggregate.flagged, aggregate.approved, aggregate.rejected, aggregate.expired) == (5, 3, 1, 1)
+    assert (aggregate.members, aggregate.votes) == (5, 5)
+    assert sum(aggregate.histogram_approved) == 3 and sum(aggregate.histogram_rejected) == 1
@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import discord
+from sqlalchemy.future import select
+
+from bot.learning.db import async_session_maker
+from bot.learning.review_flow import RuleCorrectionSelect, update_pending_flag
+from bot.learning.stats import bump_rule_stats
+from bot.rules.rule_model import FlaggedMessage, ModerationRule, RuleDailyStats, Server
+
+GUILD_ID = 723_456_789
+
+
+async def _rollups(server_id: int) -> dict[int, tuple[int, int, int, int]]:
+    async with async_session_maker() as session:
+        rows = (await session.execute(
+            select(RuleDailyStats).where(RuleDailyStats.server_id == server_id)
+        )).scalars().all()
+    return {r.rule_id: (r.flagged, r.approved, r.rejected, r.members) for r in rows}
+
+
+def _interaction() -> SimpleNamespace:
+    async def noop(*args, **kwargs):
+        pass
+
+    return SimpleNamespace(message=SimpleNamespace(embeds=[discord.Embed()], edit=noop),
+                           response=SimpleNamespace(send_message=noop))
+
+
+def test_reassigned_flag_moves_its_rollup_counts(run):
+    async def scenario():
+        created = datetime.utcnow() - timedelta(days=3)
+        async with async_session_maker() as session:
+            server = Server(discord_guild_id=GUILD_ID, name="stats")
+            session.add(server)
+            await session.flush()
+            spam, ads = (ModerationRule(server_id=server.id, rule_text=text, embedding_vector=[1.0])
+                         for text in ("no spam", "no ads"))
+            session.add_all([spam, ads])
+            await session.flush()
+            flag = FlaggedMessage(server_id=server.id, rule_id=spam.id, message_id=42, similarity=0.8,
+                                  member_count=2, created_at=created)
+            session.add(flag)
+            await bump_rule_stats(session, server.id, spam.id, day=created.date(), flagged=1, members=1)
+            await session.commit()
+
+        # a moderator corrects the rule, then an edit rescoring the message points it back
+        select_menu = RuleCorrectionSelect(flag.id, async_session_maker, None,
+                                           [discord.SelectOption(label="no ads", value=str(ads.id))])
+        select_menu._values = [str(ads.id)]
+        await select_menu.callback(_interaction())
+        corrected = await _rollups(server.id)
+
+        message = SimpleNamespace(id=42, content="buy my stuff")
+        await update_pending_flag(message, spam, 0.9, [1.0], 0.7, async_session_maker)
+        return spam.id, ads.id, corrected, await _rollups(server.id)
+
+    spam, ads, corrected, rescored = run(scenario())
+    assert corrected == {spam: (0, 0, 0, 0), ads: (1, 0, 0, 1)}
+    assert rescored == {spam: (1, 0, 0, 1), ads: (0, 0, 0, 0)}
+
+
+def test_rule_stats_upsert_adds_to_the_day_row(run):
+    async def scenario():
+        async with async_session_maker() as session:
+            server = Server(discord_guild_id=GUILD_ID + 1, name="rollups")
+            session.add(server)
+            await session.flush()
+            rule = ModerationRule(server_id=server.id, rule_text="no spam", embedding_vector=[1.0])
+            session.add(rule)
+            await session.flush()
+            await bump_rule_stats(session, server.id, rule.id, flagged=1)
+            await bump_rule_stats(session, server.id, rule.id, flagged=1, members=2)
+            await bump_rule_stats(session, server.id, rule.id, approved=1)
+            await bump_rule_stats(session, server.id, rule.id, day=date(2026, 1, 1), rejected=1)
+            await session.commit()
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(RuleDailyStats).where(RuleDailyStats.server_id == server.id).order_by(RuleDailyStats.day)
+            )).scalars().all()
+        return [(r.day, r.flagged, r.approved, r.rejected, r.members) for r in rows]
+
+    today = datetime.utcnow().date()
+    assert run(scenario()) == [(date(2026, 1, 1), 0, 0, 1, 0), (today, 2, 1, 0, 2)]